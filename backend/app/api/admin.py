@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import asyncio
+import uuid
+
+from app.core.config import PROFILER_INTERVAL_SECONDS, PROFILER_MAX_SECONDS
+from app.core.security import is_admin_token
+from app.services.speculation import speculator
+from app.utils.profiler import try_start_session, finish_session, save_profile, profile_path
+
+# Folded stacks are plain text, one stack per line
+FOLDED_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reject requests without a valid admin token
+    """
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# Create router
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/profile")
+async def profile_window(
+    seconds: float = Query(10.0, gt=0),
+    interval: float = Query(PROFILER_INTERVAL_SECONDS, gt=0, le=1)
+):
+    """
+    Sample all threads for a time window and return folded stacks
+    (flamegraph.pl / speedscope compatible)
+    """
+    if seconds > PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Maximum profiling window is {PROFILER_MAX_SECONDS} seconds")
+    
+    profiler = try_start_session(interval)
+    if profiler is None:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        finish_session(profiler)
+    
+    profile_id = uuid.uuid4().hex
+    save_profile(profile_id, profiler)
+    return PlainTextResponse(
+        profiler.folded(),
+        media_type=FOLDED_MEDIA_TYPE,
+        headers={"X-Profile-Id": profile_id, "X-Profile-Samples": str(profiler.sample_count)}
+    )
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    Get a saved profile in folded stack format
+    """
+    path = profile_path(profile_id)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return PlainTextResponse(path.read_text(), media_type=FOLDED_MEDIA_TYPE)
+
+@router.post("/speculation/cancel")
+async def cancel_speculation(file_id: Optional[str] = None):
+    """
+    Cancel queued speculative detections (e.g. to shed load)
+    """
+    return {"cancelled": speculator.cancel(file_id)}
@@ -1,23 +1,45 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse, FileResponse
-from typing import List, Optional, Dict
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Optional
+from datetime import datetime
+import asyncio
 import os
 import uuid
 import shutil
-import json
-from pathlib import Path
 
-from app.core.config import UPLOADS_DIR, PROCESSED_DIR
-from app.models.schemas import UploadResponse, DetectionResult, DiagnosticReport, MultipleUploadResponse
-from app.services.dicom_service import convert_dicom_to_png
-from app.services.roboflow_service import call_roboflow_api
-from app.services.openai_service import generate_diagnostic_report
+from app.models.schemas import (
+    UploadResponse, DetectionResult, DiagnosticReport, MultipleUploadResponse, ArchiveIngestResponse
+)
+from app.services.archive_ingest import ingest_archive, StreamBridge, ArchiveError
+from app.services.dicom_service import convert_dicom_to_png, ensure_png
+from app.services.dicom_validation import validate_dicom, DicomValidationError
+from app.services.storage_manager import storage_manager
+from app.services.storage_backend import get_storage, upload_key, processed_key
+from app.services.artifact_cache import artifact_cache, PNG
+from app.core.config import (
+    ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP, PHASH_SIMILARITY_THRESHOLD, FINDINGS_QUERY_MAX_LIMIT, CROP_PADDING, CROP_SIZE
+)
+from app.services.detection_service import detect, load_detection_results, apply_thresholds, find_near_duplicates
+from app.services.similarity_index import similarity_index
+from app.services.findings_index import findings_index, SORT_COLUMNS
+from app.services.render_service import render, render_crop, prerender_presets, NotRenderableError, PRESETS, DEFAULT_PRESET
+from app.services.report_service import get_or_generate_report
+from app.services.speculation import speculator
+from app.services.scheduler import set_priority, get_scheduler_stats, BATCH
+from app.services.warmup import readiness
+from app.utils.admission import admission_controller
+from app.utils.metrics import observe_stage
+from app.utils.logger import get_logger
+
+# Create logger
+logger = get_logger(__name__)
 
 # Create router
 router = APIRouter()
 
 @router.post("/upload/", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Upload and process a single DICOM file (.dcm or .rvg)
     """
@@ -25,19 +47,33 @@ async def upload_file(file: UploadFile = File(...)):
     if not (file.filename.endswith(".dcm") or file.filename.endswith(".rvg")):
         raise HTTPException(status_code=400, detail="Only DICOM files (.dcm or .rvg) are supported")
     
+    # Reject files that cannot be decoded before storing or converting them
+    try:
+        validate_dicom(file.file)
+    except DicomValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid DICOM file: {str(e)}")
+    
     # Generate a unique filename
     unique_id = str(uuid.uuid4())
     file_extension = os.path.splitext(file.filename)[1]
     unique_filename = f"{unique_id}{file_extension}"
-    file_path = UPLOADS_DIR / unique_filename
+    storage = get_storage()
+    file_key = upload_key(unique_filename)
+    file_path = storage.local_path(file_key)
     
     # Save the uploaded file
-    with open(file_path, "wb") as buffer:
+    with open(file_path, "wb") as buffer, observe_stage("upload_write"):
         shutil.copyfileobj(file.file, buffer)
+    storage.publish(file_key)
     
     try:
-        # Convert DICOM to PNG
-        png_path = convert_dicom_to_png(str(file_path), unique_id)
+        # Convert DICOM to PNG (off the event loop; waits for a conversion slot)
+        png_path = await run_in_threadpool(convert_dicom_to_png, str(file_path), unique_id)
+        
+        # Start detection ahead of time if speculative mode is enabled
+        background_tasks.add_task(speculator.submit, unique_id, png_path)
+        # Cache the window/level presets for the viewer
+        background_tasks.add_task(prerender_presets, unique_id)
         
         return UploadResponse(
             message="File uploaded and converted successfully",
@@ -46,20 +82,23 @@ async def upload_file(file: UploadFile = File(...)):
         )
     except Exception as e:
         # If there's an error, clean up the uploaded file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        storage.delete(file_key)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload-multiple/", response_model=MultipleUploadResponse)
-async def upload_multiple_files(files: List[UploadFile] = File(...)):
+async def upload_multiple_files(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
     """
     Upload and process multiple DICOM files (.dcm or .rvg)
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     
+    # Multi-file uploads yield to single-image requests
+    set_priority(BATCH)
+    
     successful_uploads = []
     errors = []
+    storage = get_storage()
     
     for file in files:
         # Check if file extension is valid
@@ -67,19 +106,30 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
             errors.append(f"{file.filename}: Only DICOM files (.dcm or .rvg) are supported")
             continue
         
+        # Reject files that cannot be decoded before storing or converting them
+        try:
+            validate_dicom(file.file)
+        except DicomValidationError as e:
+            errors.append(f"{file.filename}: Invalid DICOM file: {str(e)}")
+            continue
+        
         # Generate a unique filename
         unique_id = str(uuid.uuid4())
         file_extension = os.path.splitext(file.filename)[1]
         unique_filename = f"{unique_id}{file_extension}"
-        file_path = UPLOADS_DIR / unique_filename
+        file_key = upload_key(unique_filename)
+        file_path = storage.local_path(file_key)
         
         try:
             # Save the uploaded file
-            with open(file_path, "wb") as buffer:
+            with open(file_path, "wb") as buffer, observe_stage("upload_write"):
                 shutil.copyfileobj(file.file, buffer)
+            storage.publish(file_key)
             
             # Convert DICOM to PNG
-            png_path = convert_dicom_to_png(str(file_path), unique_id)
+            png_path = await run_in_threadpool(convert_dicom_to_png, str(file_path), unique_id)
+            background_tasks.add_task(speculator.submit, unique_id, png_path)
+            background_tasks.add_task(prerender_presets, unique_id)
             
             successful_uploads.append({
                 "original_filename": file.filename,
@@ -89,8 +139,7 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
             
         except Exception as e:
             # If there's an error, clean up the uploaded file
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            storage.delete(file_key)
             errors.append(f"{file.filename}: {str(e)}")
     
     if not successful_uploads and errors:
@@ -102,75 +151,197 @@ async def upload_multiple_files(files: List[UploadFile] = File(...)):
         count=len(successful_uploads)
     )
 
+@router.post("/upload-archive/", response_model=ArchiveIngestResponse)
+async def upload_archive(request: Request, background_tasks: BackgroundTasks):
+    """
+    Ingest a ZIP or TAR(.gz) archive sent as the raw request body. Entries
+    are extracted and converted while the archive streams in; non-DICOM
+    entries (DICOMDIR, reports, folders) are skipped.
+    """
+    loop = asyncio.get_running_loop()
+    bridge = StreamBridge()
+    ingest = loop.run_in_executor(None, ingest_archive, bridge)
+    
+    try:
+        async for chunk in request.stream():
+            if ingest.done():
+                # Extraction stopped early; no need to read the rest
+                break
+            if chunk:
+                await loop.run_in_executor(None, bridge.feed, chunk)
+    finally:
+        await loop.run_in_executor(None, bridge.finish)
+    
+    try:
+        result = await ingest
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not result["files"] and result["errors"]:
+        raise HTTPException(status_code=400, detail={"message": "Archive ingest failed", "errors": result["errors"]})
+    
+    for uploaded in result["files"]:
+        background_tasks.add_task(speculator.submit, uploaded["file_id"], uploaded["converted_image_path"])
+        background_tasks.add_task(prerender_presets, uploaded["file_id"])
+    
+    return ArchiveIngestResponse(
+        message="Archive processed successfully" if not result["errors"] else "Archive processed with errors",
+        files=result["files"],
+        skipped=result["skipped"],
+        errors=result["errors"],
+        count=len(result["files"])
+    )
+
 @router.get("/image/{file_id}")
 async def get_image(file_id: str):
     """
     Get the converted image
     """
-    png_path = PROCESSED_DIR / f"{file_id}.png"
-    if not png_path.exists():
+    def load():
+        png_path = ensure_png(file_id)
+        if png_path is None:
+            return None
+        content = png_path.read_bytes()
+        return content, len(content)
+    
+    # A missing PNG is regenerated, which may wait for a conversion slot
+    content = await run_in_threadpool(artifact_cache.get_or_load, file_id, PNG, load)
+    if content is None:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(png_path)
+    return Response(content=content, media_type="image/png")
+
+@router.get("/image/{file_id}/render")
+async def render_image(
+    file_id: str,
+    wc: Optional[float] = None,
+    ww: Optional[float] = Query(None, gt=0),
+    preset: str = Query(DEFAULT_PRESET, pattern=f"^({'|'.join(PRESETS)})$"),
+    size: Optional[int] = Query(None, ge=16, le=8192)
+):
+    """
+    Render the image with another window/level from its full bit depth pixels.
+    wc and ww (window center and width, in modality units) override the
+    preset; size is the longest side of the output. The window used is
+    returned in the X-Window-Center and X-Window-Width headers.
+    """
+    if (wc is None) != (ww is None):
+        raise HTTPException(status_code=400, detail="wc and ww must be given together")
+    
+    try:
+        # A missing pixel source is regenerated, which may wait for a conversion slot
+        rendered = await run_in_threadpool(render, file_id, wc, ww, preset, size)
+    except NotRenderableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    content, center, width = rendered
+    return Response(
+        content=content,
+        media_type="image/png",
+        headers={"X-Window-Center": f"{center:g}", "X-Window-Width": f"{width:g}"}
+    )
+
+@router.get("/image/{file_id}/crop/{index}")
+async def crop_finding(
+    file_id: str,
+    index: int,
+    padding: float = Query(CROP_PADDING, ge=0, le=5),
+    size: int = Query(CROP_SIZE, ge=16, le=2048),
+    confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    overlap: float = Query(ROBOFLOW_OVERLAP, ge=0, le=100),
+    wc: Optional[float] = None,
+    ww: Optional[float] = Query(None, gt=0),
+    preset: str = Query(DEFAULT_PRESET, pattern=f"^({'|'.join(PRESETS)})$")
+):
+    """
+    Crop one detected finding from the full-resolution image.
+    index refers to the predictions returned by /detect with the same
+    confidence and overlap; padding adds context around the box as a fraction
+    of its size, and size is the longest side of the output. wc, ww and preset
+    window grayscale images like /image/{file_id}/render. The crop box in image
+    pixels is returned in the X-Crop-Box header (left,top,right,bottom).
+    """
+    if (wc is None) != (ww is None):
+        raise HTTPException(status_code=400, detail="wc and ww must be given together")
+    
+    # May download the results from the storage backend
+    detection_results = await run_in_threadpool(load_detection_results, file_id)
+    if detection_results is None:
+        raise HTTPException(status_code=404, detail="Detection results not found")
+    predictions = apply_thresholds(detection_results, confidence, overlap)["predictions"]
+    if not 0 <= index < len(predictions):
+        raise HTTPException(status_code=404, detail=f"Prediction {index} not found ({len(predictions)} predictions)")
+    
+    cropped = await run_in_threadpool(
+        render_crop, file_id, predictions[index], detection_results.get("image") or {}, padding, size, wc, ww, preset
+    )
+    if cropped is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    content, box, window = cropped
+    headers = {"X-Crop-Box": ",".join(map(str, box))}
+    if window is not None:
+        headers.update({"X-Window-Center": f"{window[0]:g}", "X-Window-Width": f"{window[1]:g}"})
+    return Response(content=content, media_type="image/png", headers=headers)
 
 @router.post("/detect/{file_id}", response_model=DetectionResult)
-async def detect_pathologies(file_id: str, background_tasks: BackgroundTasks):
+async def detect_pathologies(
+    file_id: str,
+    background_tasks: BackgroundTasks,
+    confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    overlap: float = Query(ROBOFLOW_OVERLAP, ge=0, le=100)
+):
     """
-    Detect pathologies using Roboflow API
+    Detect pathologies using Roboflow API.
+    Confidence filtering and NMS are applied locally to the stored raw
+    predictions, so changing the thresholds does not call the API again.
     """
-    png_path = PROCESSED_DIR / f"{file_id}.png"
-    if not png_path.exists():
+    png_path = await run_in_threadpool(ensure_png, file_id)
+    if png_path is None:
         raise HTTPException(status_code=404, detail="Image not found")
     
     try:
-        # Check if detection results already exist (for tests or caching)
-        detection_path = PROCESSED_DIR / f"{file_id}_detection.json"
-        if detection_path.exists():
-            # If results already exist, use them
-            with open(detection_path, "r") as f:
-                detection_results = json.load(f)
-                return DetectionResult(
-                    message="Pathologies detected successfully (cached)",
-                    detection_results=detection_results
-                )
+        # Wait for a speculative detection of this image that is already running
+        speculative = speculator.join(file_id)
+        if speculative is not None:
+            await asyncio.wrap_future(speculative)
         
-        # Otherwise call Roboflow API for object detection
-        detection_results = call_roboflow_api(str(png_path))
-        
-        # Save detection results
-        with open(detection_path, "w") as f:
-            json.dump(detection_results, f)
+        # Reuses saved results, otherwise calls the Roboflow API once per image
+        detection_results, cached = await run_in_threadpool(detect, file_id, png_path, confidence)
         
+        message = "Pathologies detected successfully"
+        if cached:
+            message += " (cached)"
         return DetectionResult(
-            message="Pathologies detected successfully",
-            detection_results=detection_results
+            message=message,
+            detection_results=apply_thresholds(detection_results, confidence, overlap)
         )
     except Exception as e:
         error_message = f"Error detecting pathologies: {str(e)}"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code=500, detail=error_message)
 
 @router.post("/report/{file_id}", response_model=DiagnosticReport)
-async def generate_report(file_id: str):
+async def generate_report(
+    file_id: str,
+    confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    overlap: float = Query(ROBOFLOW_OVERLAP, ge=0, le=100)
+):
     """
     Generate diagnostic report using OpenAI GPT
     """
-    detection_path = PROCESSED_DIR / f"{file_id}_detection.json"
-    if not detection_path.exists():
+    detection_results = await run_in_threadpool(load_detection_results, file_id)
+    if detection_results is None:
         raise HTTPException(status_code=404, detail="Detection results not found")
     
     try:
-        # Load detection results
-        with open(detection_path, "r") as f:
-            detection_results = json.load(f)
-        
-        # Generate report using OpenAI GPT
-        report = generate_diagnostic_report(detection_results)
-        
-        # Save report
-        report_path = PROCESSED_DIR / f"{file_id}_report.json"
-        with open(report_path, "w") as f:
-            json.dump({"report": report}, f)
+        # Generate report using OpenAI GPT from the findings at the requested
+        # thresholds (reused if a report for the same findings exists)
+        report, _ = await run_in_threadpool(
+            get_or_generate_report, file_id, apply_thresholds(detection_results, confidence, overlap)
+        )
         
         return DiagnosticReport(
             message="Diagnostic report generated successfully",
@@ -181,7 +352,12 @@ async def generate_report(file_id: str):
 
 # Add a batch processing endpoint for multiple files
 @router.post("/detect-batch/", response_model=Dict[str, List])
-async def detect_pathologies_batch(file_ids: List[str], background_tasks: BackgroundTasks = None):
+async def detect_pathologies_batch(
+    file_ids: List[str],
+    background_tasks: BackgroundTasks = None,
+    confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    overlap: float = Query(ROBOFLOW_OVERLAP, ge=0, le=100)
+):
     """
     Detect pathologies for multiple images in batch
     """
@@ -194,43 +370,30 @@ async def detect_pathologies_batch(file_ids: List[str], background_tasks: Backgr
             detail=f"Batch size too large. Maximum allowed is {MAX_BATCH_SIZE} files."
         )
     
+    # Batches yield to single-image requests
+    set_priority(BATCH)
+    
     results = []
     errors = []
     
     for file_id in file_ids:
-        png_path = PROCESSED_DIR / f"{file_id}.png"
-        if not png_path.exists():
+        png_path = await run_in_threadpool(ensure_png, file_id)
+        if png_path is None:
             errors.append({"file_id": file_id, "error": "Image not found"})
             continue
         
         try:
-            # Check if detection results already exist (for tests or caching)
-            detection_path = PROCESSED_DIR / f"{file_id}_detection.json"
-            if detection_path.exists():
-                # If results already exist, use them
-                with open(detection_path, "r") as f:
-                    detection_results = json.load(f)
-                    results.append({
-                        "file_id": file_id, 
-                        "detection_results": detection_results
-                    })
-                    continue
-            
-            # Call Roboflow API for object detection
-            detection_results = call_roboflow_api(str(png_path))
-            
-            # Save detection results
-            with open(detection_path, "w") as f:
-                json.dump(detection_results, f)
+            # Reuses saved results, otherwise calls the Roboflow API once per image
+            detection_results, _ = await run_in_threadpool(detect, file_id, png_path, confidence)
             
             results.append({
                 "file_id": file_id, 
-                "detection_results": detection_results
+                "detection_results": apply_thresholds(detection_results, confidence, overlap)
             })
             
         except Exception as e:
             error_message = str(e)
-            print(f"Error processing file {file_id}: {error_message}")
+            logger.error(f"Error processing file {file_id}: {error_message}")
             errors.append({"file_id": file_id, "error": error_message})
     
     return {
@@ -238,6 +401,111 @@ async def detect_pathologies_batch(file_ids: List[str], background_tasks: Backgr
         "errors": errors
     }
 
+@router.get("/similar/{file_id}")
+async def similar_images(file_id: str, threshold: float = Query(PHASH_SIMILARITY_THRESHOLD, ge=0, le=1)):
+    """
+    Near-duplicates of an image by perceptual hash, with whether their
+    detection results and reports can be reused
+    """
+    value = similarity_index.hash_of(file_id)
+    if value is None:
+        raise HTTPException(status_code=404, detail="No perceptual hash for this file")
+    
+    storage = get_storage()
+    matches = find_near_duplicates(file_id, threshold)
+    for match in matches:
+        match["has_detection"] = storage.exists(processed_key(f"{match['file_id']}_detection.json"))
+        match["has_report"] = storage.exists(processed_key(f"{match['file_id']}_report.json"))
+    
+    return {
+        "file_id": file_id,
+        "hash": f"{value:016x}",
+        "algorithm": similarity_index.algorithm,
+        "threshold": threshold,
+        "matches": matches
+    }
+
+@router.get("/findings")
+async def search_findings(
+    classes: List[str] = Query(None, alias="class"),
+    min_confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    max_confidence: Optional[float] = Query(None, ge=0, le=100),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    file_id: Optional[str] = None,
+    sort: str = Query("confidence", pattern=f"^({'|'.join(SORT_COLUMNS)})$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(50, ge=1, le=FINDINGS_QUERY_MAX_LIMIT),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Search the findings of all analysed studies.
+    Confidence bounds use the same 0-100 scale and default as /detect; since
+    and until are ISO 8601 timestamps of the detection.
+    """
+    return findings_index.query(
+        classes=classes,
+        min_confidence=min_confidence / 100,
+        max_confidence=None if max_confidence is None else max_confidence / 100,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        file_id=file_id,
+        sort=sort,
+        descending=order == "desc",
+        limit=limit,
+        offset=offset
+    )
+
+@router.get("/findings/summary")
+async def findings_summary(
+    min_confidence: float = Query(ROBOFLOW_CONFIDENCE, ge=0, le=100),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Number of findings and studies per class across all analysed studies
+    """
+    return findings_index.summary(
+        min_confidence=min_confidence / 100,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None
+    )
+
+@router.get("/storage/stats")
+async def storage_stats():
+    """
+    Disk usage and eviction metrics for uploads and processed files
+    """
+    return storage_manager.get_stats()
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit-ratio and memory usage of the in-process artifact cache
+    """
+    return artifact_cache.get_stats()
+
+@router.get("/admission/stats")
+async def admission_stats():
+    """
+    Rate limits and per-class in-flight and queued requests of this worker
+    """
+    return admission_controller.get_stats()
+
+@router.get("/scheduler/stats")
+async def scheduler_stats():
+    """
+    Conversion and upstream slots in use and queued work per priority
+    """
+    return get_scheduler_stats()
+
+@router.get("/speculation/stats")
+async def speculation_stats():
+    """
+    Queue depth and concurrency of speculative background detection
+    """
+    return speculator.get_stats()
+
 @router.get("/health", status_code=200)
 async def health_check():
     """
@@ -245,3 +513,15 @@ async def health_check():
     Used by Render.com and other services to verify the application is running.
     """
     return {"status": "healthy", "version": "1.0.0"}
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: returns 503 until decoders, upstream connections and a
+    synthetic conversion have been warmed up, so that load balancers only
+    route traffic to warm instances.
+    """
+    status = readiness.get_status()
+    if not readiness.is_ready():
+        return JSONResponse(status_code=503, content=status)
+    return status
@@ -1,8 +1,16 @@
 from fastapi import APIRouter
 from app.api.endpoints import router as endpoints_router
+from app.api.admin import router as admin_router
+from app.api.uploads import router as uploads_router
 
 # Create main API router
 api_router = APIRouter()
 
 # Include the endpoints router
 api_router.include_router(endpoints_router, prefix="")
+
+# Include the resumable upload router
+api_router.include_router(uploads_router, prefix="/uploads", tags=["uploads"])
+
+# Include the admin router
+api_router.include_router(admin_router, prefix="/admin", tags=["admin"])
@@ -0,0 +1,183 @@
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from email.utils import formatdate
+from typing import Any, Dict, Optional
+import base64
+
+from app.core.config import RESUMABLE_UPLOAD_MAX_BYTES
+from app.services import resumable_upload
+from app.services.resumable_upload import (
+    ChunkWriter, ResumableUploadError, TUS_VERSION, TUS_EXTENSIONS, CHECKSUM_ALGORITHMS
+)
+from app.services.render_service import prerender_presets
+from app.services.speculation import speculator
+from app.utils.metrics import observe_stage
+from app.utils.logger import get_logger
+
+# Create logger
+logger = get_logger(__name__)
+
+# Create router
+router = APIRouter()
+
+PATCH_CONTENT_TYPE = "application/offset+octet-stream"
+
+# HTTP status per ResumableUploadError reason (460 is tus' "Checksum Mismatch")
+STATUS_BY_REASON = {
+    "not_found": 404,
+    "offset": 409,
+    "finalized": 409,
+    "incomplete": 409,
+    "too_large": 413,
+    "insufficient_storage": 507,
+    "checksum_mismatch": 460
+}
+
+
+def _tus_headers(state: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    headers = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store"}
+    if state is not None:
+        headers["Upload-Offset"] = str(resumable_upload.received_offset(state))
+        headers["Upload-Length"] = str(state["length"])
+        headers["Upload-Ranges"] = ",".join(f"{start}-{end - 1}" for start, end in state["ranges"])
+        headers["Upload-Expires"] = formatdate(state["expires"], usegmt=True)
+    return headers
+
+
+def _error(e: ResumableUploadError) -> HTTPException:
+    return HTTPException(
+        status_code=STATUS_BY_REASON.get(e.reason, 400),
+        detail=str(e),
+        headers={"Tus-Resumable": TUS_VERSION}
+    )
+
+
+def _parse_metadata(header: Optional[str]) -> Dict[str, str]:
+    # Upload-Metadata: comma-separated "key base64(value)" pairs
+    metadata = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Malformed Upload-Metadata value for {parts[0]}")
+    return metadata
+
+
+@router.options("/")
+async def upload_capabilities():
+    """
+    Advertise the supported tus version and extensions
+    """
+    headers = _tus_headers()
+    headers.update({
+        "Tus-Version": TUS_VERSION,
+        "Tus-Extension": TUS_EXTENSIONS,
+        "Tus-Max-Size": str(RESUMABLE_UPLOAD_MAX_BYTES),
+        "Tus-Checksum-Algorithm": ",".join(CHECKSUM_ALGORITHMS)
+    })
+    return Response(status_code=204, headers=headers)
+
+
+@router.post("/", status_code=201)
+async def create_upload(
+    request: Request,
+    upload_length: int = Header(...),
+    upload_metadata: Optional[str] = Header(None)
+):
+    """
+    Create a resumable upload session. The file name is passed as the
+    "filename" key of Upload-Metadata.
+    """
+    filename = _parse_metadata(upload_metadata).get("filename", "")
+    try:
+        state = await run_in_threadpool(resumable_upload.create_upload, upload_length, filename)
+    except ResumableUploadError as e:
+        raise _error(e)
+
+    headers = _tus_headers(state)
+    headers["Location"] = f"{request.url.path.rstrip('/')}/{state['id']}"
+    return Response(status_code=201, headers=headers)
+
+
+@router.head("/{upload_id}")
+async def upload_status(upload_id: str):
+    """
+    Report how much of an upload has been received
+    """
+    try:
+        state = await run_in_threadpool(resumable_upload.get_upload, upload_id)
+    except ResumableUploadError as e:
+        raise _error(e)
+    return Response(status_code=200, headers=_tus_headers(state))
+
+
+@router.patch("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    upload_offset: int = Header(...),
+    upload_checksum: Optional[str] = Header(None),
+    content_type: Optional[str] = Header(None)
+):
+    """
+    Write a chunk at Upload-Offset. Chunks may arrive in any order; the
+    request that completes the file returns the converted upload.
+    """
+    if content_type != PATCH_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {PATCH_CONTENT_TYPE}")
+
+    try:
+        writer = await run_in_threadpool(ChunkWriter, upload_id, upload_offset, upload_checksum)
+        with writer:
+            try:
+                with observe_stage("upload_write"):
+                    async for data in request.stream():
+                        await run_in_threadpool(writer.write, data)
+            except ClientDisconnect:
+                # Keep what arrived; the client resumes from HEAD's Upload-Offset
+                await run_in_threadpool(writer.commit_partial)
+                return Response(status_code=400, headers=_tus_headers())
+            state = await run_in_threadpool(writer.commit)
+
+        if not resumable_upload.is_complete(state):
+            return Response(status_code=204, headers=_tus_headers(state))
+
+        state, finalized = await run_in_threadpool(resumable_upload.finalize_upload, upload_id)
+    except ResumableUploadError as e:
+        raise _error(e)
+    except Exception as e:
+        logger.error(f"Resumable upload {upload_id} failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if finalized:
+        # Start detection ahead of time if speculative mode is enabled
+        background_tasks.add_task(speculator.submit, state["file_id"], state["converted_image_path"])
+        # Cache the window/level presets for the viewer
+        background_tasks.add_task(prerender_presets, state["file_id"])
+
+    return JSONResponse(
+        {
+            "message": "File uploaded and converted successfully",
+            "file_id": state["file_id"],
+            "converted_image_path": state["converted_image_path"]
+        },
+        headers=_tus_headers(state)
+    )
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def terminate_upload(upload_id: str):
+    """
+    Cancel an upload and discard the received data
+    """
+    try:
+        await run_in_threadpool(resumable_upload.delete_upload, upload_id)
+    except ResumableUploadError as e:
+        raise _error(e)
+    return Response(status_code=204, headers=_tus_headers())
@@ -1,7 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from app.api.router import api_router
-from app.core.config import API_PREFIX, PROJECT_NAME, VERSION, DESCRIPTION
+from app.core.config import API_PREFIX, PROJECT_NAME, VERSION, DESCRIPTION, RESPONSE_COMPRESSION_MIN_BYTES
+from app.utils.admission import AdmissionMiddleware
+from app.utils.compression import CompressionMiddleware
+from app.utils.serialization import orjson
+from app.utils.metrics import MetricsMiddleware, render_metrics
+from app.utils.tracing import TracingMiddleware
+from app.utils.profiler import ProfilingMiddleware
 
 
 def create_app() -> FastAPI:
@@ -11,9 +18,16 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title=PROJECT_NAME,
         version=VERSION,
-        description=DESCRIPTION
+        description=DESCRIPTION,
+        default_response_class=ORJSONResponse if orjson is not None else JSONResponse
     )
     
+    # Compress JSON responses for clients that accept it
+    app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES)
+    
+    # Rate-limit clients and shed load per route class (inside CORS, so rejections carry CORS headers)
+    app.add_middleware(AdmissionMiddleware)
+    
     # Enable CORS
     app.add_middleware(
         CORSMiddleware,
@@ -21,8 +35,18 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],  # Allows all methods
         allow_headers=["*"],  # Allows all headers
+        expose_headers=["X-Window-Center", "X-Window-Width", "X-Crop-Box"],  # Set by the render and crop endpoints
     )
     
+    # Profile individual requests on demand (admin only)
+    app.add_middleware(ProfilingMiddleware)
+    
+    # Per-request spans, reported in the Server-Timing header
+    app.add_middleware(TracingMiddleware)
+    
+    # Record request latency and in-flight requests (outermost, so it sees everything)
+    app.add_middleware(MetricsMiddleware)
+    
     # Include API router
     app.include_router(api_router, prefix=API_PREFIX)
     
@@ -30,4 +54,11 @@ def create_app() -> FastAPI:
     async def root():
         return {"message": f"Welcome to {PROJECT_NAME}"}
     
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """
+        Prometheus metrics endpoint
+        """
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+    
     return app
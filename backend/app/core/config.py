@@ -9,8 +9,8 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 # Create directories for storing uploaded and processed files
-UPLOADS_DIR = BASE_DIR / "uploads"
-PROCESSED_DIR = BASE_DIR / "processed"
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", str(BASE_DIR / "uploads")))
+PROCESSED_DIR = Path(os.getenv("PROCESSED_DIR", str(BASE_DIR / "processed")))
 
 # Create directories if they don't exist
 UPLOADS_DIR.mkdir(exist_ok=True)
@@ -21,11 +21,17 @@ ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # API Settings
+ROBOFLOW_API_URL = os.getenv("ROBOFLOW_API_URL", "https://detect.roboflow.com")  # Overridden by the load test stubs
 ROBOFLOW_MODEL_ID = "adr/6"  # Model ID in format 'project/version'
 ROBOFLOW_CONFIDENCE = 30  # Confidence threshold (0-100)
 ROBOFLOW_OVERLAP = 50  # Overlap threshold (0-100)
+# Detection is fetched once with these thresholds; ROBOFLOW_CONFIDENCE and
+# ROBOFLOW_OVERLAP (or per-request values) are then applied locally
+ROBOFLOW_CONFIDENCE_FLOOR = int(os.getenv("ROBOFLOW_CONFIDENCE_FLOOR", "5"))
+ROBOFLOW_FETCH_OVERLAP = int(os.getenv("ROBOFLOW_FETCH_OVERLAP", "100"))  # 100 disables upstream NMS
 
 # OpenAI Settings
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None uses the OpenAI API
 OPENAI_MODEL = "gpt-3.5-turbo"
 OPENAI_MAX_TOKENS = 500
 OPENAI_TEMPERATURE = 0.3
@@ -37,5 +43,109 @@ PROJECT_NAME = "Dental X-ray Diagnostic API"
 VERSION = "1.0.0"
 DESCRIPTION = "API for dental X-ray diagnostics using Roboflow and OpenAI"
 
+# Storage quota settings
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(900 * 1024 * 1024)))  # Keep headroom on the 1 GB disk
+STORAGE_LOW_WATERMARK = float(os.getenv("STORAGE_LOW_WATERMARK", "0.8"))  # Evict down to this fraction of the quota
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", str(7 * 24 * 3600)))  # Raw uploads idle this long may be evicted
+STORAGE_SWEEP_INTERVAL_SECONDS = int(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "60"))
+
+# Storage backend settings ("local" or "s3")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.getenv("S3_REGION") or None
+S3_MULTIPART_THRESHOLD_BYTES = int(os.getenv("S3_MULTIPART_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNK_BYTES = int(os.getenv("S3_MULTIPART_CHUNK_BYTES", str(8 * 1024 * 1024)))
+
+# In-process artifact cache settings
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ARTIFACT_CACHE_MAX_ITEM_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+
+# Serialization and compression settings
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+JSON_ARTIFACT_COMPRESS_MIN_BYTES = int(os.getenv("JSON_ARTIFACT_COMPRESS_MIN_BYTES", str(64 * 1024)))
+
+# Multi-worker settings (gunicorn.conf.py exports WEB_CONCURRENCY to the workers)
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", "1"))
+MULTIPROCESS_MODE = WORKER_COUNT > 1
+RUNTIME_DIR = Path(os.getenv("RUNTIME_DIR", str(BASE_DIR / "run")))  # Locks, journals and metrics shared by workers
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", "5"))
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", str(MULTIPROCESS_MODE)).lower() == "true"
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Other workers may rewrite artifacts, so in-process cache entries expire in multi-worker mode
+ARTIFACT_CACHE_TTL_SECONDS = float(os.getenv("ARTIFACT_CACHE_TTL_SECONDS", "30" if MULTIPROCESS_MODE else "0"))
+
+# Tracing and profiling settings
+TRACE_LOG_SPANS = os.getenv("TRACE_LOG_SPANS", "False").lower() == "true"  # Log per-request spans as JSON
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Required for admin endpoints and request profiling; unset disables them
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.005"))
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))  # Older profiles are pruned when a new one is saved
+PROFILE_MAX_AGE_SECONDS = int(os.getenv("PROFILE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Warm-up settings (readiness is reported once warm-up has finished)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "True").lower() == "true"
+WARMUP_UPSTREAMS = os.getenv("WARMUP_UPSTREAMS", "True").lower() == "true"  # Open connections to Roboflow/OpenAI
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "10"))  # Pooled connections per upstream host
+
+# Speculative detection settings (detection queued right after upload)
+SPECULATIVE_DETECTION = os.getenv("SPECULATIVE_DETECTION", "False").lower() == "true"
+SPECULATIVE_REPORTS = os.getenv("SPECULATIVE_REPORTS", "False").lower() == "true"  # Also generate the report
+SPECULATION_MAX_CONCURRENCY = int(os.getenv("SPECULATION_MAX_CONCURRENCY", "2"))  # Per worker process
+SPECULATION_MAX_QUEUE = int(os.getenv("SPECULATION_MAX_QUEUE", "32"))
+SPECULATION_MAX_IN_FLIGHT_REQUESTS = int(os.getenv("SPECULATION_MAX_IN_FLIGHT_REQUESTS", "8"))  # Shed speculation above this
+
+# Resumable upload settings (tus-style sessions; partial data lives outside the storage quota)
+RESUMABLE_UPLOAD_DIR = Path(os.getenv("RESUMABLE_UPLOAD_DIR", str(BASE_DIR / "partial_uploads")))
+RESUMABLE_UPLOAD_MAX_BYTES = int(os.getenv("RESUMABLE_UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+RESUMABLE_UPLOAD_TTL_SECONDS = int(os.getenv("RESUMABLE_UPLOAD_TTL_SECONDS", str(24 * 3600)))  # Unfinished sessions expire
+RESUMABLE_UPLOAD_MAX_RESERVED_BYTES = int(os.getenv("RESUMABLE_UPLOAD_MAX_RESERVED_BYTES", str(512 * 1024 * 1024)))  # Across unfinished sessions
+
+# Archive ingest settings (ZIP/TAR request bodies are extracted while they stream in)
+ARCHIVE_MAX_ENTRIES = int(os.getenv("ARCHIVE_MAX_ENTRIES", "10000"))
+ARCHIVE_MAX_ENTRY_BYTES = int(os.getenv("ARCHIVE_MAX_ENTRY_BYTES", str(256 * 1024 * 1024)))  # Uncompressed size per entry
+ARCHIVE_CONVERSION_WORKERS = int(os.getenv("ARCHIVE_CONVERSION_WORKERS", str(min(4, os.cpu_count() or 1))))
+ARCHIVE_STREAM_BUFFER_CHUNKS = int(os.getenv("ARCHIVE_STREAM_BUFFER_CHUNKS", "16"))  # Request body chunks buffered ahead of extraction
+
+# Near-duplicate detection settings (perceptual hash of every converted image)
+PHASH_ENABLED = os.getenv("PHASH_ENABLED", "True").lower() == "true"
+PHASH_ALGORITHM = os.getenv("PHASH_ALGORITHM", "dhash")  # "dhash" or "phash"
+PHASH_INDEX_PATH = Path(os.getenv("PHASH_INDEX_PATH", str(RUNTIME_DIR / "phash_index.log")))
+PHASH_SIMILARITY_THRESHOLD = float(os.getenv("PHASH_SIMILARITY_THRESHOLD", "0.9"))  # Fraction of matching hash bits
+DUPLICATE_REUSE_RESULTS = os.getenv("DUPLICATE_REUSE_RESULTS", "False").lower() == "true"  # Reuse detections of near-duplicates
+
+# Findings index settings (SQLite index of all saved detection findings)
+FINDINGS_INDEX_PATH = Path(os.getenv("FINDINGS_INDEX_PATH", str(RUNTIME_DIR / "findings.sqlite3")))
+FINDINGS_QUERY_MAX_LIMIT = int(os.getenv("FINDINGS_QUERY_MAX_LIMIT", "500"))  # Largest page served by /findings
+
+# Admission control settings (per-client token buckets and in-flight caps per route class)
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "True").lower() == "true"
+RATE_LIMIT_PER_CLIENT = float(os.getenv("RATE_LIMIT_PER_CLIENT", "10"))  # Tokens per second; reads cost 1, uploads/detection 5
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "100"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "False").lower() == "true"  # Behind a proxy
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "64"))
+ADMISSION_CONVERSION_CONCURRENCY = int(os.getenv("ADMISSION_CONVERSION_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+ADMISSION_UPSTREAM_CONCURRENCY = int(os.getenv("ADMISSION_UPSTREAM_CONCURRENCY", "16"))
+# Latency targets: requests expected to wait longer than this for a slot are rejected with 503
+ADMISSION_READ_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_READ_MAX_WAIT_SECONDS", "1"))
+ADMISSION_CONVERSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_CONVERSION_MAX_WAIT_SECONDS", "10"))
+ADMISSION_UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_UPSTREAM_MAX_WAIT_SECONDS", "20"))
+
+# Priority scheduling settings (interactive work goes ahead of batch and bulk work)
+SCHEDULER_CONVERSION_SLOTS = int(os.getenv("SCHEDULER_CONVERSION_SLOTS", str(os.cpu_count() or 1)))  # Concurrent conversions
+SCHEDULER_UPSTREAM_SLOTS = int(os.getenv("SCHEDULER_UPSTREAM_SLOTS", str(UPSTREAM_POOL_SIZE)))  # Concurrent upstream calls
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "5"))  # Waiting this long raises priority one level
+BACKFILL_NICE = int(os.getenv("BACKFILL_NICE", "10"))  # CPU niceness of backfill worker processes
+
+# Window/level rendering settings (/image/{file_id}/render from the decoded high-bit-depth pixels)
+RENDER_PRERENDER_PRESETS = [p.strip() for p in os.getenv("RENDER_PRERENDER_PRESETS", "default,full,contrast").split(",") if p.strip()]  # Pre-rendered after upload
+RENDER_PRESET_SIZE = int(os.getenv("RENDER_PRESET_SIZE", "1024"))  # Longest side of pre-rendered presets (0 = full size)
+RENDER_LUT_CACHE_SIZE = int(os.getenv("RENDER_LUT_CACHE_SIZE", "64"))  # LUTs kept per worker (up to 64 KiB each)
+RENDER_PNG_COMPRESS_LEVEL = int(os.getenv("RENDER_PNG_COMPRESS_LEVEL", "1"))  # Fast encoding; renders are cached, not stored
+CROP_PADDING = float(os.getenv("CROP_PADDING", "0.25"))  # Context around a finding, as a fraction of its box size per side
+CROP_SIZE = int(os.getenv("CROP_SIZE", "256"))  # Default longest side of finding crops
+
 # Test mode
 TEST_MODE = os.environ.get("TEST_MODE", "False").lower() == "true"
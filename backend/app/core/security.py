@@ -0,0 +1,14 @@
+import hmac
+from typing import Optional
+
+from app.core import config
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """
+    Check a token against the configured admin token.
+    Admin access is disabled when no admin token is configured.
+    """
+    if not config.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), config.ADMIN_TOKEN.encode("utf-8"))
@@ -11,6 +11,13 @@ class MultipleUploadResponse(BaseModel):
     files: List[Dict[str, str]]
     count: int
 
+class ArchiveIngestResponse(BaseModel):
+    message: str
+    files: List[Dict[str, str]]
+    skipped: List[Dict[str, str]]
+    errors: List[str]
+    count: int
+
 class DetectionResult(BaseModel):
     message: str
     detection_results: Dict[str, Any]
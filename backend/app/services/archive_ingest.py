@@ -0,0 +1,467 @@
+"""
+Bulk ingest of ZIP and TAR archives.
+
+Archives are extracted entry by entry while the request body streams in:
+``StreamBridge`` hands body chunks from the event loop to an extraction
+thread through a small bounded queue, ZIP entries are read from their local
+file headers (the central directory at the end is never needed) and TAR
+archives use tarfile's stream mode. Each DICOM entry is copied to storage in
+fixed-size chunks and converted on a thread pool while extraction continues,
+so memory stays bounded by the queue, the chunk size and the number of
+conversion workers, whatever the size of the archive.
+"""
+
+import logging
+import os
+import queue
+import struct
+import tarfile
+import threading
+import uuid
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import (
+    ARCHIVE_MAX_ENTRIES, ARCHIVE_MAX_ENTRY_BYTES, ARCHIVE_CONVERSION_WORKERS, ARCHIVE_STREAM_BUFFER_CHUNKS
+)
+from app.services.dicom_service import convert_dicom_to_png
+from app.services.scheduler import priority, BULK
+from app.services.dicom_validation import validate_dicom, check_preamble, DicomValidationError, SNIFF_BYTES
+from app.services.storage_backend import get_storage, upload_key
+from app.utils.metrics import counter, observe_stage
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+ZIP_LOCAL_HEADER = b"PK\x03\x04"
+ZIP_CENTRAL_HEADER = b"PK\x01\x02"
+ZIP_END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+ZIP_DATA_DESCRIPTOR = b"PK\x07\x08"
+ZIP_LOCAL_HEADER_FORMAT = struct.Struct("<4sHHHHHIIIHH")
+ZIP64_EXTRA_ID = 0x0001
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_FLAG_ENCRYPTED = 0x1
+ZIP_FLAG_DATA_DESCRIPTOR = 0x8
+
+# Entries that are never images
+SKIPPED_PREFIXES = ("__MACOSX/",)
+
+ARCHIVE_ENTRIES_TOTAL = counter(
+    "dental_archive_entries_total",
+    "Archive entries processed by outcome",
+    ["outcome"]
+)
+
+
+class ArchiveError(Exception):
+    """
+    Raised when an archive cannot be read any further
+    """
+
+
+class StreamBridge:
+    """
+    File-like object fed with chunks from another thread. ``read`` blocks
+    until data arrives; ``feed`` blocks while the bounded queue is full, which
+    pushes back on the client instead of buffering the archive.
+    """
+
+    def __init__(self, max_chunks: int = ARCHIVE_STREAM_BUFFER_CHUNKS):
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self.closed = False
+
+    def feed(self, chunk: bytes) -> None:
+        while not self.closed:
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self) -> None:
+        """
+        Signal the end of the stream
+        """
+        self.feed(None)
+
+    def close(self) -> None:
+        """
+        Stop consuming; later feeds are discarded
+        """
+        self.closed = True
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        # Consume from the front in place rather than copying the remainder
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _PushbackReader:
+    """
+    Reader over a stream that can return bytes it read too far
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._pending = b""
+
+    def read(self, size: int) -> bytes:
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+        return self._stream.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def unread(self, data: bytes) -> None:
+        self._pending = data + self._pending
+
+
+class _ZipEntryReader:
+    """
+    Reads the uncompressed data of one ZIP entry from the archive stream
+    and checks its CRC at the end
+    """
+
+    def __init__(self, reader: _PushbackReader, method: int, flags: int, crc: int,
+                 compressed_size: Optional[int], zip64: bool):
+        self._reader = reader
+        self._method = method
+        self._has_descriptor = bool(flags & ZIP_FLAG_DATA_DESCRIPTOR)
+        self._crc = crc
+        self._remaining = compressed_size
+        self._zip64 = zip64
+        self._decompressor = zlib.decompressobj(-15) if method == ZIP_DEFLATED else None
+        self._running_crc = 0
+        self._buffer = b""
+        self._done = False
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        while not self._buffer and not self._done:
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def skip(self) -> None:
+        """
+        Move the archive stream past this entry
+        """
+        if self._decompressor is None or not self._has_descriptor:
+            # The compressed size is known: no need to decompress
+            while self._remaining:
+                chunk = self._reader.read(min(CHUNK_SIZE, self._remaining))
+                if not chunk:
+                    raise ArchiveError("Truncated ZIP entry")
+                self._remaining -= len(chunk)
+            self._finish(check_crc=False)
+            return
+        while self.read():
+            pass
+
+    def _read_compressed(self) -> bytes:
+        size = CHUNK_SIZE if self._remaining is None else min(CHUNK_SIZE, self._remaining)
+        chunk = self._reader.read(size) if size else b""
+        if self._remaining is not None:
+            self._remaining -= len(chunk)
+        return chunk
+
+    def _fill(self) -> None:
+        if self._decompressor is None:
+            chunk = self._read_compressed()
+            if not chunk:
+                if self._remaining:
+                    raise ArchiveError("Truncated ZIP entry")
+                self._finish()
+                return
+            self._emit(chunk)
+            return
+
+        if self._decompressor.unconsumed_tail:
+            data = self._decompressor.decompress(self._decompressor.unconsumed_tail, CHUNK_SIZE)
+        else:
+            chunk = self._read_compressed()
+            if not chunk:
+                raise ArchiveError("Truncated ZIP entry")
+            data = self._decompressor.decompress(chunk, CHUNK_SIZE)
+        self._emit(data)
+        if self._decompressor.eof:
+            self._reader.unread(self._decompressor.unused_data)
+            self._finish()
+
+    def _emit(self, data: bytes) -> None:
+        self._running_crc = zlib.crc32(data, self._running_crc)
+        self._buffer += data
+
+    def _finish(self, check_crc: bool = True) -> None:
+        self._done = True
+        if self._has_descriptor:
+            signature = self._reader.read_exact(4)
+            if signature != ZIP_DATA_DESCRIPTOR:
+                # The descriptor signature is optional
+                self._reader.unread(signature)
+            descriptor = self._reader.read_exact(20 if self._zip64 else 12)
+            self._crc = struct.unpack("<I", descriptor[:4])[0]
+        if check_crc and self._running_crc != self._crc:
+            raise ArchiveError("ZIP entry CRC mismatch")
+
+
+def iter_zip_entries(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    """
+    Stream the entries of a ZIP archive from its local file headers
+
+    Yields:
+        (name, reader) for every file entry. The reader must be read to the
+        end or skipped before the next entry is requested.
+    """
+    reader = _PushbackReader(stream)
+    while True:
+        signature = reader.read_exact(4)
+        if signature in (ZIP_CENTRAL_HEADER, ZIP_END_OF_CENTRAL_DIRECTORY, b""):
+            return
+        if signature != ZIP_LOCAL_HEADER:
+            raise ArchiveError("Invalid ZIP local file header")
+
+        header = signature + reader.read_exact(ZIP_LOCAL_HEADER_FORMAT.size - 4)
+        if len(header) < ZIP_LOCAL_HEADER_FORMAT.size:
+            raise ArchiveError("Truncated ZIP local file header")
+        (_, _, flags, method, _, _, crc, compressed_size, uncompressed_size,
+         name_length, extra_length) = ZIP_LOCAL_HEADER_FORMAT.unpack(header)
+        name = reader.read_exact(name_length).decode("utf-8", errors="replace")
+        extra = reader.read_exact(extra_length)
+
+        # A Zip64 extra field also means the data descriptor has 8-byte sizes
+        sizes = _zip64_sizes(extra)
+        zip64 = sizes is not None
+        if zip64 and 0xFFFFFFFF in (compressed_size, uncompressed_size):
+            uncompressed_size, compressed_size = sizes
+
+        has_descriptor = bool(flags & ZIP_FLAG_DATA_DESCRIPTOR)
+        if flags & ZIP_FLAG_ENCRYPTED:
+            if has_descriptor:
+                raise ArchiveError(f"Cannot skip encrypted entry {name} of unknown size")
+            _ZipEntryReader(reader, ZIP_STORED, 0, 0, compressed_size, zip64).skip()
+            continue
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            if has_descriptor:
+                raise ArchiveError(f"Unsupported compression method {method} for {name}")
+            _ZipEntryReader(reader, ZIP_STORED, 0, 0, compressed_size, zip64).skip()
+            continue
+        if method == ZIP_STORED and has_descriptor:
+            raise ArchiveError(f"Stored entry {name} without sizes cannot be streamed")
+
+        entry = _ZipEntryReader(
+            reader, method, flags, crc, None if has_descriptor else compressed_size, zip64
+        )
+        yield name, entry
+
+
+def _zip64_sizes(extra: bytes) -> Optional[Tuple[int, int]]:
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[offset:offset + 4])
+        if header_id == ZIP64_EXTRA_ID and size >= 16:
+            return struct.unpack("<QQ", extra[offset + 4:offset + 20])
+        offset += 4 + size
+    return None
+
+
+def iter_tar_entries(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    """
+    Stream the regular file entries of a (possibly compressed) TAR archive
+    """
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member)
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    Identify an archive from its first 512 bytes
+    """
+    if head.startswith((ZIP_LOCAL_HEADER, ZIP_END_OF_CENTRAL_DIRECTORY)):
+        return "zip"
+    if head.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")) or head[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def _skip_reason(name: str) -> Optional[str]:
+    basename = name.rstrip("/").rsplit("/", 1)[-1]
+    if name.endswith("/"):
+        return "directory"
+    if name.startswith(SKIPPED_PREFIXES) or basename.startswith("._"):
+        return "metadata"
+    if basename.upper() == "DICOMDIR":
+        return "dicomdir"
+    return None
+
+
+def _drain(entry) -> None:
+    if hasattr(entry, "skip"):
+        entry.skip()
+    else:
+        while entry.read(CHUNK_SIZE):
+            pass
+
+
+def _read_head(entry) -> bytes:
+    head = b""
+    while len(head) < SNIFF_BYTES:
+        chunk = entry.read(SNIFF_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def ingest_archive(stream: BinaryIO, workers: int = ARCHIVE_CONVERSION_WORKERS) -> Dict[str, Any]:
+    """
+    Extract the DICOM files of a ZIP or TAR archive and convert them
+
+    Args:
+        stream: Archive byte stream (read sequentially, never seeked; closed afterwards)
+        workers: Files converted concurrently
+
+    Returns:
+        Dictionary with "files" (entry, file_id, converted_image_path),
+        "skipped" (entry, reason) and "errors"
+    """
+    try:
+        return _ingest(stream, workers)
+    finally:
+        # Unblocks a producer still feeding a StreamBridge
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+def _ingest(stream: BinaryIO, workers: int) -> Dict[str, Any]:
+    reader = _PushbackReader(stream)
+    head = reader.read_exact(512)
+    reader.unread(head)
+    archive_format = sniff_format(head)
+    if archive_format is None:
+        raise ArchiveError("Not a ZIP or TAR archive")
+
+    entries = iter_zip_entries(reader) if archive_format == "zip" else iter_tar_entries(reader)
+    files: List[Dict[str, str]] = []
+    skipped: List[Dict[str, str]] = []
+    errors: List[str] = []
+    pending: List[Tuple[str, str, str, Future]] = []
+    # At most two queued conversions per worker ahead of extraction
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive-convert") as executor:
+        try:
+            for count, (name, entry) in enumerate(entries):
+                if count >= ARCHIVE_MAX_ENTRIES:
+                    errors.append(f"Archive has more than {ARCHIVE_MAX_ENTRIES} entries; the rest was ignored")
+                    break
+                result = _store_entry(name, entry)
+                if "reason" in result:
+                    skipped.append(result)
+                    ARCHIVE_ENTRIES_TOTAL.inc(outcome="skipped")
+                    continue
+
+                slots.acquire()
+                future = executor.submit(_convert_bulk, result["path"], result["file_id"])
+                future.add_done_callback(lambda done: slots.release())
+                pending.append((name, result["file_id"], result["key"], future))
+        except (ArchiveError, tarfile.TarError, zlib.error, EOFError) as e:
+            errors.append(f"Archive could not be read past this point: {str(e)}")
+
+        storage = get_storage()
+        for name, file_id, file_key, future in pending:
+            try:
+                files.append({"entry": name, "file_id": file_id, "converted_image_path": future.result()})
+                ARCHIVE_ENTRIES_TOTAL.inc(outcome="converted")
+            except Exception as e:
+                storage.delete(file_key)
+                errors.append(f"{name}: {str(e)}")
+                ARCHIVE_ENTRIES_TOTAL.inc(outcome="failed")
+
+    logger.info(f"Archive ingest: {len(files)} converted, {len(skipped)} skipped, {len(errors)} errors")
+    return {"files": files, "skipped": skipped, "errors": errors}
+
+
+def _convert_bulk(dicom_path: str, file_id: str) -> str:
+    # Archive imports yield to interactive uploads for conversion slots
+    with priority(BULK):
+        return convert_dicom_to_png(dicom_path, file_id)
+
+
+def _store_entry(name: str, entry) -> Dict[str, str]:
+    """
+    Copy one entry into storage if it is a DICOM file, otherwise skip it
+    """
+    reason = _skip_reason(name)
+    if reason is not None:
+        _drain(entry)
+        return {"entry": name, "reason": reason}
+
+    head = _read_head(entry)
+    try:
+        check_preamble(head)
+    except DicomValidationError:
+        _drain(entry)
+        return {"entry": name, "reason": "not_dicom"}
+
+    file_id = str(uuid.uuid4())
+    extension = ".rvg" if name.lower().endswith(".rvg") else ".dcm"
+    storage = get_storage()
+    file_key = upload_key(f"{file_id}{extension}")
+    file_path = storage.local_path(file_key)
+
+    written = len(head)
+    try:
+        with open(file_path, "wb") as f, observe_stage("upload_write"):
+            f.write(head)
+            while True:
+                chunk = entry.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > ARCHIVE_MAX_ENTRY_BYTES:
+                    break
+                f.write(chunk)
+    except Exception:
+        os.remove(file_path)
+        raise
+
+    if written > ARCHIVE_MAX_ENTRY_BYTES:
+        os.remove(file_path)
+        _drain(entry)
+        return {"entry": name, "reason": "too_large"}
+
+    try:
+        with open(file_path, "rb") as f:
+            validate_dicom(f)
+    except DicomValidationError as e:
+        os.remove(file_path)
+        return {"entry": name, "reason": e.reason}
+
+    storage.publish(file_key)
+    return {"entry": name, "file_id": file_id, "key": file_key, "path": str(file_path)}
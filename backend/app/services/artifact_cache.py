@@ -0,0 +1,208 @@
+"""
+In-process cache for hot artifacts.
+
+Holds encoded PNG bytes and parsed detection results in memory so that the
+working set of a busy session is served without touching the disk. The cache
+is a size-aware LRU keyed by (file_id, artifact type); callers invalidate or
+replace entries whenever they write the artifact.
+
+In multi-worker mode a SQLite-backed shared tier sits behind the in-process
+LRU, and in-process entries expire after a TTL so that artifacts rewritten by
+another worker are picked up.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import (
+    ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_CACHE_MAX_ITEM_BYTES, ARTIFACT_CACHE_TTL_SECONDS, SHARED_CACHE_ENABLED
+)
+from app.services.shared_cache import SharedCache
+from app.utils.metrics import gauge, observe_stage
+from app.utils.serialization import dumps, loads
+
+# Artifact types
+PNG = "png"
+DETECTION = "detection"
+# Window/level renderings; cached under "render:<center>:<width>:<size>"
+RENDER = "render"
+# Finding crops; cached under "crop:<box>:<window>:<size>"
+CROP = "crop"
+
+CacheKey = Tuple[str, str]
+
+# How each artifact type is stored in the shared tier: (encode, decode)
+CODECS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    PNG: (bytes, bytes),
+    DETECTION: (dumps, loads),
+    RENDER: (bytes, bytes),
+    CROP: (bytes, bytes)
+}
+
+
+def _codec(kind: str) -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    # Parameterized kinds ("render:...") share the codec of their base type
+    return CODECS[kind.partition(":")[0]]
+
+
+class ArtifactCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its entries
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = ARTIFACT_CACHE_MAX_BYTES,
+        max_item_bytes: int = ARTIFACT_CACHE_MAX_ITEM_BYTES,
+        ttl_seconds: float = ARTIFACT_CACHE_TTL_SECONDS,
+        shared: Optional[SharedCache] = None
+    ):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        # key -> (value, size, time stored)
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_id: str, kind: str) -> Optional[Any]:
+        """
+        Return a cached artifact, or None on a miss
+        """
+        key = (file_id, kind)
+        with observe_stage("cache_lookup"), self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[2] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, file_id: str, kind: str, value: Any, size: int, shared: bool = True) -> None:
+        """
+        Store an artifact (and write it through to the shared tier).
+        Items larger than the per-item limit are not cached.
+        """
+        if shared and self.shared is not None and size <= self.max_item_bytes:
+            encode, _ = _codec(kind)
+            self.shared.put(self._shared_key(file_id, kind), encode(value))
+        self._put_local(file_id, kind, value, size)
+
+    def _put_local(self, file_id: str, kind: str, value: Any, size: int) -> None:
+        key = (file_id, kind)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_item_bytes or size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def get_or_load(self, file_id: str, kind: str, loader: Callable[[], Optional[Tuple[Any, int]]]) -> Optional[Any]:
+        """
+        Return a cached artifact, loading and caching it on a miss
+
+        Args:
+            file_id: Unique identifier for the file
+            kind: Artifact type
+            loader: Returns (value, size in bytes), or None if the artifact does not exist
+
+        Returns:
+            The artifact, or None if it does not exist
+        """
+        value = self.get(file_id, kind)
+        if value is not None:
+            return value
+
+        if self.shared is not None:
+            data = self.shared.get(self._shared_key(file_id, kind))
+            if data is not None:
+                _, decode = _codec(kind)
+                value = decode(data)
+                self._put_local(file_id, kind, value, len(data))
+                return value
+
+        loaded = loader()
+        if loaded is None:
+            return None
+        value, size = loaded
+        self.put(file_id, kind, value, size)
+        return value
+
+    def invalidate(self, file_id: str, kind: Optional[str] = None) -> None:
+        """
+        Drop one artifact type (including its parameterized variants, e.g.
+        every "render:..." entry for RENDER), or every artifact of a file
+        when kind is None
+        """
+        if self.shared is not None:
+            if kind is not None:
+                self.shared.delete(self._shared_key(file_id, kind))
+                self.shared.delete_prefix(f"{self._shared_key(file_id, kind)}:")
+            else:
+                self.shared.delete_prefix(f"{file_id}:")
+
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == file_id]:
+                if kind is None or key[1] == kind or key[1].startswith(f"{kind}:"):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return hit-ratio and memory usage statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "shared": self.shared.get_stats() if self.shared is not None else None
+            }
+
+    @staticmethod
+    def _shared_key(file_id: str, kind: str) -> str:
+        return f"{file_id}:{kind}"
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+# Shared instance used by the API and the services
+artifact_cache = ArtifactCache(shared=SharedCache() if SHARED_CACHE_ENABLED else None)
+
+gauge(
+    "dental_artifact_cache_hit_ratio",
+    "Hit ratio of the in-process artifact cache",
+    callback=lambda: {(): artifact_cache.get_stats()["hit_ratio"]},
+    multiprocess_mode="pid"
+)
+gauge(
+    "dental_artifact_cache_bytes",
+    "Bytes held by the in-process artifact cache",
+    callback=lambda: {(): artifact_cache.get_stats()["bytes"]}
+)
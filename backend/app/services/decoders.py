@@ -0,0 +1,195 @@
+"""
+Pixel data decoder selection.
+
+pydicom tries its pixel data handlers in a fixed global order. This module
+instead picks, per transfer syntax, the fastest handler that is available on
+this system (the ordering is based on ``benchmarks/bench_decoders.py``) and
+falls back to the next one if decoding fails.
+
+Conversion only keeps the first frame, so ``decode_first_frame`` decodes
+just that frame's fragment (or bytes, for uncompressed data) instead of the
+whole multi-frame pixel data.
+"""
+
+import logging
+from typing import Dict, List
+
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+IMPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2"
+EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1"
+DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1.99"
+EXPLICIT_VR_BIG_ENDIAN = "1.2.840.10008.1.2.2"
+JPEG_BASELINE = "1.2.840.10008.1.2.4.50"
+JPEG_EXTENDED = "1.2.840.10008.1.2.4.51"
+JPEG_LOSSLESS = "1.2.840.10008.1.2.4.57"
+JPEG_LOSSLESS_SV1 = "1.2.840.10008.1.2.4.70"
+JPEG_LS_LOSSLESS = "1.2.840.10008.1.2.4.80"
+JPEG_LS_NEAR_LOSSLESS = "1.2.840.10008.1.2.4.81"
+JPEG_2000_LOSSLESS = "1.2.840.10008.1.2.4.90"
+JPEG_2000 = "1.2.840.10008.1.2.4.91"
+RLE_LOSSLESS = "1.2.840.10008.1.2.5"
+
+UNCOMPRESSED_TRANSFER_SYNTAXES = {
+    IMPLICIT_VR_LITTLE_ENDIAN,
+    EXPLICIT_VR_LITTLE_ENDIAN,
+    DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN,
+    EXPLICIT_VR_BIG_ENDIAN
+}
+
+_JPEG = ["pillow", "pylibjpeg", "gdcm"]
+_JPEG_LOSSLESS = ["pylibjpeg", "gdcm"]
+_JPEG_LS = ["pylibjpeg", "jpeg_ls", "gdcm"]
+_JPEG_2000 = ["pylibjpeg", "pillow", "gdcm"]
+_RLE = ["pylibjpeg", "rle", "gdcm"]
+
+# Handlers per transfer syntax, fastest first (see benchmarks/bench_decoders.py)
+HANDLER_PREFERENCE: Dict[str, List[str]] = {
+    IMPLICIT_VR_LITTLE_ENDIAN: ["numpy"],
+    EXPLICIT_VR_LITTLE_ENDIAN: ["numpy"],
+    DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN: ["numpy"],
+    EXPLICIT_VR_BIG_ENDIAN: ["numpy"],
+    JPEG_BASELINE: _JPEG,
+    JPEG_EXTENDED: _JPEG,
+    JPEG_LOSSLESS: _JPEG_LOSSLESS,
+    JPEG_LOSSLESS_SV1: _JPEG_LOSSLESS,
+    JPEG_LS_LOSSLESS: _JPEG_LS,
+    JPEG_LS_NEAR_LOSSLESS: _JPEG_LS,
+    JPEG_2000_LOSSLESS: _JPEG_2000,
+    JPEG_2000: _JPEG_2000,
+    RLE_LOSSLESS: _RLE
+}
+
+# Attributes a single-frame dataset needs to be decoded on its own
+_FRAME_ATTRIBUTES = [
+    "Rows", "Columns", "SamplesPerPixel", "PhotometricInterpretation", "PlanarConfiguration",
+    "BitsAllocated", "BitsStored", "HighBit", "PixelRepresentation"
+]
+
+
+def _handler_module(name: str):
+    import pydicom.pixel_data_handlers as handlers
+    return getattr(handlers, f"{name}_handler")
+
+
+def handler_can_decode(name: str, transfer_syntax: str) -> bool:
+    """
+    Whether a handler is installed and can decode a transfer syntax
+    """
+    try:
+        handler = _handler_module(name)
+    except (AttributeError, ImportError):
+        return False
+    if not handler.is_available() or not handler.supports_transfer_syntax(transfer_syntax):
+        return False
+    if name == "pylibjpeg":
+        # pylibjpeg claims every syntax; only those with an installed plugin work
+        return transfer_syntax in getattr(handler, "_DECODERS", {})
+    return True
+
+
+def available_handlers(transfer_syntax: str) -> List[str]:
+    """
+    Handlers that can decode a transfer syntax on this system, fastest first
+    """
+    return [
+        name for name in HANDLER_PREFERENCE.get(transfer_syntax, [])
+        if handler_can_decode(name, transfer_syntax)
+    ]
+
+
+def is_transfer_syntax_supported(transfer_syntax: str) -> bool:
+    """
+    Whether an available handler can decode a transfer syntax
+    """
+    return transfer_syntax in UNCOMPRESSED_TRANSFER_SYNTAXES or bool(available_handlers(transfer_syntax))
+
+
+def decode_pixel_array(dataset) -> "np.ndarray":
+    """
+    Decode the pixel data of a dataset with the fastest available handler
+
+    Args:
+        dataset: Dataset read with pydicom.dcmread
+
+    Returns:
+        The pixel array, shaped like Dataset.pixel_array
+    """
+    transfer_syntax = str(dataset.file_meta.TransferSyntaxUID)
+    if transfer_syntax in UNCOMPRESSED_TRANSFER_SYNTAXES:
+        return dataset.pixel_array
+
+    handlers = available_handlers(transfer_syntax)
+    if not handlers:
+        # Unknown syntax: let pydicom try everything it has
+        return dataset.pixel_array
+    return _decode_with(dataset, handlers)
+
+
+def decode_first_frame(dataset) -> "np.ndarray":
+    """
+    Decode only the first frame of the pixel data
+
+    Args:
+        dataset: Dataset read with pydicom.dcmread
+
+    Returns:
+        The first frame, shaped like a single-frame Dataset.pixel_array
+    """
+    frames = int(getattr(dataset, "NumberOfFrames", 1) or 1)
+    if frames <= 1:
+        return decode_pixel_array(dataset)
+
+    transfer_syntax = str(dataset.file_meta.TransferSyntaxUID)
+    if transfer_syntax in UNCOMPRESSED_TRANSFER_SYNTAXES:
+        bits_allocated = int(dataset.BitsAllocated)
+        if bits_allocated % 8:
+            # Bit-packed frames need not start on a byte boundary
+            return dataset.pixel_array[0]
+        frame_bytes = int(dataset.Rows) * int(dataset.Columns) * int(dataset.SamplesPerPixel) * bits_allocated // 8
+        frame = _frame_dataset(dataset, bytes(dataset.PixelData[:frame_bytes]), encapsulated=False)
+        return frame.pixel_array
+
+    handlers = available_handlers(transfer_syntax)
+    if not handlers:
+        return dataset.pixel_array[0]
+
+    from pydicom.encaps import generate_pixel_data_frame
+
+    fragment = next(generate_pixel_data_frame(dataset.PixelData, frames))
+    return _decode_with(_frame_dataset(dataset, fragment), handlers)
+
+
+def _decode_with(dataset, handlers: List[str]) -> "np.ndarray":
+    last_exception = None
+    for name in handlers:
+        try:
+            dataset.convert_pixel_data(handler_name=name)
+            return dataset.pixel_array
+        except Exception as e:
+            logger.warning(f"Pixel data handler {name} failed: {str(e)}")
+            last_exception = e
+    raise last_exception
+
+
+def _frame_dataset(dataset, fragment: bytes, encapsulated: bool = True):
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.encaps import encapsulate
+
+    frame = Dataset()
+    frame.file_meta = FileMetaDataset()
+    frame.file_meta.TransferSyntaxUID = dataset.file_meta.TransferSyntaxUID
+    frame.is_little_endian = dataset.is_little_endian
+    frame.is_implicit_VR = dataset.is_implicit_VR
+    for keyword in _FRAME_ATTRIBUTES:
+        if keyword in dataset:
+            setattr(frame, keyword, getattr(dataset, keyword))
+    frame.NumberOfFrames = 1
+    frame.PixelData = encapsulate([fragment]) if encapsulated else fragment
+    return frame
+
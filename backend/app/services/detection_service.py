@@ -0,0 +1,251 @@
+"""
+Detection results: loading, saving and single-flight detection.
+
+Detection results are stored as ``<file_id>_detection.json`` next to the
+converted PNG. With several workers, concurrent requests for the same image
+may land in different processes; ``detect`` serializes them on a file lock so
+the upstream model is called once and the other requests reuse its result.
+
+The stored results are the raw predictions, fetched at a low confidence floor
+and without upstream NMS. Confidence filtering and NMS are applied locally
+per request (``apply_thresholds``), so changing thresholds never needs
+another upstream call.
+
+With ``DUPLICATE_REUSE_RESULTS`` enabled, an image that is a near-duplicate
+(by perceptual hash) of an already analysed one reuses its predictions,
+rescaled to the new image size, instead of calling the model again.
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import (
+    ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP, ROBOFLOW_CONFIDENCE_FLOOR, ROBOFLOW_FETCH_OVERLAP,
+    PHASH_SIMILARITY_THRESHOLD, DUPLICATE_REUSE_RESULTS
+)
+from app.services import roboflow_service
+from app.services.artifact_cache import artifact_cache, DETECTION
+from app.services.findings_index import findings_index
+from app.services.scheduler import upstream_slots
+from app.services.similarity_index import similarity_index
+from app.services.storage_backend import get_storage, processed_key
+from app.utils.lazy import lazy_import
+from app.utils.locks import atomic_write, file_lock
+from app.utils.metrics import counter
+from app.utils.nms import suppress_predictions
+from app.utils.perceptual_hash import max_distance
+from app.utils.serialization import encode_json_artifact, decode_json_artifact
+
+Image = lazy_import("PIL.Image")
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Thresholds the stored raw predictions were fetched with
+FETCH_THRESHOLDS_KEY = "fetch_thresholds"
+
+# Set on results copied from a near-duplicate image
+REUSED_FROM_KEY = "reused_from"
+
+DUPLICATE_REUSE_TOTAL = counter(
+    "dental_duplicate_reuse_total",
+    "Detections served from a near-duplicate image instead of the model"
+)
+
+
+def load_detection_results(file_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load saved detection results, served from the artifact cache when hot
+
+    Args:
+        file_id: Unique identifier for the file
+
+    Returns:
+        Detection results, or None if the image has not been analysed yet
+    """
+    def load():
+        detection_path = get_storage().fetch(processed_key(f"{file_id}_detection.json"))
+        if detection_path is None:
+            return None
+        with open(detection_path, "rb") as f:
+            data = f.read()
+        return decode_json_artifact(data), len(data)
+
+    return artifact_cache.get_or_load(file_id, DETECTION, load)
+
+
+def save_detection_results(file_id: str, detection_results: Dict[str, Any]) -> None:
+    """
+    Persist detection results and refresh the cached copy and the findings index
+
+    Args:
+        file_id: Unique identifier for the file
+        detection_results: Parsed detection response
+    """
+    storage = get_storage()
+    detection_key = processed_key(f"{file_id}_detection.json")
+    data = encode_json_artifact(detection_results)
+    atomic_write(storage.local_path(detection_key), data)
+    storage.publish(detection_key)
+    artifact_cache.put(file_id, DETECTION, detection_results, len(data))
+    # The index is derived data: a failure here never fails detection
+    try:
+        findings_index.index_results(file_id, detection_results)
+    except Exception as e:
+        logger.warning(f"Could not index findings of {file_id}: {str(e)}")
+
+
+def fetch_thresholds(detection_results: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Thresholds stored results were fetched with. Results saved before raw
+    predictions were stored used the default thresholds.
+    """
+    return detection_results.get(
+        FETCH_THRESHOLDS_KEY, {"confidence": ROBOFLOW_CONFIDENCE, "overlap": ROBOFLOW_OVERLAP}
+    )
+
+
+def _covers(detection_results: Optional[Dict[str, Any]], confidence: float) -> bool:
+    # Thresholds below the floor are served from the floor results
+    required = max(confidence, ROBOFLOW_CONFIDENCE_FLOOR)
+    return detection_results is not None and fetch_thresholds(detection_results)["confidence"] <= required
+
+
+def detect(
+    file_id: str,
+    png_path: Path,
+    confidence: float = ROBOFLOW_CONFIDENCE,
+    force: bool = False
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Return raw detection results for an image, calling the detection model at
+    most once per image across all workers
+
+    Args:
+        file_id: Unique identifier for the file
+        png_path: Path to the converted PNG
+        confidence: Confidence threshold (0-100) the caller will apply; stored
+            results fetched at a higher threshold are fetched again
+        force: Fetch again even if stored results exist (e.g. after a model change)
+
+    Returns:
+        Tuple of (raw detection results, whether they were already available)
+    """
+    detection_results = load_detection_results(file_id)
+    if not force and _covers(detection_results, confidence):
+        return detection_results, True
+
+    # Take the upstream slot before the per-file lock: the lock holder then
+    # never waits behind lower-priority work, so an interactive request for
+    # the same image is not stuck behind a speculative one queued for a slot
+    with upstream_slots.slot(), file_lock(f"detect-{file_id}"):
+        # Another request may have finished while we waited for the lock
+        detection_results = load_detection_results(file_id)
+        if not force and _covers(detection_results, confidence):
+            return detection_results, True
+
+        if DUPLICATE_REUSE_RESULTS and not force:
+            detection_results = reuse_near_duplicate(file_id, png_path, confidence)
+            if detection_results is not None:
+                return detection_results, True
+
+        # Fetched at ROBOFLOW_CONFIDENCE_FLOOR without upstream NMS
+        detection_results = dict(roboflow_service.call_roboflow_api(str(png_path)))
+        detection_results[FETCH_THRESHOLDS_KEY] = {
+            "confidence": ROBOFLOW_CONFIDENCE_FLOOR, "overlap": ROBOFLOW_FETCH_OVERLAP
+        }
+        save_detection_results(file_id, detection_results)
+        return detection_results, False
+
+
+def find_near_duplicates(file_id: str, threshold: float = PHASH_SIMILARITY_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Other images whose perceptual hash is at least `threshold` similar
+
+    Args:
+        file_id: Unique identifier for the file
+        threshold: Minimum fraction of matching hash bits (0-1)
+
+    Returns:
+        Matches with file_id, distance and similarity, nearest first
+    """
+    value = similarity_index.hash_of(file_id)
+    if value is None:
+        return []
+    return similarity_index.find_similar(value, max_distance(threshold), exclude=file_id)
+
+
+def reuse_near_duplicate(file_id: str, png_path: Path, confidence: float = ROBOFLOW_CONFIDENCE) -> Optional[Dict[str, Any]]:
+    """
+    Copy the detection results of the nearest analysed near-duplicate
+
+    Returns:
+        The saved results, or None if no near-duplicate has usable results
+    """
+    for match in find_near_duplicates(file_id):
+        source_results = load_detection_results(match["file_id"])
+        if not _covers(source_results, confidence):
+            continue
+        detection_results = _rescale_predictions(source_results, png_path)
+        detection_results[REUSED_FROM_KEY] = {"file_id": match["file_id"], "similarity": match["similarity"]}
+        save_detection_results(file_id, detection_results)
+        DUPLICATE_REUSE_TOTAL.inc()
+        logger.info(f"Reused detection results of {match['file_id']} for near-duplicate {file_id}")
+        return detection_results
+    return None
+
+
+def _rescale_predictions(detection_results: Dict[str, Any], png_path: Path) -> Dict[str, Any]:
+    # Re-exports may differ in resolution; boxes are in pixels of the source image
+    rescaled = dict(detection_results)
+    source_size = detection_results.get("image") or {}
+    with Image.open(png_path) as image:
+        width, height = image.size
+    if not source_size.get("width") or not source_size.get("height"):
+        return rescaled
+
+    scale_x = width / source_size["width"]
+    scale_y = height / source_size["height"]
+    rescaled["image"] = dict(source_size, width=width, height=height)
+    rescaled["predictions"] = [
+        dict(
+            prediction,
+            x=prediction["x"] * scale_x,
+            y=prediction["y"] * scale_y,
+            width=prediction["width"] * scale_x,
+            height=prediction["height"] * scale_y
+        )
+        for prediction in detection_results.get("predictions", [])
+    ]
+    return rescaled
+
+
+def apply_thresholds(
+    detection_results: Dict[str, Any],
+    confidence: float = ROBOFLOW_CONFIDENCE,
+    overlap: float = ROBOFLOW_OVERLAP
+) -> Dict[str, Any]:
+    """
+    Filter raw predictions by confidence and apply per-class NMS
+
+    Args:
+        detection_results: Raw detection results
+        confidence: Minimum confidence (0-100)
+        overlap: Boxes of the same class overlapping a higher-scoring box by
+            more than this IoU (0-100) are dropped
+
+    Returns:
+        A copy of the results with the filtered predictions and the applied thresholds
+    """
+    predictions = [
+        prediction for prediction in detection_results.get("predictions", [])
+        if prediction.get("confidence", 0) * 100 >= confidence
+    ]
+
+    predictions = suppress_predictions(predictions, overlap / 100)
+
+    filtered = {key: value for key, value in detection_results.items() if key != FETCH_THRESHOLDS_KEY}
+    filtered["predictions"] = predictions
+    filtered["thresholds"] = {"confidence": confidence, "overlap": overlap}
+    return filtered
@@ -1,18 +1,44 @@
-import pydicom
-import numpy as np
-from PIL import Image
 import os
+import functools
 import logging
+import threading
 from pathlib import Path
 import traceback
 import base64
 import io
+import json
 
-from app.core.config import PROCESSED_DIR
+from typing import Optional, Tuple
+
+from app.services.storage_backend import get_storage, upload_key, processed_key
+from app.services.artifact_cache import artifact_cache, PNG, RENDER, CROP
+from app.services.decoders import decode_first_frame
+from app.services.scheduler import conversion_slots
+from app.services.similarity_index import index_image
+from app.utils.lazy import lazy_import
+from app.utils.locks import file_lock
+from app.utils.metrics import observe_stage, FALLBACK_TOTAL, CONVERSIONS_TOTAL
+
+# Imported on first conversion, to keep them off the cold-start path
+pydicom = lazy_import("pydicom")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
+# Bump when conversion output changes (normalization, windowing) so that
+# backfill.py reconverts existing uploads
+CONVERSION_VERSION = 2
+
+def source_keys(file_id: str) -> Tuple[str, str]:
+    """
+    Storage keys of the decoded pixels kept for window/level rendering:
+    (.npy pixel array, .json metadata). Like other variants they are evicted
+    before PNGs and regenerated from the DICOM.
+    """
+    return processed_key(f"{file_id}_variant_source.npy"), processed_key(f"{file_id}_variant_source.json")
+
 def convert_dicom_to_png(dicom_path: str, unique_id: str) -> str:
     """
     Convert DICOM file to PNG for visualization with multiple fallback methods
@@ -27,8 +53,21 @@ def convert_dicom_to_png(dicom_path: str, unique_id: str) -> str:
     Raises:
         Exception: If all conversion methods fail
     """
+    # Waits behind conversions of higher priority (see app.services.scheduler)
+    with conversion_slots.slot():
+        return _convert_dicom_to_png(dicom_path, unique_id)
+
+def _convert_dicom_to_png(dicom_path: str, unique_id: str) -> str:
     # Create the output path
-    png_path = PROCESSED_DIR / f"{unique_id}.png"
+    storage = get_storage()
+    png_key = processed_key(f"{unique_id}.png")
+    png_path = storage.local_path(png_key)
+    # Write next to the target and rename, so other workers never read a partial PNG
+    temp_path = png_path.with_name(f".{unique_id}.{os.getpid()}.{threading.get_ident()}.tmp.png")
+    # Decoded pixels and their metadata, written alongside for window/level rendering
+    source_key, metadata_key = source_keys(unique_id)
+    temp_source = temp_path.with_suffix(".npy")
+    temp_metadata = temp_path.with_suffix(".json")
     
     # Try multiple methods to convert the DICOM to PNG
     methods = [
@@ -41,55 +80,179 @@ def convert_dicom_to_png(dicom_path: str, unique_id: str) -> str:
     for method in methods:
         try:
             logger.info(f"Attempting DICOM conversion using {method.__name__}")
-            method(dicom_path, png_path)
+            pixels = method(dicom_path, temp_path, temp_source)
+            os.replace(temp_path, png_path)
+            publish_source(temp_source, temp_metadata, source_key, metadata_key)
             logger.info(f"Successfully converted DICOM using {method.__name__}")
+            CONVERSIONS_TOTAL.inc(method=method.__name__)
+            if method is create_sample_image:
+                FALLBACK_TOTAL.inc()
+            storage.publish(png_key)
+            artifact_cache.invalidate(unique_id, PNG)
+            artifact_cache.invalidate(unique_id, RENDER)
+            artifact_cache.invalidate(unique_id, CROP)
+            if pixels is not None:
+                # The synthetic fallback returns no pixels and is never indexed
+                index_image(unique_id, pixels)
             return str(png_path)
         except Exception as e:
             logger.warning(f"Method {method.__name__} failed: {str(e)}")
             last_exception = e
             continue
+        finally:
+            for path in (temp_path, temp_source, temp_metadata):
+                if path.exists():
+                    os.remove(path)
     
     # If we get here, all methods failed
     error_message = f"All DICOM conversion methods failed. Last error: {str(last_exception)}"
     logger.error(error_message)
     raise Exception(error_message)
 
-def convert_using_pydicom_direct(dicom_path: str, output_path: Path) -> None:
+def find_upload_path(file_id: str) -> Optional[Path]:
     """
-    Convert DICOM to PNG using direct pixel access
+    Find the original uploaded DICOM file for a file ID
+    
+    Args:
+        file_id: Unique identifier for the file
+        
+    Returns:
+        Path to the uploaded file, or None if it does not exist
     """
-    # Read DICOM file
-    dicom = pydicom.dcmread(dicom_path)
+    storage = get_storage()
+    for extension in (".dcm", ".rvg"):
+        path = storage.fetch(upload_key(f"{file_id}{extension}"))
+        if path is not None:
+            return path
+    return None
+
+def ensure_png(file_id: str) -> Optional[Path]:
+    """
+    Return the converted PNG for a file ID, regenerating it from the uploaded
+    DICOM if it has been evicted from disk
     
-    # Convert to numpy array
-    img_array = dicom.pixel_array
+    Args:
+        file_id: Unique identifier for the file
+        
+    Returns:
+        Path to the PNG file, or None if neither the PNG nor the DICOM exists
+    """
+    png_path = get_storage().fetch(processed_key(f"{file_id}.png"))
+    if png_path is not None:
+        return png_path
     
-    # Normalize pixel values
-    img_array = img_array / img_array.max() * 255 if img_array.max() > 0 else img_array
-    img_array = img_array.astype(np.uint8)
+    upload_path = find_upload_path(file_id)
+    if upload_path is None:
+        return None
     
-    # Create PIL Image
-    img = Image.fromarray(img_array)
+    # Only one worker regenerates a given PNG; the others wait and reuse it
+    with file_lock(f"convert-{file_id}"):
+        png_path = get_storage().fetch(processed_key(f"{file_id}.png"))
+        if png_path is not None:
+            return png_path
+        logger.info(f"Regenerating evicted PNG for {file_id}")
+        return Path(convert_dicom_to_png(str(upload_path), file_id))
+
+def save_source(dicom, img_array: "np.ndarray", output_path: Path) -> None:
+    """
+    Keep the decoded pixels at their original bit depth for window/level
+    rendering: the array as .npy (memory-mapped when rendering) and the
+    metadata needed to build a LUT as .json next to it. Color images only
+    get metadata marking them as not renderable.
     
-    # Save as PNG
-    img.save(output_path)
+    Args:
+        dicom: The parsed dataset
+        img_array: Decoded pixels of the first frame
+        output_path: Where to write the .npy file
+    """
+    metadata = {"renderable": img_array.ndim == 2}
+    if metadata["renderable"]:
+        slope = float(getattr(dicom, "RescaleSlope", 1) or 1)
+        intercept = float(getattr(dicom, "RescaleIntercept", 0) or 0)
+        # Value range in modality units; percentiles estimated on a subsample
+        extremes = sorted([float(img_array.min()) * slope + intercept, float(img_array.max()) * slope + intercept])
+        low, high = np.percentile(img_array[::4, ::4].astype(np.float64) * slope + intercept, [1, 99])
+        window = None
+        if hasattr(dicom, "WindowCenter") and hasattr(dicom, "WindowWidth"):
+            center, width = dicom.WindowCenter, dicom.WindowWidth
+            if isinstance(center, pydicom.multival.MultiValue):
+                center = center[0]
+            if isinstance(width, pydicom.multival.MultiValue):
+                width = width[0]
+            window = [float(center), float(width)]
+        metadata.update({
+            "slope": slope,
+            "intercept": intercept,
+            "invert": str(getattr(dicom, "PhotometricInterpretation", "")) == "MONOCHROME1",
+            "window": window,
+            "range": extremes,
+            "percentiles": [float(low), float(high)]
+        })
+        np.save(output_path, np.ascontiguousarray(img_array))
+    output_path.with_suffix(".json").write_text(json.dumps(metadata))
 
-def convert_using_pydicom_with_rescaling(dicom_path: str, output_path: Path) -> None:
+def publish_source(temp_source: Path, temp_metadata: Path, source_key: str, metadata_key: str) -> None:
     """
-    Convert DICOM to PNG with explicit rescaling to handle different bit depths
+    Move freshly written pixels and metadata into place (pixels first, so
+    readers that find the new metadata also find the new pixels)
+    """
+    storage = get_storage()
+    if temp_source.exists():
+        os.replace(temp_source, storage.local_path(source_key))
+        storage.publish(source_key)
+    elif storage.exists(source_key):
+        storage.delete(source_key)
+    if temp_metadata.exists():
+        os.replace(temp_metadata, storage.local_path(metadata_key))
+        storage.publish(metadata_key)
+
+def convert_using_pydicom_direct(
+    dicom_path: str, output_path: Path, source_path: Optional[Path] = None
+) -> "np.ndarray":
+    """
+    Convert DICOM to PNG using direct pixel access
+    
+    Args:
+        dicom_path: Path to the DICOM file
+        output_path: Where to write the PNG
+        source_path: Where to keep the decoded pixels (see save_source), if anywhere
+    
+    Returns:
+        The normalized 8-bit pixels written to the PNG
     """
     # Read DICOM file
-    dicom = pydicom.dcmread(dicom_path)
+    with observe_stage("dicom_parse"):
+        dicom = pydicom.dcmread(dicom_path)
     
-    # Get bit depth information
-    try:
-        bits_stored = dicom.BitsStored
-    except AttributeError:
-        bits_stored = 8  # Default to 8 bits if not specified
+    # Convert to numpy array (only the first frame is converted)
+    with observe_stage("pixel_decode"):
+        img_array = decode_first_frame(dicom)
+    
+    if source_path is not None:
+        with observe_stage("source_write"):
+            save_source(dicom, img_array, source_path)
     
-    # Convert to numpy array
-    img_array = dicom.pixel_array
+    # Normalize pixel values
+    with observe_stage("normalization"):
+        img_array = normalize_to_max(img_array)
+    
+    with observe_stage("encode"):
+        encode_png(img_array, output_path)
     
+    return img_array
+
+def normalize_to_max(img_array: "np.ndarray") -> "np.ndarray":
+    """
+    Scale pixels so the brightest one is 255 (the direct conversion)
+    """
+    img_array = img_array / img_array.max() * 255 if img_array.max() > 0 else img_array
+    return img_array.astype(np.uint8)
+
+def normalize_windowed(dicom, img_array: "np.ndarray") -> "np.ndarray":
+    """
+    Apply the stored window, if any, then stretch to the full 8-bit range
+    (the rescaling conversion)
+    """
     # Apply windowing if available
     if hasattr(dicom, 'WindowCenter') and hasattr(dicom, 'WindowWidth'):
         center = dicom.WindowCenter
@@ -104,68 +267,102 @@ def convert_using_pydicom_with_rescaling(dicom_path: str, output_path: Path) ->
         img_max = center + width // 2
         img_array = np.clip(img_array, img_min, img_max)
     
-    # Rescale based on bit depth
-    max_possible_value = (2 ** bits_stored) - 1
     img_array = ((img_array - img_array.min()) / ((img_array.max() - img_array.min()) or 1)) * 255
     
     # Convert to 8-bit for PNG
-    img_array = img_array.astype(np.uint8)
+    return img_array.astype(np.uint8)
+
+def encode_png(img_array: "np.ndarray", output) -> None:
+    """
+    Encode 8-bit pixels as PNG to a path or file object
+    """
+    Image.fromarray(img_array).save(output, format="PNG")
+
+def convert_using_pydicom_with_rescaling(
+    dicom_path: str, output_path: Path, source_path: Optional[Path] = None
+) -> "np.ndarray":
+    """
+    Convert DICOM to PNG with explicit rescaling to handle different bit depths
     
-    # Create PIL Image
-    img = Image.fromarray(img_array)
+    Args:
+        dicom_path: Path to the DICOM file
+        output_path: Where to write the PNG
+        source_path: Where to keep the decoded pixels (see save_source), if anywhere
     
-    # Save as PNG
-    img.save(output_path)
-
-def create_sample_image(dicom_path: str, output_path: Path) -> None:
+    Returns:
+        The normalized 8-bit pixels written to the PNG
     """
-    Create a sample dental X-ray image as a last resort fallback
-    (This is used when all other methods fail)
+    # Read DICOM file
+    with observe_stage("dicom_parse"):
+        dicom = pydicom.dcmread(dicom_path)
+    
+    # Convert to numpy array (only the first frame is converted)
+    with observe_stage("pixel_decode"):
+        img_array = decode_first_frame(dicom)
+    
+    if source_path is not None:
+        with observe_stage("source_write"):
+            save_source(dicom, img_array, source_path)
+    
+    with observe_stage("normalization"):
+        img_array = normalize_windowed(dicom, img_array)
+    
+    with observe_stage("encode"):
+        encode_png(img_array, output_path)
+    
+    return img_array
+
+def render_sample_image(width: int = 800, height: int = 600, teeth: int = 10, seed: int = 42) -> "np.ndarray":
     """
-    # Create a simple grayscale gradient image as a fallback
-    width, height = 800, 600
-    
-    # Create a simple gradient image
-    gradient = np.zeros((height, width), dtype=np.uint8)
-    for y in range(height):
-        for x in range(width):
-            # Create a radial gradient pattern
-            cx, cy = width // 2, height // 2
-            distance = np.sqrt((x - cx) ** 2 + (y - cy) ** 2)
-            value = int(255 * (1 - min(1, distance / max(width, height) * 1.5)))
-            gradient[y, x] = value
-    
-    # Add some tooth-like structures
-    for i in range(10):
-        x = (i + 1) * width // 12
-        top = height // 3
-        bottom = 2 * height // 3
-        tooth_width = width // 15
-        
-        # Draw a tooth-like shape
-        for y in range(top, bottom):
-            for dx in range(-tooth_width // 2, tooth_width // 2):
-                if 0 <= x + dx < width:
-                    gradient[y, x + dx] = min(255, gradient[y, x + dx] + 50)
-    
-    # Create some random artifacts that look like dental pathologies
-    import random
-    random.seed(42)  # For reproducibility
-    
-    # Add 3-5 random dark spots (potential pathologies)
-    for _ in range(random.randint(3, 5)):
-        spot_x = random.randint(width // 4, 3 * width // 4)
-        spot_y = random.randint(height // 3, 2 * height // 3)
-        spot_radius = random.randint(5, 15)
+    Render a synthetic dental X-ray: a radial gradient with tooth-like bands
+    and a few dark spots that look like pathologies
+    
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        teeth: Number of tooth-like bands
+        seed: Seed for the placement of the dark spots
         
-        for y in range(max(0, spot_y - spot_radius), min(height, spot_y + spot_radius)):
-            for x in range(max(0, spot_x - spot_radius), min(width, spot_x + spot_radius)):
-                if (x - spot_x) ** 2 + (y - spot_y) ** 2 <= spot_radius ** 2:
-                    # Make darker spots
-                    gradient[y, x] = max(0, gradient[y, x] - random.randint(50, 150))
+    Returns:
+        Grayscale image as a uint8 array of shape (height, width)
+    """
+    ys = np.arange(height, dtype=np.float32)[:, None]
+    xs = np.arange(width, dtype=np.float32)[None, :]
+    
+    # Radial gradient
+    distance = np.sqrt((xs - width // 2) ** 2 + (ys - height // 2) ** 2)
+    image = (255 * (1 - np.minimum(1, distance / max(width, height) * 1.5))).astype(np.int16)
     
-    # Create PIL Image
-    img = Image.fromarray(gradient)
+    # Tooth-like structures
+    top, bottom = height // 3, 2 * height // 3
+    tooth_width = width // 15
+    for i in range(teeth):
+        x = (i + 1) * width // (teeth + 2)
+        left, right = max(0, x - tooth_width // 2), min(width, x + tooth_width // 2)
+        image[top:bottom, left:right] += 50
+    np.minimum(image, 255, out=image)
+    
+    # Random dark spots (potential pathologies)
+    rng = np.random.default_rng(seed)
+    for _ in range(rng.integers(3, 6)):
+        spot_x = rng.integers(width // 4, 3 * width // 4 + 1)
+        spot_y = rng.integers(height // 3, 2 * height // 3 + 1)
+        spot_radius = rng.integers(5, 16)
+        y0, y1 = max(0, spot_y - spot_radius), min(height, spot_y + spot_radius)
+        x0, x1 = max(0, spot_x - spot_radius), min(width, spot_x + spot_radius)
+        window = image[y0:y1, x0:x1]
+        inside = (xs[:, x0:x1] - spot_x) ** 2 + (ys[y0:y1] - spot_y) ** 2 <= spot_radius ** 2
+        darkening = rng.integers(50, 151, size=window.shape)
+        window[inside] = np.maximum(0, window[inside] - darkening[inside])
+    
+    return image.astype(np.uint8)
+
+@functools.lru_cache(maxsize=4)
+def _encode_sample_image(width: int = 800, height: int = 600, seed: int = 42) -> bytes:
+    """
+    Render and PNG-encode the labelled sample image (memoized per process)
+    """
+    img = Image.fromarray(render_sample_image(width, height, seed=seed))
     
     # Add text indicating this is a sample
     from PIL import ImageDraw, ImageFont
@@ -179,5 +376,54 @@ def create_sample_image(dicom_path: str, output_path: Path) -> None:
         
     draw.text((10, 10), "Sample X-ray (Conversion Fallback)", fill=255, font=font)
     
-    # Save as PNG
-    img.save(output_path)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def create_sample_image(dicom_path: str, output_path: Path, source_path: Optional[Path] = None) -> None:
+    """
+    Create a sample dental X-ray image as a last resort fallback
+    (This is used when all other methods fail)
+    
+    The image is rendered and encoded once per process; later fallbacks only
+    copy the encoded bytes into place. There are no pixels to render with
+    another window, so the source metadata only marks the image as not renderable.
+    """
+    with open(output_path, "wb") as f:
+        f.write(_encode_sample_image())
+    if source_path is not None:
+        source_path.with_suffix(".json").write_text(json.dumps({"renderable": False}))
+
+def create_synthetic_dicom(output_path: Path, rows: int = 64, columns: int = 64) -> None:
+    """
+    Write a small uncompressed 12-bit grayscale DICOM image (used for
+    warm-up and tests)
+    
+    Args:
+        output_path: Where to write the file
+        rows: Image height in pixels
+        columns: Image width in pixels
+    """
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+    
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    
+    dataset = Dataset()
+    dataset.file_meta = file_meta
+    dataset.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    dataset.Modality = "IO"
+    dataset.Rows, dataset.Columns = rows, columns
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.BitsAllocated = 16
+    dataset.BitsStored = 12
+    dataset.HighBit = 11
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = (np.arange(rows * columns, dtype=np.uint16) % 4096).tobytes()
+    
+    dataset.save_as(output_path, write_like_original=False)
@@ -0,0 +1,144 @@
+"""
+Cheap validation of DICOM uploads.
+
+Runs before an upload is persisted or decoded:
+
+1. The first chunk must carry the 128-byte preamble followed by ``DICM``
+   (or, for legacy files without a preamble, start with a group 0008 tag).
+2. The header is parsed without reading the pixel data.
+3. The transfer syntax must be decodable by an available pixel handler, and
+   the dataset must contain pixel data with non-zero dimensions.
+"""
+
+import logging
+from typing import Any, BinaryIO, Dict
+
+from app.services.decoders import is_transfer_syntax_supported, UNCOMPRESSED_TRANSFER_SYNTAXES
+from app.utils.lazy import lazy_import
+from app.utils.metrics import counter, observe_stage
+
+pydicom = lazy_import("pydicom")
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+PREAMBLE_LENGTH = 128
+DICM_MAGIC = b"DICM"
+
+# Bytes needed to sniff the preamble
+SNIFF_BYTES = PREAMBLE_LENGTH + len(DICM_MAGIC)
+
+# Legacy files without preamble start with an Identifying group (0008) tag
+LEGACY_GROUP_PREFIXES = (b"\x08\x00", b"\x00\x08")
+
+# Pixel data elements: (7FE0,0008) float, (7FE0,0009) double float, (7FE0,0010)
+PIXEL_DATA_ELEMENTS = {0x0008, 0x0009, 0x0010}
+PIXEL_DATA_GROUP = 0x7FE0
+
+UPLOADS_REJECTED_TOTAL = counter(
+    "dental_uploads_rejected_total",
+    "Uploads rejected by DICOM validation",
+    ["reason"]
+)
+
+
+class DicomValidationError(Exception):
+    """
+    Raised when an upload is not a decodable DICOM image
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def check_preamble(head: bytes) -> bool:
+    """
+    Check the first bytes of a file for a DICOM preamble
+
+    Args:
+        head: At least the first SNIFF_BYTES bytes of the file (fewer only if the file is shorter)
+
+    Returns:
+        True if the file has a preamble, False for a legacy file without one
+
+    Raises:
+        DicomValidationError: If the bytes cannot be the start of a DICOM file
+    """
+    if head[PREAMBLE_LENGTH:SNIFF_BYTES] == DICM_MAGIC:
+        return True
+    if head[:2] in LEGACY_GROUP_PREFIXES:
+        return False
+    raise DicomValidationError("magic", "Missing DICOM preamble and DICM prefix")
+
+
+def validate_dicom(fileobj: BinaryIO) -> Dict[str, Any]:
+    """
+    Validate a DICOM file from its first chunk and header only. The file
+    position is restored to the start afterwards.
+
+    Args:
+        fileobj: Seekable binary file object positioned at the start of the file
+
+    Returns:
+        Header summary: transfer_syntax, rows, columns, frames, compressed
+
+    Raises:
+        DicomValidationError: If the file is not a decodable DICOM image
+    """
+    try:
+        with observe_stage("upload_validate"):
+            return _validate(fileobj)
+    except DicomValidationError as e:
+        UPLOADS_REJECTED_TOTAL.inc(reason=e.reason)
+        raise
+    finally:
+        fileobj.seek(0)
+
+
+def _validate(fileobj: BinaryIO) -> Dict[str, Any]:
+    start = fileobj.tell()
+    has_preamble = check_preamble(fileobj.read(SNIFF_BYTES))
+    fileobj.seek(start)
+
+    try:
+        dataset = pydicom.dcmread(fileobj, stop_before_pixels=True, force=not has_preamble)
+    except Exception as e:
+        raise DicomValidationError("header", f"Unreadable DICOM header: {str(e)}")
+
+    file_meta = getattr(dataset, "file_meta", None)
+    transfer_syntax = getattr(file_meta, "TransferSyntaxUID", None) if file_meta is not None else None
+    if transfer_syntax is None:
+        # Files without meta information are Implicit VR Little Endian
+        transfer_syntax = "1.2.840.10008.1.2"
+    transfer_syntax = str(transfer_syntax)
+
+    if not is_transfer_syntax_supported(transfer_syntax):
+        raise DicomValidationError("transfer_syntax", f"Unsupported transfer syntax {transfer_syntax}")
+
+    # Header parsing stops right before the pixel data element, if there is one
+    if transfer_syntax != "1.2.840.10008.1.2.1.99" and not _at_pixel_data(fileobj, dataset.is_little_endian):
+        raise DicomValidationError("pixel_data", "File contains no pixel data")
+
+    rows = int(getattr(dataset, "Rows", 0) or 0)
+    columns = int(getattr(dataset, "Columns", 0) or 0)
+    if rows <= 0 or columns <= 0:
+        raise DicomValidationError("dimensions", "Image has no rows or columns")
+
+    return {
+        "transfer_syntax": transfer_syntax,
+        "rows": rows,
+        "columns": columns,
+        "frames": int(getattr(dataset, "NumberOfFrames", 1) or 1),
+        "compressed": transfer_syntax not in UNCOMPRESSED_TRANSFER_SYNTAXES
+    }
+
+
+def _at_pixel_data(fileobj: BinaryIO, little_endian: bool) -> bool:
+    tag = fileobj.read(4)
+    if len(tag) < 4:
+        return False
+    byteorder = "little" if little_endian else "big"
+    group = int.from_bytes(tag[:2], byteorder)
+    element = int.from_bytes(tag[2:], byteorder)
+    return group == PIXEL_DATA_GROUP and element in PIXEL_DATA_ELEMENTS
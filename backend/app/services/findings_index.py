@@ -0,0 +1,323 @@
+"""
+Searchable index of detection findings across all studies.
+
+Every time detection results are saved, their predictions are written to a
+SQLite database (one row per finding: class, confidence, box, file id,
+detection time), replacing the previous rows of that file. Queries such as
+"caries above 80% confidence this month" and per-class counts are then
+answered from indexed tables instead of by loading every
+``_detection.json``.
+
+The index holds the predictions as ``/detect`` shows them: per-class NMS at
+``ROBOFLOW_OVERLAP`` is applied before inserting, while the confidence
+filter is part of the query (greedy NMS keeps the same boxes above any
+confidence, so filtering after it matches ``/detect``). Like the shared cache it lives in ``RUNTIME_DIR`` and uses WAL mode,
+so every worker reads and writes the same index. Results saved before the
+index existed are picked up by ``rebuild_from_storage`` at startup.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import FINDINGS_INDEX_PATH, PROCESSED_DIR, ROBOFLOW_OVERLAP
+from app.utils.metrics import observe_stage
+from app.utils.nms import suppress_predictions
+from app.utils.serialization import decode_json_artifact
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+DETECTION_SUFFIX = "_detection.json"
+
+# Bumped when the indexed rows change meaning; older indexes are cleared and
+# rebuilt from storage (2: predictions are indexed after NMS)
+INDEX_VERSION = 2
+
+# Sort keys exposed by the query API, mapped to columns
+SORT_COLUMNS = {
+    "confidence": "confidence",
+    "detected_at": "detected_at",
+    "class": "class",
+    "file_id": "file_id"
+}
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS studies ("
+    "file_id TEXT PRIMARY KEY, detected_at REAL NOT NULL, findings INTEGER NOT NULL, "
+    "image_width INTEGER, image_height INTEGER)",
+    "CREATE TABLE IF NOT EXISTS findings ("
+    "id INTEGER PRIMARY KEY, file_id TEXT NOT NULL, class TEXT NOT NULL, confidence REAL NOT NULL, "
+    "x REAL, y REAL, width REAL, height REAL, detected_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS findings_class_confidence ON findings (class, confidence)",
+    "CREATE INDEX IF NOT EXISTS findings_detected_at ON findings (detected_at)",
+    "CREATE INDEX IF NOT EXISTS findings_confidence ON findings (confidence)",
+    "CREATE INDEX IF NOT EXISTS findings_file_id ON findings (file_id)"
+]
+
+
+class FindingsIndex:
+    """
+    Findings of all analysed studies, stored in SQLite in WAL mode
+    """
+
+    def __init__(self, path: Path = FINDINGS_INDEX_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork (see shared_cache)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            _migrate(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def index_results(self, file_id: str, detection_results: Dict[str, Any], detected_at: Optional[float] = None) -> int:
+        """
+        Replace the findings of a study with those in its detection results
+
+        Returns:
+            Number of findings indexed
+        """
+        detected_at = time.time() if detected_at is None else detected_at
+        image = detection_results.get("image") or {}
+        predictions = suppress_predictions(detection_results.get("predictions", []), ROBOFLOW_OVERLAP / 100)
+        rows = [
+            (
+                file_id,
+                str(prediction.get("class", "")),
+                float(prediction.get("confidence", 0)),
+                prediction.get("x"),
+                prediction.get("y"),
+                prediction.get("width"),
+                prediction.get("height"),
+                detected_at
+            )
+            for prediction in predictions
+        ]
+        conn = self._connection()
+        with observe_stage("findings_index"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM findings WHERE file_id = ?", (file_id,))
+                conn.executemany(
+                    "INSERT INTO findings (file_id, class, confidence, x, y, width, height, detected_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO studies (file_id, detected_at, findings, image_width, image_height) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (file_id, detected_at, len(rows), image.get("width"), image.get("height"))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def remove(self, file_id: str) -> None:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM findings WHERE file_id = ?", (file_id,))
+        conn.execute("DELETE FROM studies WHERE file_id = ?", (file_id,))
+        conn.execute("COMMIT")
+
+    def is_indexed(self, file_id: str) -> bool:
+        row = self._connection().execute("SELECT 1 FROM studies WHERE file_id = ?", (file_id,)).fetchone()
+        return row is not None
+
+    def _filters(
+        self,
+        classes: Optional[Sequence[str]],
+        min_confidence: Optional[float],
+        max_confidence: Optional[float],
+        since: Optional[float],
+        until: Optional[float],
+        file_id: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        if classes:
+            clauses.append(f"class IN ({', '.join('?' for _ in classes)})")
+            params.extend(classes)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?")
+            params.append(min_confidence)
+        if max_confidence is not None:
+            clauses.append("confidence <= ?")
+            params.append(max_confidence)
+        if since is not None:
+            clauses.append("detected_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("detected_at < ?")
+            params.append(until)
+        if file_id is not None:
+            clauses.append("file_id = ?")
+            params.append(file_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(
+        self,
+        classes: Optional[Sequence[str]] = None,
+        min_confidence: Optional[float] = None,
+        max_confidence: Optional[float] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        file_id: Optional[str] = None,
+        sort: str = "confidence",
+        descending: bool = True,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Search findings
+
+        Args:
+            classes: Only these classes
+            min_confidence: Minimum confidence (0-1)
+            max_confidence: Maximum confidence (0-1)
+            since: Detected at or after this Unix time
+            until: Detected before this Unix time
+            file_id: Only this study
+            sort: One of SORT_COLUMNS
+            descending: Sort order
+            limit: Page size
+            offset: Number of findings to skip
+
+        Returns:
+            Dictionary with the total number of matches and the requested page
+        """
+        where, params = self._filters(classes, min_confidence, max_confidence, since, until, file_id)
+        order = f"{SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'}, id {'DESC' if descending else 'ASC'}"
+        conn = self._connection()
+        with observe_stage("findings_query"):
+            total = conn.execute(f"SELECT COUNT(*) FROM findings{where}", params).fetchone()[0]
+            rows = conn.execute(
+                "SELECT file_id, class, confidence, x, y, width, height, detected_at "
+                f"FROM findings{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "findings": [
+                {
+                    "file_id": row[0],
+                    "class": row[1],
+                    "confidence": row[2],
+                    "x": row[3],
+                    "y": row[4],
+                    "width": row[5],
+                    "height": row[6],
+                    "detected_at": row[7]
+                }
+                for row in rows
+            ]
+        }
+
+    def summary(
+        self,
+        min_confidence: Optional[float] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Finding and study counts per class
+        """
+        where, params = self._filters(None, min_confidence, None, since, until, None)
+        conn = self._connection()
+        with observe_stage("findings_query"):
+            rows = conn.execute(
+                "SELECT class, COUNT(*), COUNT(DISTINCT file_id), AVG(confidence), MAX(confidence) "
+                f"FROM findings{where} GROUP BY class ORDER BY COUNT(*) DESC",
+                params
+            ).fetchall()
+            studies = conn.execute(f"SELECT COUNT(DISTINCT file_id) FROM findings{where}", params).fetchone()[0]
+        return {
+            "studies_with_findings": studies,
+            "indexed_studies": conn.execute("SELECT COUNT(*) FROM studies").fetchone()[0],
+            "classes": [
+                {
+                    "class": row[0],
+                    "findings": row[1],
+                    "studies": row[2],
+                    "mean_confidence": round(row[3], 4),
+                    "max_confidence": round(row[4], 4)
+                }
+                for row in rows
+            ]
+        }
+
+    def rebuild_from_storage(self, directory: Path = PROCESSED_DIR) -> int:
+        """
+        Index saved detection results that are not in the index yet. The
+        file modification time stands in for the detection time.
+
+        Returns:
+            Number of studies indexed
+        """
+        indexed = 0
+        for path in _iter_detection_files(directory):
+            file_id = path.name[:-len(DETECTION_SUFFIX)]
+            if self.is_indexed(file_id):
+                continue
+            try:
+                detection_results = decode_json_artifact(path.read_bytes())
+                self.index_results(file_id, detection_results, detected_at=path.stat().st_mtime)
+                indexed += 1
+            except Exception as e:
+                logger.warning(f"Could not index findings of {file_id}: {str(e)}")
+        if indexed:
+            logger.info(f"Indexed findings of {indexed} previously analysed studies")
+        return indexed
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # Drop rows indexed by an older version; the startup catch-up re-indexes them
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= INDEX_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < INDEX_VERSION:
+            conn.execute("DELETE FROM findings")
+            conn.execute("DELETE FROM studies")
+            conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _iter_detection_files(directory: Path) -> Iterable[Path]:
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(DETECTION_SUFFIX) and entry.is_file():
+                    yield Path(entry.path)
+    except FileNotFoundError:
+        return
+
+
+# Shared instance updated by detection_service
+findings_index = FindingsIndex()
+
+
+def start_findings_catch_up() -> None:
+    """
+    Index results saved before the index existed, in a background thread
+    """
+    threading.Thread(target=findings_index.rebuild_from_storage, name="findings-index", daemon=True).start()
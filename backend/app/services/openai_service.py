@@ -1,13 +1,45 @@
 from typing import Dict, Any, List
-import openai
 import logging
+import threading
 
-from app.core.config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE
+from app.core.config import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE
 from app.services.mock_report_service import generate_mock_diagnostic_report
+from app.utils.lazy import lazy_import
+from app.utils.metrics import observe_stage, UPSTREAM_ERRORS_TOTAL
+
+# Imported on first use, to keep it off the cold-start path
+openai = lazy_import("openai")
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
+# Shared client; it keeps a pool of connections to the API
+_client = None
+_client_lock = threading.Lock()
+
+def is_configured() -> bool:
+    """
+    Whether a real OpenAI API key is configured
+    """
+    return bool(OPENAI_API_KEY) and OPENAI_API_KEY != 'your_openai_api_key'
+
+def get_client():
+    """
+    Return the shared OpenAI client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return _client
+
+def warm_up() -> None:
+    """
+    Open a pooled connection to the OpenAI API ahead of the first report
+    """
+    get_client().models.retrieve(OPENAI_MODEL, timeout=5)
+
 def generate_diagnostic_report(detection_results: Dict[str, Any]) -> str:
     """
     Generate a diagnostic report using OpenAI GPT or fallback to mock generator
@@ -19,14 +51,12 @@ def generate_diagnostic_report(detection_results: Dict[str, Any]) -> str:
         Generated diagnostic report
     """
     # Check if OpenAI API key is available
-    if not OPENAI_API_KEY or OPENAI_API_KEY == 'your_openai_api_key':
+    if not is_configured():
         logger.info("OpenAI API key not configured, using mock report generator")
         return generate_mock_diagnostic_report(detection_results)
     
     # If we have an API key, use OpenAI
     try:
-        openai.api_key = OPENAI_API_KEY
-        
         # Format the detected pathologies
         detected_items = detection_results.get("predictions", [])
         
@@ -50,16 +80,18 @@ def generate_diagnostic_report(detection_results: Dict[str, Any]) -> str:
         """
         
         # Call OpenAI API
-        response = openai.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "system", "content": prompt}],
-            max_tokens=OPENAI_MAX_TOKENS,
-            temperature=OPENAI_TEMPERATURE
-        )
+        with observe_stage("openai_call"):
+            response = get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[{"role": "system", "content": prompt}],
+                max_tokens=OPENAI_MAX_TOKENS,
+                temperature=OPENAI_TEMPERATURE
+            )
         
         # Extract the generated report
         report = response.choices[0].message.content.strip()
         return report
     except Exception as e:
+        UPSTREAM_ERRORS_TOTAL.inc(upstream="openai")
         logger.warning(f"Error using OpenAI API: {str(e)}. Falling back to mock report generator.")
         return generate_mock_diagnostic_report(detection_results)
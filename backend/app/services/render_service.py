@@ -0,0 +1,354 @@
+"""
+Window/level rendering from the decoded high-bit-depth pixels.
+
+The stored PNG is a single 8-bit rendering. Conversion also keeps the
+decoded pixels of the first frame as an ``.npy`` file with a small JSON of
+metadata (rescale, photometric interpretation, stored window, value range;
+see ``dicom_service.save_source``), so other windows can be rendered without
+re-decoding the DICOM:
+
+- pixels are memory-mapped, so only the pages a render touches are read
+- windowing is a table lookup: one 8-bit LUT per (pixel type, rescale,
+  window) covering every possible stored value, shared by all images with
+  the same parameters
+- for downscaled renders only about twice the output resolution is windowed
+- encoded renders are kept in the artifact cache, and the presets are
+  rendered right after upload so switching between them is a cache hit
+
+Crops of detected findings are cut from the same pixels, so reviewing a
+finding transfers a few kilobytes instead of the whole radiograph.
+"""
+
+import functools
+import io
+import json
+import logging
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import (
+    RENDER_LUT_CACHE_SIZE, RENDER_PNG_COMPRESS_LEVEL, RENDER_PRERENDER_PRESETS, RENDER_PRESET_SIZE, CROP_PADDING, CROP_SIZE
+)
+from app.services.artifact_cache import artifact_cache, RENDER, CROP
+from app.services.dicom_service import convert_dicom_to_png, ensure_png, find_upload_path, source_keys
+from app.services.scheduler import priority, BATCH
+from app.services.storage_backend import get_storage
+from app.utils.lazy import lazy_import
+from app.utils.locks import file_lock
+from app.utils.metrics import observe_stage
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# "default": the window stored in the DICOM, or the full range without one
+# "full": the full value range of the image
+# "contrast": the 1st to 99th percentile, which hides outliers (metal, burn-out)
+PRESETS = ("default", "full", "contrast")
+DEFAULT_PRESET = "default"
+
+# Pixel types windowed through a LUT (one entry per possible stored value)
+LUT_DTYPES = {"uint8", "int8", "uint16", "int16"}
+
+Box = Tuple[int, int, int, int]
+
+
+class NotRenderableError(Exception):
+    """
+    Raised for images without grayscale pixels to window (color images,
+    conversion fallbacks)
+    """
+
+
+def window_values(values: "np.ndarray", center: float, width: float, invert: bool = False) -> "np.ndarray":
+    """
+    Map modality values to 8 bits with the DICOM linear VOI function
+
+    Args:
+        values: Pixel values in modality units (after rescale slope/intercept)
+        center: Window center
+        width: Window width
+        invert: Invert the output (MONOCHROME1)
+
+    Returns:
+        uint8 array of the same shape
+    """
+    if width <= 1:
+        output = np.where(values > center - 0.5, 255.0, 0.0)
+    else:
+        output = np.clip(((values - (center - 0.5)) / (width - 1) + 0.5) * 255, 0, 255)
+    output = output.astype(np.uint8)
+    return 255 - output if invert else output
+
+
+@functools.lru_cache(maxsize=RENDER_LUT_CACHE_SIZE)
+def build_lut(dtype: str, slope: float, intercept: float, center: float, width: float, invert: bool) -> "np.ndarray":
+    """
+    LUT from every stored value of an integer pixel type to its windowed 8-bit value
+
+    The LUT is indexed with the pixels viewed as the unsigned type of the same
+    size, so signed values map to the upper half.
+    """
+    unsigned = np.dtype(dtype).str.replace("i", "u")
+    stored = np.arange(2 ** (8 * np.dtype(dtype).itemsize), dtype=unsigned).view(dtype)
+    lut = window_values(stored * slope + intercept, center, width, invert)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_window(pixels: "np.ndarray", metadata: Dict[str, Any], center: float, width: float) -> "np.ndarray":
+    """
+    Window stored pixel values to 8 bits
+    """
+    slope, intercept, invert = metadata["slope"], metadata["intercept"], metadata["invert"]
+    if pixels.dtype.name in LUT_DTYPES:
+        lut = build_lut(pixels.dtype.name, slope, intercept, center, width, invert)
+        return np.take(lut, pixels.view(pixels.dtype.str.replace("i", "u")))
+    # Wider or floating-point pixels: no LUT, compute directly
+    return window_values(pixels * slope + intercept, center, width, invert)
+
+
+def preset_window(metadata: Dict[str, Any], preset: str) -> Tuple[float, float]:
+    """
+    Window center and width of a preset for an image
+    """
+    if preset == "default" and metadata.get("window"):
+        center, width = metadata["window"]
+        return center, width
+    low, high = metadata["percentiles"] if preset == "contrast" else metadata["range"]
+    return (low + high) / 2, max(high - low, 1.0)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_metadata(path: str, mtime_ns: int) -> Dict[str, Any]:
+    # Keyed by modification time, so a reconverted image is read again
+    with open(path) as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=32)
+def _open_pixels(path: str, mtime_ns: int) -> "np.ndarray":
+    return np.load(path, mmap_mode="r")
+
+
+def _fetch_source(file_id: str) -> Optional[Tuple[Optional["np.ndarray"], Dict[str, Any]]]:
+    storage = get_storage()
+    source_key, metadata_key = source_keys(file_id)
+    metadata_path = storage.fetch(metadata_key)
+    if metadata_path is None:
+        return None
+    metadata = _read_metadata(str(metadata_path), metadata_path.stat().st_mtime_ns)
+    if not metadata["renderable"]:
+        return None, metadata
+    source_path = storage.fetch(source_key)
+    if source_path is None:
+        return None
+    return _open_pixels(str(source_path), source_path.stat().st_mtime_ns), metadata
+
+
+def load_source(file_id: str) -> Optional[Tuple[Optional["np.ndarray"], Dict[str, Any]]]:
+    """
+    Memory-mapped decoded pixels and metadata of an image, reconverting the
+    uploaded DICOM if they were evicted or predate this feature
+
+    Returns:
+        (pixels, metadata), with pixels None for images that cannot be
+        rendered, or None if the image does not exist
+    """
+    loaded = _fetch_source(file_id)
+    if loaded is not None:
+        return loaded
+
+    upload_path = find_upload_path(file_id)
+    if upload_path is None:
+        return None
+
+    # Only one worker reconverts a given image; the others wait and reuse it
+    with file_lock(f"convert-{file_id}"):
+        loaded = _fetch_source(file_id)
+        if loaded is None:
+            logger.info(f"Regenerating render source for {file_id}")
+            convert_dicom_to_png(str(upload_path), file_id)
+            loaded = _fetch_source(file_id)
+    return loaded
+
+
+def _encode(pixels: "np.ndarray", metadata: Dict[str, Any], center: float, width: float, size: Optional[int]) -> bytes:
+    if size:
+        # Window about twice the output resolution, then downscale smoothly
+        step = max(1, max(pixels.shape) // (2 * size))
+        pixels = pixels[::step, ::step]
+    image = Image.fromarray(apply_window(pixels, metadata, center, width))
+    if size:
+        image.thumbnail((size, size), Image.Resampling.BILINEAR)
+    return _encode_png(image)
+
+
+def _encode_png(image: "Image.Image") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=RENDER_PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+def render(
+    file_id: str,
+    center: Optional[float] = None,
+    width: Optional[float] = None,
+    preset: str = DEFAULT_PRESET,
+    size: Optional[int] = None
+) -> Optional[Tuple[bytes, float, float]]:
+    """
+    Render an image with a window/level as PNG
+
+    Args:
+        file_id: Unique identifier for the file
+        center: Window center in modality units; with width, overrides the preset
+        width: Window width in modality units
+        preset: One of PRESETS, used when no window is given
+        size: Longest side of the output, or None for full resolution
+
+    Returns:
+        (PNG bytes, window center, window width), or None if the image does not exist
+
+    Raises:
+        NotRenderableError: If the image has no grayscale pixels to window
+    """
+    loaded = load_source(file_id)
+    if loaded is None:
+        return None
+    pixels, metadata = loaded
+    if pixels is None:
+        raise NotRenderableError("Window/level rendering is not available for this image")
+
+    if center is None or width is None:
+        center, width = preset_window(metadata, preset)
+    center, width = round(center, 2), round(width, 2)
+    if size and size >= max(pixels.shape):
+        size = None
+
+    def load():
+        with observe_stage("render"):
+            content = _encode(pixels, metadata, center, width, size)
+        return content, len(content)
+
+    content = artifact_cache.get_or_load(file_id, f"{RENDER}:{center}:{width}:{size or 0}", load)
+    return content, center, width
+
+
+def crop_box(prediction: Dict[str, Any], image_size: Dict[str, Any], shape: Tuple[int, int], padding: float = CROP_PADDING) -> Box:
+    """
+    Pixel box of a prediction in an image, padded and clipped to the image
+
+    Args:
+        prediction: Roboflow prediction (box center x, y and width, height)
+        image_size: Size of the image the model saw ("width", "height"), if known
+        shape: (rows, columns) of the image to crop
+        padding: Added on each side, as a fraction of the box size
+
+    Returns:
+        (left, top, right, bottom), at least one pixel wide and high
+    """
+    rows, columns = shape
+    scale_x = columns / image_size["width"] if image_size.get("width") else 1.0
+    scale_y = rows / image_size["height"] if image_size.get("height") else 1.0
+    x, y = prediction["x"] * scale_x, prediction["y"] * scale_y
+    half_width = prediction["width"] * scale_x * (1 + 2 * padding) / 2
+    half_height = prediction["height"] * scale_y * (1 + 2 * padding) / 2
+    left = min(max(0, math.floor(x - half_width)), columns - 1)
+    top = min(max(0, math.floor(y - half_height)), rows - 1)
+    right = max(min(columns, math.ceil(x + half_width)), left + 1)
+    bottom = max(min(rows, math.ceil(y + half_height)), top + 1)
+    return left, top, right, bottom
+
+
+def _fit(image: "Image.Image", size: int) -> "Image.Image":
+    # Scale up small findings and down large ones, keeping the aspect ratio
+    scale = size / max(image.size)
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(target, Image.Resampling.LANCZOS) if target != image.size else image
+
+
+def render_crop(
+    file_id: str,
+    prediction: Dict[str, Any],
+    image_size: Dict[str, Any],
+    padding: float = CROP_PADDING,
+    size: int = CROP_SIZE,
+    center: Optional[float] = None,
+    width: Optional[float] = None,
+    preset: str = DEFAULT_PRESET
+) -> Optional[Tuple[bytes, Box, Optional[Tuple[float, float]]]]:
+    """
+    Crop a detected finding from the full-resolution pixels as PNG
+
+    Grayscale images are windowed like render(); color images and
+    conversion fallbacks are cropped from the converted PNG.
+
+    Args:
+        file_id: Unique identifier for the file
+        prediction: The prediction to crop
+        image_size: The "image" entry of the detection results
+        padding: Context added on each side, as a fraction of the box size
+        size: Longest side of the output
+        center: Window center in modality units; with width, overrides the preset
+        width: Window width in modality units
+        preset: One of PRESETS, used when no window is given
+
+    Returns:
+        (PNG bytes, crop box in image pixels, window or None), or None if the image does not exist
+    """
+    loaded = load_source(file_id)
+    if loaded is None:
+        return None
+    pixels, metadata = loaded
+
+    if pixels is None:
+        png_path = ensure_png(file_id)
+        if png_path is None:
+            return None
+        with Image.open(png_path) as image:
+            shape = (image.height, image.width)
+        box = crop_box(prediction, image_size, shape, padding)
+        window = None
+
+        def load():
+            with observe_stage("crop"), Image.open(png_path) as image:
+                content = _encode_png(_fit(image.crop(box), size))
+            return content, len(content)
+    else:
+        if center is None or width is None:
+            center, width = preset_window(metadata, preset)
+        window = (round(center, 2), round(width, 2))
+        box = crop_box(prediction, image_size, pixels.shape, padding)
+
+        def load():
+            left, top, right, bottom = box
+            with observe_stage("crop"):
+                region = apply_window(pixels[top:bottom, left:right], metadata, *window)
+                content = _encode_png(_fit(Image.fromarray(region), size))
+            return content, len(content)
+
+    # Keyed by what is cut out, so the entry stays valid when thresholds (and indices) change
+    kind = f"{CROP}:{','.join(map(str, box))}:{window[0] if window else ''}:{window[1] if window else ''}:{size}"
+    content = artifact_cache.get_or_load(file_id, kind, load)
+    return content, box, window
+
+
+def prerender_presets(file_id: str, presets: List[str] = RENDER_PRERENDER_PRESETS, size: int = RENDER_PRESET_SIZE) -> None:
+    """
+    Render the presets of a freshly converted image into the artifact cache,
+    so the first preset switches in the viewer are cache hits
+    """
+    # Yields to interactive conversions if the source has to be regenerated
+    with priority(BATCH):
+        for preset in presets:
+            try:
+                if render(file_id, preset=preset, size=size or None) is None:
+                    return
+            except NotRenderableError:
+                return
+            except Exception as e:
+                logger.warning(f"Pre-rendering {preset} for {file_id} failed: {str(e)}")
+                return
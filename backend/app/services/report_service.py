@@ -0,0 +1,81 @@
+"""
+Diagnostic reports: generation and reuse.
+
+Reports are stored as ``<file_id>_report.json`` together with a digest of the
+findings they were written from. A report is reused as long as the findings
+at the requested thresholds are unchanged, so a report generated ahead of
+time (see ``app.services.speculation``) is served without another upstream call,
+and so is the report of a near-duplicate image whose detections were reused.
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import openai_service
+from app.services.scheduler import upstream_slots
+from app.services.storage_backend import get_storage, processed_key
+from app.utils.locks import atomic_write
+from app.utils.serialization import dumps, encode_json_artifact, decode_json_artifact
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+def findings_digest(detection_results: Dict[str, Any]) -> str:
+    """
+    Digest of the predictions a report is written from
+    """
+    return hashlib.sha1(dumps(detection_results.get("predictions", []))).hexdigest()
+
+
+def load_report(file_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a saved report, or None if there is none
+    """
+    report_path = get_storage().fetch(processed_key(f"{file_id}_report.json"))
+    if report_path is None:
+        return None
+    with open(report_path, "rb") as f:
+        return decode_json_artifact(f.read())
+
+
+def save_report(file_id: str, report: str, digest: str) -> None:
+    """
+    Persist a report with the digest of its findings
+    """
+    storage = get_storage()
+    report_key = processed_key(f"{file_id}_report.json")
+    atomic_write(storage.local_path(report_key), encode_json_artifact({"report": report, "findings_digest": digest}))
+    storage.publish(report_key)
+
+
+def get_or_generate_report(file_id: str, detection_results: Dict[str, Any]) -> Tuple[str, bool]:
+    """
+    Return the report for filtered detection results, generating it only if
+    no report exists for the same findings
+
+    Args:
+        file_id: Unique identifier for the file
+        detection_results: Detection results after thresholds were applied
+
+    Returns:
+        Tuple of (report, whether it was already available)
+    """
+    digest = findings_digest(detection_results)
+    saved = load_report(file_id)
+    if saved is not None and saved.get("findings_digest") == digest:
+        return saved["report"], True
+
+    # Detections copied from a near-duplicate come with its report, if the findings match
+    reused_from = (detection_results.get("reused_from") or {}).get("file_id")
+    if reused_from is not None:
+        source = load_report(reused_from)
+        if source is not None and source.get("findings_digest") == digest:
+            save_report(file_id, source["report"], digest)
+            return source["report"], True
+
+    with upstream_slots.slot():
+        report = openai_service.generate_diagnostic_report(detection_results)
+    save_report(file_id, report, digest)
+    return report, False
@@ -0,0 +1,410 @@
+"""
+Resumable uploads (tus 1.0 style).
+
+A client creates a session with the total length, then sends the file in
+chunks with ``PATCH`` requests that carry the byte offset of the chunk. Each
+chunk is written in place into a preallocated part file, so chunks may arrive
+out of order or in parallel, and an interrupted transfer resumes from the
+offset reported by ``HEAD`` instead of starting over. A chunk may carry an
+``Upload-Checksum`` and is only acknowledged once it matches.
+
+Session state is a small JSON file next to the part file, updated under a
+file lock, so every gunicorn worker can serve every session. Once the whole
+file has arrived it is validated and handed to the regular conversion
+pipeline under the session id, which becomes the file id.
+
+Part files live outside the storage quota, so the lengths of all unfinished
+sessions together are capped by ``RESUMABLE_UPLOAD_MAX_RESERVED_BYTES``;
+a new session that would exceed it is refused until others finish or expire.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import (
+    RESUMABLE_UPLOAD_DIR, RESUMABLE_UPLOAD_MAX_BYTES, RESUMABLE_UPLOAD_TTL_SECONDS, RESUMABLE_UPLOAD_MAX_RESERVED_BYTES
+)
+from app.services.dicom_service import convert_dicom_to_png
+from app.services.dicom_validation import validate_dicom, check_preamble, DicomValidationError, SNIFF_BYTES
+from app.services.storage_backend import get_storage, upload_key
+from app.utils.locks import file_lock, atomic_write
+from app.utils.metrics import counter
+from app.utils.serialization import dumps, loads
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,checksum,termination,expiration"
+
+# Algorithm names as used in the Upload-Checksum header
+CHECKSUM_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256
+}
+
+ALLOWED_EXTENSIONS = (".dcm", ".rvg")
+
+RESUMABLE_UPLOADS_TOTAL = counter(
+    "dental_resumable_uploads_total",
+    "Resumable upload events by outcome",
+    ["outcome"]
+)
+RESUMABLE_UPLOAD_BYTES_TOTAL = counter(
+    "dental_resumable_upload_bytes_total",
+    "Bytes acknowledged for resumable uploads"
+)
+
+
+class ResumableUploadError(Exception):
+    """
+    Raised when a resumable upload request cannot be served
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _paths(upload_id: str) -> Tuple[Path, Path]:
+    # Ids are generated here; anything else must not reach the filesystem
+    try:
+        if str(uuid.UUID(upload_id)) != upload_id:
+            raise ValueError(upload_id)
+    except ValueError:
+        raise ResumableUploadError("not_found", "Upload not found")
+    return RESUMABLE_UPLOAD_DIR / f"{upload_id}.json", RESUMABLE_UPLOAD_DIR / f"{upload_id}.part"
+
+
+def _lock_name(upload_id: str) -> str:
+    return f"resumable-{upload_id}"
+
+
+# Serializes the reservation check with session creation across workers
+RESERVATION_LOCK = "resumable-reservations"
+
+
+def _load_state(state_path: Path) -> Dict[str, Any]:
+    try:
+        return loads(state_path.read_bytes())
+    except FileNotFoundError:
+        raise ResumableUploadError("not_found", "Upload not found")
+
+
+def _save_state(state_path: Path, state: Dict[str, Any]) -> None:
+    state["updated"] = time.time()
+    atomic_write(state_path, dumps(state))
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """
+    Add the half-open byte range [start, end) to a sorted list of disjoint ranges
+    """
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def received_offset(state: Dict[str, Any]) -> int:
+    """
+    Number of bytes received contiguously from the start of the file
+    """
+    ranges = state["ranges"]
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def is_complete(state: Dict[str, Any]) -> bool:
+    return received_offset(state) >= state["length"]
+
+
+def parse_checksum(header: str) -> Tuple[str, bytes]:
+    """
+    Parse an Upload-Checksum header ("<algorithm> <base64 digest>")
+
+    Raises:
+        ResumableUploadError: If the header is malformed or the algorithm unsupported
+    """
+    try:
+        algorithm, encoded = header.strip().split(" ", 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        raise ResumableUploadError("checksum_header", "Malformed Upload-Checksum header")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ResumableUploadError("checksum_algorithm", f"Unsupported checksum algorithm {algorithm}")
+    return algorithm, digest
+
+
+def create_upload(length: int, filename: str) -> Dict[str, Any]:
+    """
+    Start a resumable upload session
+
+    Args:
+        length: Total size of the file in bytes
+        filename: Original file name (.dcm or .rvg)
+
+    Returns:
+        Session state
+    """
+    if not filename.endswith(ALLOWED_EXTENSIONS):
+        raise ResumableUploadError("extension", "Only DICOM files (.dcm or .rvg) are supported")
+    if length <= 0:
+        raise ResumableUploadError("length", "Upload-Length must be positive")
+    if length > RESUMABLE_UPLOAD_MAX_BYTES:
+        raise ResumableUploadError("too_large", f"Maximum upload size is {RESUMABLE_UPLOAD_MAX_BYTES} bytes")
+
+    with file_lock(RESERVATION_LOCK):
+        expire_uploads()
+        if reserved_bytes() + length > RESUMABLE_UPLOAD_MAX_RESERVED_BYTES:
+            RESUMABLE_UPLOADS_TOTAL.inc(outcome="over_capacity")
+            raise ResumableUploadError(
+                "insufficient_storage", "Too many unfinished uploads; retry after some have completed"
+            )
+        RESUMABLE_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+        upload_id = str(uuid.uuid4())
+        state_path, part_path = _paths(upload_id)
+        with open(part_path, "wb") as f:
+            # Sparse preallocation; chunks are written at their offsets
+            f.truncate(length)
+
+        now = time.time()
+        state = {
+            "id": upload_id,
+            "filename": filename,
+            "length": length,
+            "ranges": [],
+            "created": now,
+            "expires": now + RESUMABLE_UPLOAD_TTL_SECONDS,
+            "file_id": None,
+            "converted_image_path": None
+        }
+        _save_state(state_path, state)
+    RESUMABLE_UPLOADS_TOTAL.inc(outcome="created")
+    return state
+
+
+def get_upload(upload_id: str) -> Dict[str, Any]:
+    """
+    Get the state of a session
+
+    Raises:
+        ResumableUploadError: If the session does not exist
+    """
+    state_path, _ = _paths(upload_id)
+    return _load_state(state_path)
+
+
+def delete_upload(upload_id: str) -> None:
+    """
+    Terminate a session and discard its data
+    """
+    state_path, part_path = _paths(upload_id)
+    with file_lock(_lock_name(upload_id)):
+        if not state_path.exists():
+            raise ResumableUploadError("not_found", "Upload not found")
+        _discard(state_path, part_path)
+    RESUMABLE_UPLOADS_TOTAL.inc(outcome="terminated")
+
+
+def _discard(state_path: Path, part_path: Path) -> None:
+    for path in (part_path, state_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _iter_states() -> Iterator[Tuple[Path, Dict[str, Any]]]:
+    if not RESUMABLE_UPLOAD_DIR.exists():
+        return
+    for state_path in RESUMABLE_UPLOAD_DIR.glob("*.json"):
+        try:
+            state = loads(state_path.read_bytes())
+        except (OSError, ValueError):
+            continue
+        yield state_path, state
+
+
+def reserved_bytes() -> int:
+    """
+    Total length of the sessions that have not been finalized yet
+    """
+    return sum(state.get("length", 0) for _, state in _iter_states() if state.get("file_id") is None)
+
+
+def expire_uploads(now: Optional[float] = None) -> int:
+    """
+    Remove sessions whose expiry has passed
+
+    Returns:
+        Number of sessions removed
+    """
+    now = time.time() if now is None else now
+    expired = 0
+    for state_path, state in _iter_states():
+        if state.get("expires", 0) > now:
+            continue
+        with file_lock(_lock_name(state["id"])):
+            _discard(state_path, state_path.with_suffix(".part"))
+        expired += 1
+    if expired:
+        RESUMABLE_UPLOADS_TOTAL.inc(expired, outcome="expired")
+        logger.info(f"Expired {expired} resumable upload sessions")
+    return expired
+
+
+class ChunkWriter:
+    """
+    Writes one PATCH body into the part file at its offset. Nothing is
+    acknowledged until ``commit`` (or ``commit_partial`` after a dropped
+    connection) records the written range.
+    """
+
+    def __init__(self, upload_id: str, offset: int, checksum: Optional[str] = None):
+        self.upload_id = upload_id
+        self.state_path, self.part_path = _paths(upload_id)
+        state = _load_state(self.state_path)
+        if state["file_id"] is not None:
+            raise ResumableUploadError("finalized", "Upload is already complete")
+        if offset < 0 or offset > state["length"]:
+            raise ResumableUploadError("offset", f"Upload-Offset must be between 0 and {state['length']}")
+
+        self.length = state["length"]
+        self.start = offset
+        self.position = offset
+        self.expected_digest = None
+        self.hasher = None
+        if checksum:
+            algorithm, self.expected_digest = parse_checksum(checksum)
+            self.hasher = CHECKSUM_ALGORITHMS[algorithm]()
+        self._fd = os.open(self.part_path, os.O_WRONLY)
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def write(self, data: bytes) -> None:
+        if self.position + len(data) > self.length:
+            raise ResumableUploadError("too_large", "Chunk extends past Upload-Length")
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self._fd, view, self.position)
+            self.position += written
+            view = view[written:]
+        if self.hasher is not None:
+            self.hasher.update(data)
+
+    def commit(self) -> Dict[str, Any]:
+        """
+        Verify the chunk checksum and acknowledge the written range
+
+        Returns:
+            Updated session state
+        """
+        if self.hasher is not None and self.hasher.digest() != self.expected_digest:
+            RESUMABLE_UPLOADS_TOTAL.inc(outcome="checksum_mismatch")
+            raise ResumableUploadError("checksum_mismatch", "Chunk checksum does not match Upload-Checksum")
+        return self._record()
+
+    def commit_partial(self) -> Optional[Dict[str, Any]]:
+        """
+        Acknowledge what arrived before the connection dropped. Chunks with
+        a checksum cannot be verified partially and are discarded instead.
+        """
+        if self.hasher is not None or self.position == self.start:
+            return None
+        RESUMABLE_UPLOADS_TOTAL.inc(outcome="interrupted")
+        return self._record()
+
+    def _record(self) -> Dict[str, Any]:
+        os.fsync(self._fd)
+        with file_lock(_lock_name(self.upload_id)):
+            state = _load_state(self.state_path)
+            if self.position > self.start:
+                state["ranges"] = merge_range(state["ranges"], self.start, self.position)
+                _save_state(self.state_path, state)
+        RESUMABLE_UPLOAD_BYTES_TOTAL.inc(self.position - self.start)
+
+        if self.start == 0:
+            self._check_head(state)
+        return state
+
+    def _check_head(self, state: Dict[str, Any]) -> None:
+        # Reject a non-DICOM file as soon as its first bytes are in
+        if received_offset(state) < min(SNIFF_BYTES, self.length):
+            return
+        with open(self.part_path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+        try:
+            check_preamble(head)
+        except DicomValidationError as e:
+            with file_lock(_lock_name(self.upload_id)):
+                _discard(self.state_path, self.part_path)
+            RESUMABLE_UPLOADS_TOTAL.inc(outcome="rejected")
+            raise ResumableUploadError("invalid_dicom", f"Invalid DICOM file: {str(e)}")
+
+
+def finalize_upload(upload_id: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Validate a completely received file, move it into storage and convert it.
+    Safe to call from concurrent requests: only the first one does the work.
+
+    Returns:
+        Session state (with file_id and converted_image_path) and whether
+        this call finalized the upload
+    """
+    state_path, part_path = _paths(upload_id)
+    with file_lock(_lock_name(upload_id)):
+        state = _load_state(state_path)
+        if state["file_id"] is not None:
+            return state, False
+        if not is_complete(state):
+            raise ResumableUploadError("incomplete", "Upload is not complete")
+
+        try:
+            with open(part_path, "rb") as f:
+                validate_dicom(f)
+        except DicomValidationError as e:
+            _discard(state_path, part_path)
+            RESUMABLE_UPLOADS_TOTAL.inc(outcome="rejected")
+            raise ResumableUploadError("invalid_dicom", f"Invalid DICOM file: {str(e)}")
+
+        storage = get_storage()
+        file_key = upload_key(f"{upload_id}{os.path.splitext(state['filename'])[1]}")
+        file_path = storage.local_path(file_key)
+        shutil.move(str(part_path), str(file_path))
+        storage.publish(file_key)
+
+        try:
+            png_path = convert_dicom_to_png(str(file_path), upload_id)
+        except Exception:
+            storage.delete(file_key)
+            _discard(state_path, part_path)
+            raise
+
+        state["file_id"] = upload_id
+        state["converted_image_path"] = png_path
+        _save_state(state_path, state)
+
+    RESUMABLE_UPLOADS_TOTAL.inc(outcome="completed")
+    logger.info(f"Resumable upload {upload_id} completed ({state['length']} bytes)")
+    return state, True
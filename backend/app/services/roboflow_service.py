@@ -1,17 +1,67 @@
 from typing import Dict, Any
 import json
-import requests
 import os
+import logging
+import threading
 
-from app.core.config import ROBOFLOW_API_KEY, ROBOFLOW_MODEL_ID, ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP
+from app.core.config import (
+    ROBOFLOW_API_KEY, ROBOFLOW_API_URL, ROBOFLOW_MODEL_ID, ROBOFLOW_CONFIDENCE_FLOOR, ROBOFLOW_FETCH_OVERLAP, UPSTREAM_POOL_SIZE
+)
+from app.utils.lazy import lazy_import
+from app.utils.metrics import observe_stage, UPSTREAM_ERRORS_TOTAL
+
+# Imported on first use, to keep it off the cold-start path
+requests = lazy_import("requests")
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Pooled HTTP session, so requests reuse warm TLS connections
+_session = None
+_session_lock = threading.Lock()
+
+def is_configured() -> bool:
+    """
+    Whether a real Roboflow API key is configured
+    """
+    return bool(ROBOFLOW_API_KEY) and ROBOFLOW_API_KEY != 'your_roboflow_api_key'
+
+def get_session():
+    """
+    Return the shared HTTP session for Roboflow requests
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def warm_up() -> None:
+    """
+    Open a pooled connection to the Roboflow API ahead of the first request
+    """
+    get_session().head(ROBOFLOW_API_URL, timeout=5)
 
 # Switch back to using direct HTTP requests which is more reliable
-def call_roboflow_api(image_path: str) -> Dict[str, Any]:
+def call_roboflow_api(
+    image_path: str,
+    confidence: int = ROBOFLOW_CONFIDENCE_FLOOR,
+    overlap: int = ROBOFLOW_FETCH_OVERLAP
+) -> Dict[str, Any]:
     """
-    Call Roboflow API for object detection using direct HTTP requests
+    Call Roboflow API for object detection using direct HTTP requests.
+    By default predictions are fetched at a low floor threshold without
+    upstream NMS, so that any stricter threshold can be applied locally.
     
     Args:
         image_path: Path to the image file
+        confidence: Minimum confidence (0-100)
+        overlap: Overlap above which upstream NMS suppresses boxes (0-100)
         
     Returns:
         JSON response from Roboflow API
@@ -20,8 +70,8 @@ def call_roboflow_api(image_path: str) -> Dict[str, Any]:
         Exception: If API call fails
     """
     # For testing or when API key is not configured, return mock results
-    if not ROBOFLOW_API_KEY or ROBOFLOW_API_KEY == 'your_roboflow_api_key':
-        print("Roboflow API key not configured, returning mock results")
+    if not is_configured():
+        logger.info("Roboflow API key not configured, returning mock results")
         return {
             "predictions": [
                 {"class": "caries", "confidence": 0.92, "x": 100, "y": 100, "width": 50, "height": 50},
@@ -31,19 +81,19 @@ def call_roboflow_api(image_path: str) -> Dict[str, Any]:
     
     try:
         # Construct the API URL with model ID
-        api_url = f"https://detect.roboflow.com/{ROBOFLOW_MODEL_ID}"
+        api_url = f"{ROBOFLOW_API_URL}/{ROBOFLOW_MODEL_ID}"
         
         # Set up the parameters for the API call
         params = {
             "api_key": ROBOFLOW_API_KEY,
-            "confidence": ROBOFLOW_CONFIDENCE,
-            "overlap": ROBOFLOW_OVERLAP
+            "confidence": confidence,
+            "overlap": overlap
         }
         
         # Open the image file
-        with open(image_path, "rb") as img_file:
-            # Call the Roboflow API directly using requests
-            response = requests.post(
+        with open(image_path, "rb") as img_file, observe_stage("roboflow_call"):
+            # Call the Roboflow API directly over the pooled session
+            response = get_session().post(
                 api_url,
                 params=params,
                 files={"file": img_file}
@@ -56,4 +106,5 @@ def call_roboflow_api(image_path: str) -> Dict[str, Any]:
         # Parse and return the JSON response
         return response.json()
     except Exception as e:
+        UPSTREAM_ERRORS_TOTAL.inc(upstream="roboflow")
         raise Exception(f"Error calling Roboflow API: {str(e)}")
@@ -0,0 +1,183 @@
+"""
+Priority scheduling of CPU-bound conversions and upstream calls.
+
+Work is tagged with a priority carried in a context variable:
+
+- ``interactive``: a user waiting on a single image (``/upload/``,
+  ``/detect/{file_id}``, ``/report/{file_id}``, PNG regeneration)
+- ``batch``: multi-file requests and speculative detection
+- ``bulk``: archive imports and backfills
+
+Requests start as interactive; batch and bulk entry points lower their
+priority. ``run_in_threadpool`` copies the context into the worker thread,
+and pools owned by services (archive ingest, speculation) set the priority
+of their jobs explicitly.
+
+Conversions and upstream calls each take a slot of a ``PrioritySemaphore``.
+When slots are taken, waiters are served by priority, FIFO within a
+priority. To keep bulk work from starving, a waiter is promoted by one
+priority level for every ``SCHEDULER_AGING_SECONDS`` it has waited.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from app.core.config import SCHEDULER_AGING_SECONDS, SCHEDULER_CONVERSION_SLOTS, SCHEDULER_UPSTREAM_SLOTS
+from app.utils.metrics import gauge, histogram
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BULK = "bulk"
+
+# Highest priority first
+PRIORITIES = (INTERACTIVE, BATCH, BULK)
+PRIORITY_LEVELS = {name: level for level, name in enumerate(PRIORITIES)}
+
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar("scheduling_priority", default=INTERACTIVE)
+
+SCHEDULER_WAIT = histogram(
+    "dental_scheduler_wait_seconds",
+    "Time spent waiting for a conversion or upstream slot",
+    ["pool", "priority"]
+)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+def set_priority(priority: str) -> None:
+    """
+    Set the priority of the rest of the current request or task
+    """
+    if priority not in PRIORITY_LEVELS:
+        raise ValueError(f"Unknown priority: {priority}")
+    _current_priority.set(priority)
+
+
+@contextmanager
+def priority(priority: str) -> Iterator[None]:
+    """
+    Run a block with the given priority
+    """
+    if priority not in PRIORITY_LEVELS:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class PrioritySemaphore:
+    """
+    Counting semaphore that hands free slots to the most urgent waiter
+    """
+
+    RECHECK_SECONDS = 0.1
+
+    def __init__(self, name: str, slots: int, aging_seconds: float = SCHEDULER_AGING_SECONDS):
+        self.name = name
+        self.slots = max(1, slots)
+        self.aging_seconds = aging_seconds
+        self._available = self.slots
+        self._queues: Dict[str, Deque[_Waiter]] = {name: deque() for name in PRIORITIES}
+        self._condition = threading.Condition()
+
+    def _effective_level(self, waiter: _Waiter, now: float) -> float:
+        level = PRIORITY_LEVELS[waiter.priority]
+        if self.aging_seconds > 0:
+            level -= (now - waiter.enqueued_at) / self.aging_seconds
+        return max(level, 0)
+
+    def _next(self) -> Optional[_Waiter]:
+        # The head of each queue has waited longest, so only heads compete
+        now = time.monotonic()
+        heads = [queue[0] for queue in self._queues.values() if queue]
+        if not heads:
+            return None
+        return min(heads, key=lambda waiter: (self._effective_level(waiter, now), waiter.enqueued_at))
+
+    def acquire(self, priority: Optional[str] = None) -> None:
+        """
+        Take a slot, waiting behind more urgent work
+        """
+        priority = priority or current_priority()
+        started = time.perf_counter()
+        with self._condition:
+            if self._available > 0 and self._next() is None:
+                self._available -= 1
+            else:
+                waiter = _Waiter(priority)
+                self._queues[priority].append(waiter)
+                # Re-check periodically: waiters woken by the same release
+                # compare ages at slightly different times, and aging can
+                # change the order in between
+                while not (self._available > 0 and self._next() is waiter):
+                    self._condition.wait(timeout=self.RECHECK_SECONDS)
+                self._queues[priority].popleft()
+                self._available -= 1
+                # Another slot may be free for the next waiter
+                self._condition.notify_all()
+        SCHEDULER_WAIT.observe(time.perf_counter() - started, pool=self.name, priority=priority)
+
+    def release(self) -> None:
+        with self._condition:
+            self._available += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None) -> Iterator[None]:
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._condition:
+            return {name: len(queue) for name, queue in self._queues.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "slots": self.slots,
+                "in_use": self.slots - self._available,
+                "queued": {name: len(queue) for name, queue in self._queues.items()},
+                "aging_seconds": self.aging_seconds
+            }
+
+
+# DICOM conversions (CPU) and calls to Roboflow/OpenAI of this worker
+conversion_slots = PrioritySemaphore("conversion", SCHEDULER_CONVERSION_SLOTS)
+upstream_slots = PrioritySemaphore("upstream", SCHEDULER_UPSTREAM_SLOTS)
+POOLS: List[PrioritySemaphore] = [conversion_slots, upstream_slots]
+
+gauge(
+    "dental_scheduler_queue_depth",
+    "Work waiting for a conversion or upstream slot",
+    ["pool", "priority"],
+    callback=lambda: {
+        (pool.name, name): depth for pool in POOLS for name, depth in pool.queue_depths().items()
+    }
+)
+
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    return {pool.name: pool.get_stats() for pool in POOLS}
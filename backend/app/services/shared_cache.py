@@ -0,0 +1,134 @@
+"""
+SQLite-backed cache tier shared by all worker processes.
+
+Sits behind the in-process artifact cache: a miss in one worker can be served
+from an artifact another worker already loaded, without going back to disk,
+object storage or the conversion pipeline. Values are stored as bytes and the
+total size is kept under a limit by dropping the least recently used rows.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.config import RUNTIME_DIR, SHARED_CACHE_MAX_BYTES
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_PATH = RUNTIME_DIR / "shared_cache.sqlite3"
+
+# Only refresh the access time of a row this often, to avoid a write per hit
+ACCESS_UPDATE_INTERVAL_SECONDS = 10
+
+
+class SharedCache:
+    """
+    Key/value cache stored in a SQLite database in WAL mode
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._hits = 0
+        self._misses = 0
+        self._stats_lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            # Keep the total size in a one-row table so trimming does not scan every row
+            conn.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO usage (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                "BEGIN UPDATE usage SET bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                "BEGIN UPDATE usage SET bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads, nor carried
+        # across the fork from the preloading gunicorn master
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Make INSERT OR REPLACE fire the delete trigger that keeps the usage total
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._connection()
+        row = conn.execute("SELECT value, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        with self._stats_lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        now = time.time()
+        if now - row[1] > ACCESS_UPDATE_INTERVAL_SECONDS:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(row[0])
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time())
+        )
+        self._trim(conn)
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        escaped = prefix.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+        self._connection().execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '!'", (escaped + "%",))
+
+    def get_stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        row = (
+            conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+        )
+        with self._stats_lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": row[0],
+                "bytes": row[1],
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used rows until we are under the limit
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
@@ -0,0 +1,183 @@
+"""
+Near-duplicate index over perceptual hashes.
+
+Every converted image gets a 64-bit perceptual hash (see
+``app.utils.perceptual_hash``). Hashes are kept in a BK-tree, a metric tree
+over Hamming distance whose range queries visit only the subtrees that can
+hold a match, instead of comparing against every stored image.
+
+The index is persisted as an append-only log of ``file_id<TAB>hash`` lines.
+Each worker appends with a single O_APPEND write and, before answering a
+query, reads the lines other workers appended since its last look, so all
+workers see the same index without coordination. A reconverted file simply
+gets a new line; the latest hash of a file wins.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import PHASH_ENABLED, PHASH_ALGORITHM, PHASH_INDEX_PATH
+from app.utils.metrics import observe_stage
+from app.utils.perceptual_hash import HASH_FUNCTIONS, hamming_distance, similarity
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+class BKTree:
+    """
+    BK-tree over 64-bit hashes with Hamming distance. Each node is
+    [hash, file ids, {distance: child}].
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, file_id: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [file_id], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(file_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [file_id], {}]
+                return
+            node = child
+
+    def query(self, value: int, max_distance: int) -> List[Tuple[int, int, str]]:
+        """
+        All entries within max_distance of value
+
+        Returns:
+            (distance, hash, file_id) tuples, nearest first
+        """
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, node[0], file_id) for file_id in node[1])
+            # Triangle inequality: only children in this band can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches)
+
+
+class SimilarityIndex:
+    """
+    Perceptual hashes of converted images, shared by all workers through an append-only log
+    """
+
+    def __init__(self, path: Path = PHASH_INDEX_PATH, algorithm: str = PHASH_ALGORITHM):
+        self.path = Path(path)
+        self.algorithm = algorithm
+        self._tree = BKTree()
+        self._hashes: Dict[str, int] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def compute(self, pixels) -> int:
+        with observe_stage("perceptual_hash"):
+            return HASH_FUNCTIONS[self.algorithm](pixels)
+
+    def add(self, file_id: str, value: int) -> None:
+        """
+        Record the hash of a converted image
+        """
+        line = f"{file_id}\t{value:016x}\n".encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # A single O_APPEND write is atomic with respect to other appenders
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Load lines appended since the last refresh (by any worker)
+
+        Returns:
+            Number of hashes loaded
+        """
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return 0
+            # Leave a line that is still being written for the next refresh
+            complete = data[:data.rfind(b"\n") + 1]
+            self._offset += len(complete)
+
+            loaded = 0
+            for line in complete.decode("utf-8").splitlines():
+                try:
+                    file_id, encoded = line.split("\t")
+                    value = int(encoded, 16)
+                except ValueError:
+                    continue
+                if self._hashes.get(file_id) != value:
+                    self._hashes[file_id] = value
+                    self._tree.add(value, file_id)
+                    loaded += 1
+            return loaded
+
+    def hash_of(self, file_id: str) -> Optional[int]:
+        self.refresh()
+        with self._lock:
+            return self._hashes.get(file_id)
+
+    def find_similar(self, value: int, max_distance: int, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Images whose current hash is within max_distance of value
+
+        Returns:
+            Matches with file_id, distance and similarity, nearest first
+        """
+        self.refresh()
+        with self._lock:
+            matches = []
+            seen = {exclude}
+            for distance, node_value, file_id in self._tree.query(value, max_distance):
+                # Skip stale entries of reconverted files
+                if file_id in seen or self._hashes.get(file_id) != node_value:
+                    continue
+                seen.add(file_id)
+                matches.append({"file_id": file_id, "distance": distance, "similarity": round(similarity(distance), 4)})
+            return matches
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"algorithm": self.algorithm, "images": len(self._hashes), "tree_entries": self._tree.size}
+
+
+# Shared instance used by conversion and detection
+similarity_index = SimilarityIndex()
+
+
+def index_image(file_id: str, pixels) -> None:
+    """
+    Hash a normalized image and add it to the index. Failures are logged
+    and never fail the conversion.
+    """
+    if not PHASH_ENABLED:
+        return
+    try:
+        similarity_index.add(file_id, similarity_index.compute(pixels))
+    except Exception as e:
+        logger.warning(f"Could not index perceptual hash of {file_id}: {str(e)}")
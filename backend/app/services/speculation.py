@@ -0,0 +1,192 @@
+"""
+Speculative background detection.
+
+When enabled, every successful upload queues detection (and optionally report
+generation) for the new image, so that the results are usually ready by the
+time the client asks for them. Speculative work runs on a small thread pool
+whose size is the concurrency budget; a later ``/detect`` call joins a task
+that is already running instead of starting a second one.
+
+Speculation is the first thing to give way under load: no new work is queued
+while the number of in-flight requests is above a threshold, queued tasks are
+dropped when they would start under load, and all pending work can be
+cancelled through the admin API.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+from app.core.config import (
+    SPECULATIVE_DETECTION, SPECULATIVE_REPORTS, SPECULATION_MAX_CONCURRENCY,
+    SPECULATION_MAX_QUEUE, SPECULATION_MAX_IN_FLIGHT_REQUESTS
+)
+from app.services.detection_service import detect, apply_thresholds
+from app.services.report_service import get_or_generate_report
+from app.services.scheduler import priority, BATCH
+from app.utils.metrics import counter, gauge, REQUESTS_IN_FLIGHT
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+SPECULATION_TOTAL = counter(
+    "dental_speculation_total",
+    "Speculative detection tasks by outcome",
+    ["outcome"]
+)
+
+
+class Speculator:
+    """
+    Runs detection ahead of time within a concurrency budget
+    """
+
+    def __init__(
+        self,
+        enabled: bool = SPECULATIVE_DETECTION,
+        include_reports: bool = SPECULATIVE_REPORTS,
+        max_concurrency: int = SPECULATION_MAX_CONCURRENCY,
+        max_queue: int = SPECULATION_MAX_QUEUE,
+        max_in_flight_requests: int = SPECULATION_MAX_IN_FLIGHT_REQUESTS
+    ):
+        self.enabled = enabled
+        self.include_reports = include_reports
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_in_flight_requests = max_in_flight_requests
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: Dict[str, Future] = {}
+        self._running: Set[str] = set()
+        self._cancelled: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def under_load(self) -> bool:
+        """
+        Whether the server is too busy for speculative work
+        """
+        # The current request is counted as well
+        return REQUESTS_IN_FLIGHT.value() > self.max_in_flight_requests
+
+    def submit(self, file_id: str, png_path: str) -> bool:
+        """
+        Queue detection for a freshly converted image
+
+        Returns:
+            Whether the task was queued
+        """
+        if not self.enabled:
+            return False
+        if self.under_load():
+            SPECULATION_TOTAL.inc(outcome="shed")
+            return False
+
+        with self._lock:
+            if file_id in self._tasks:
+                return True
+            if len(self._tasks) - len(self._running) >= self.max_queue:
+                SPECULATION_TOTAL.inc(outcome="shed")
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="speculation"
+                )
+            future = self._executor.submit(self._run, file_id, Path(png_path))
+            self._tasks[file_id] = future
+        future.add_done_callback(lambda done: self._finished(file_id, done))
+        return True
+
+    def join(self, file_id: str) -> Optional[Future]:
+        """
+        Return the running task for a file so the caller can wait for it.
+        A task that has not started yet is cancelled, since the caller is
+        about to do the same work itself.
+        """
+        with self._lock:
+            future = self._tasks.get(file_id)
+            if future is None:
+                return None
+            if file_id in self._running:
+                SPECULATION_TOTAL.inc(outcome="joined")
+                return future
+        if future.cancel():
+            SPECULATION_TOTAL.inc(outcome="preempted")
+        return None
+
+    def cancel(self, file_id: Optional[str] = None) -> int:
+        """
+        Cancel queued tasks (all of them, or those of one file). Running tasks
+        finish their current upstream call but skip the remaining steps.
+
+        Returns:
+            Number of tasks cancelled
+        """
+        with self._lock:
+            targets = [file_id] if file_id is not None else list(self._tasks)
+            futures = [(key, self._tasks[key]) for key in targets if key in self._tasks]
+            self._cancelled.update(key for key, _ in futures if key in self._running)
+
+        cancelled = 0
+        for key, future in futures:
+            if future.cancel() or key in self._cancelled:
+                cancelled += 1
+                SPECULATION_TOTAL.inc(outcome="cancelled")
+        return cancelled
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._tasks) - len(self._running)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = len(self._running)
+            queued = len(self._tasks) - running
+        return {
+            "enabled": self.enabled,
+            "include_reports": self.include_reports,
+            "max_concurrency": self.max_concurrency,
+            "queued": queued,
+            "running": running,
+            "under_load": self.under_load()
+        }
+
+    def _run(self, file_id: str, png_path: Path) -> None:
+        if self.under_load():
+            SPECULATION_TOTAL.inc(outcome="shed")
+            return
+
+        with self._lock:
+            self._running.add(file_id)
+        try:
+            # Speculative work yields to users waiting on an image
+            with priority(BATCH):
+                detection_results, cached = detect(file_id, png_path)
+                if self.include_reports and not self._is_cancelled(file_id):
+                    get_or_generate_report(file_id, apply_thresholds(detection_results))
+            SPECULATION_TOTAL.inc(outcome="cached" if cached else "completed")
+        except Exception as e:
+            SPECULATION_TOTAL.inc(outcome="failed")
+            logger.warning(f"Speculative detection for {file_id} failed: {str(e)}")
+
+    def _is_cancelled(self, file_id: str) -> bool:
+        with self._lock:
+            return file_id in self._cancelled
+
+    def _finished(self, file_id: str, future: Future) -> None:
+        with self._lock:
+            if self._tasks.get(file_id) is future:
+                del self._tasks[file_id]
+            self._running.discard(file_id)
+            self._cancelled.discard(file_id)
+
+
+# Shared instance used by the API
+speculator = Speculator()
+
+gauge(
+    "dental_speculation_queue_depth",
+    "Speculative detection tasks waiting for a worker thread",
+    callback=lambda: {(): speculator.queue_depth()}
+)
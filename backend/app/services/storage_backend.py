@@ -0,0 +1,246 @@
+"""
+Pluggable storage backends for uploaded DICOMs and processed artifacts.
+
+Artifacts are addressed by keys of the form ``uploads/<name>`` and
+``processed/<name>``. Every backend also exposes a local working copy of each
+key (under ``UPLOADS_DIR``/``PROCESSED_DIR``) because pydicom, Pillow and the
+Roboflow client all work on file paths:
+
+- ``local_path(key)`` returns where the working copy lives
+- ``fetch(key)`` makes sure the working copy exists (read-through) and returns it
+- ``publish(key)`` pushes a freshly written working copy to the backend
+
+With the local backend the working copy is the stored file, so ``fetch`` and
+``publish`` are no-ops. With the S3 backend the working directories act as a
+read-through cache in front of the bucket; its size is bounded by the storage
+quota manager, which can evict local copies that are safely stored remotely.
+"""
+
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import (
+    UPLOADS_DIR, PROCESSED_DIR, STORAGE_BACKEND, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL,
+    S3_REGION, S3_MULTIPART_THRESHOLD_BYTES, S3_MULTIPART_CHUNK_BYTES
+)
+from app.services.storage_manager import storage_manager
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Locks serializing S3 downloads; keys share a lock when their hashes collide
+FETCH_LOCK_STRIPES = 64
+
+# Key prefixes and the local directories that hold their working copies
+LOCAL_ROOTS = {
+    "uploads": UPLOADS_DIR,
+    "processed": PROCESSED_DIR
+}
+
+
+def upload_key(filename: str) -> str:
+    """
+    Build the storage key for an uploaded DICOM file
+    """
+    return f"uploads/{filename}"
+
+
+def processed_key(filename: str) -> str:
+    """
+    Build the storage key for a processed artifact
+    """
+    return f"processed/{filename}"
+
+
+class StorageBackend:
+    """
+    Base class for storage backends
+    """
+
+    name = "base"
+
+    def local_path(self, key: str) -> Path:
+        """
+        Return the path of the local working copy of a key
+        """
+        prefix, _, filename = key.partition("/")
+        if prefix not in LOCAL_ROOTS or not filename or "/" in filename or filename in (".", ".."):
+            raise ValueError(f"Invalid storage key: {key}")
+        return LOCAL_ROOTS[prefix] / filename
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def fetch(self, key: str) -> Optional[Path]:
+        """
+        Make sure the local working copy of a key exists
+
+        Returns:
+            Path to the local copy, or None if the key does not exist
+        """
+        raise NotImplementedError
+
+    def publish(self, key: str) -> None:
+        """
+        Persist the local working copy of a key to the backend
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """
+        Delete a key and its local working copy
+        """
+        path = self.local_path(key)
+        if path.exists():
+            os.remove(path)
+        storage_manager.record_delete(path)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Stores everything on the local filesystem of the instance
+    """
+
+    name = "local"
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).exists()
+
+    def fetch(self, key: str) -> Optional[Path]:
+        path = self.local_path(key)
+        if not path.exists():
+            return None
+        storage_manager.record_access(path)
+        return path
+
+    def publish(self, key: str) -> None:
+        storage_manager.record_write(self.local_path(key))
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Stores artifacts in an S3-compatible bucket (AWS S3, MinIO, ...), with the
+    local working directories acting as a read-through cache
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        client=None
+    ):
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set to use the S3 storage backend")
+
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise ImportError("boto3 is required for the S3 storage backend (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD_BYTES,
+            multipart_chunksize=S3_MULTIPART_CHUNK_BYTES
+        )
+        # Striped by key so concurrent cache misses of a key download only once
+        self._fetch_locks = [threading.Lock() for _ in range(FETCH_LOCK_STRIPES)]
+
+    def _object_key(self, key: str) -> str:
+        self.local_path(key)  # Validate the key
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key: str) -> bool:
+        if self.local_path(key).exists():
+            return True
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def fetch(self, key: str) -> Optional[Path]:
+        path = self.local_path(key)
+        if path.exists():
+            storage_manager.record_access(path)
+            return path
+
+        with self._lock_for(key):
+            if path.exists():
+                return path
+            if not self.exists(key):
+                return None
+
+            temp_path = path.with_name(f".{path.name}.{os.getpid()}.download")
+            try:
+                self.client.download_file(
+                    self.bucket, self._object_key(key), str(temp_path), Config=self.transfer_config
+                )
+                os.replace(temp_path, path)
+            finally:
+                if temp_path.exists():
+                    os.remove(temp_path)
+
+        logger.info(f"Fetched {key} from object storage into the local cache")
+        storage_manager.record_write(path)
+        return path
+
+    def publish(self, key: str) -> None:
+        path = self.local_path(key)
+        self.client.upload_file(str(path), self.bucket, self._object_key(key), Config=self.transfer_config)
+        storage_manager.record_write(path)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        super().delete(key)
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        return self._fetch_locks[hash(key) % FETCH_LOCK_STRIPES]
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """
+    Return the configured storage backend (created on first use)
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "s3":
+                    _storage = S3StorageBackend(
+                        bucket=S3_BUCKET,
+                        prefix=S3_PREFIX,
+                        endpoint_url=S3_ENDPOINT_URL,
+                        region=S3_REGION
+                    )
+                elif STORAGE_BACKEND == "local":
+                    _storage = LocalStorageBackend()
+                else:
+                    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
+                logger.info(f"Using {_storage.name} storage backend")
+    return _storage
+
+
+def set_storage(backend: Optional[StorageBackend]) -> None:
+    """
+    Replace the storage backend (None resets to the configured one)
+    """
+    global _storage
+    with _storage_lock:
+        _storage = backend
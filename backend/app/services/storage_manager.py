@@ -0,0 +1,467 @@
+"""
+Disk quota management for uploaded and processed files.
+
+The manager keeps an in-memory index of every file under the uploads and
+processed directories. The index is built with a single scan at startup and is
+kept current by the write/access/delete hooks called from the API and the
+conversion service, so the background sweeper never has to walk the
+directories again.
+
+When usage goes over the quota, files are evicted least-recently-accessed first,
+one category at a time, from the cheapest to regenerate to the most expensive:
+variants, PNGs (re-created from the DICOM on demand) and finally raw
+uploads, which are only removed once they have been idle for longer than the
+configured TTL.
+
+In multi-worker mode only one process (the holder of the "storage-sweeper"
+lock) runs the sweeper. The other workers append their hook events to a
+journal file that the leader replays before every sweep.
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union
+
+from app.core.config import (
+    UPLOADS_DIR, PROCESSED_DIR, STORAGE_QUOTA_BYTES, STORAGE_LOW_WATERMARK,
+    UPLOAD_TTL_SECONDS, STORAGE_SWEEP_INTERVAL_SECONDS, MULTIPROCESS_MODE, RUNTIME_DIR
+)
+from app.utils.locks import try_acquire_lock
+from app.utils.metrics import gauge
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Eviction order: earlier categories are evicted first
+EVICTION_ORDER = ["variant", "png", "upload"]
+
+# Categories that are tracked for usage but never evicted (detection/report JSON)
+PROTECTED_CATEGORIES = ["metadata"]
+
+# Files that must never be evicted
+PROTECTED_FILENAMES = {"placeholder.png"}
+
+# Zero-byte files younger than this may still be in the middle of being written
+EMPTY_FILE_GRACE_SECONDS = 300
+
+# Hook events shared between worker processes: op, size, time, pid, path
+STORAGE_JOURNAL_PATH = RUNTIME_DIR / "storage_journal.log"
+
+PathLike = Union[str, Path]
+
+_UPLOADS_ROOT = UPLOADS_DIR.resolve()
+_PROCESSED_ROOT = PROCESSED_DIR.resolve()
+
+
+def classify_path(path: PathLike) -> Optional[str]:
+    """
+    Return the storage category of a file, or None if it is not managed
+    """
+    path = Path(os.path.abspath(path))
+    parent = path.parent
+    name = path.name
+
+    if parent == _UPLOADS_ROOT:
+        return "upload"
+    if parent != _PROCESSED_ROOT:
+        return None
+    if "_variant" in name:
+        return "variant"
+    if name.endswith(".png"):
+        return "png"
+    return "metadata"
+
+
+class StorageManager:
+    """
+    Tracks disk usage of uploads and processed artifacts and evicts files
+    when the configured quota is exceeded
+    """
+
+    def __init__(
+        self,
+        quota_bytes: int = STORAGE_QUOTA_BYTES,
+        low_watermark: float = STORAGE_LOW_WATERMARK,
+        upload_ttl_seconds: int = UPLOAD_TTL_SECONDS,
+        sweep_interval_seconds: int = STORAGE_SWEEP_INTERVAL_SECONDS,
+        journal_path: Optional[Path] = None
+    ):
+        self.quota_bytes = quota_bytes
+        self.low_watermark = low_watermark
+        self.upload_ttl_seconds = upload_ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.journal_path = journal_path
+        self._leader_lock = None
+
+        self._lock = threading.RLock()
+        # category -> OrderedDict(path -> (size, last_access)), oldest access first
+        self._entries: Dict[str, "OrderedDict[str, Tuple[int, float]]"] = {
+            category: OrderedDict() for category in EVICTION_ORDER + PROTECTED_CATEGORIES
+        }
+        self._usage: Dict[str, int] = {category: 0 for category in self._entries}
+        self._empty_files: Dict[str, float] = {}
+        self._evicted_files: Dict[str, int] = {category: 0 for category in EVICTION_ORDER}
+        self._evicted_bytes: Dict[str, int] = {category: 0 for category in EVICTION_ORDER}
+        self._empty_files_removed = 0
+        self._sweeps = 0
+        self._last_sweep_seconds = 0.0
+        self._scanned = False
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def scan(self) -> None:
+        """
+        Build the index with a one-off scan of the managed directories.
+        Entries already recorded through the hooks take precedence.
+        """
+        scanned = []
+        for directory in (UPLOADS_DIR, PROCESSED_DIR):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        last_access = max(stat.st_atime, stat.st_mtime)
+                        scanned.append((os.path.abspath(entry.path), stat.st_size, last_access))
+            except FileNotFoundError:
+                continue
+
+        with self._lock:
+            for path, size, last_access in scanned:
+                category = classify_path(path)
+                if category is None or path in self._entries[category]:
+                    continue
+                self._entries[category][path] = (size, last_access)
+                self._usage[category] += size
+                if size == 0:
+                    self._empty_files[path] = last_access
+            for category in self._entries:
+                self._reorder(category)
+            self._scanned = True
+        logger.info(f"Storage index built: {self.total_usage()} bytes in use")
+
+    def record_write(self, path: PathLike) -> None:
+        """
+        Record that a file has been created or rewritten
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self.record_delete(path)
+            return
+        last_access = time.time()
+        self._track(str(path), size, last_access, overwrite=True)
+        self._journal("w", path, size, last_access)
+
+    def record_access(self, path: PathLike) -> None:
+        """
+        Mark a file as recently used so that it is evicted last within its category
+        """
+        key = os.path.abspath(path)
+        if self._touch(key, time.time()):
+            self._journal("a", key, 0, time.time())
+            return
+
+        # Not indexed yet (e.g. written before the startup scan finished)
+        if classify_path(key) is not None:
+            self.record_write(key)
+
+    def record_delete(self, path: PathLike) -> None:
+        """
+        Remove a file from the index
+        """
+        self._forget(os.path.abspath(path))
+        self._journal("d", path, 0, time.time())
+
+    def total_usage(self) -> int:
+        """
+        Return the number of bytes currently used by all managed files
+        """
+        with self._lock:
+            return sum(self._usage.values())
+
+    def sweep(self) -> int:
+        """
+        Remove zero-byte leftovers and evict files until usage is back under
+        the low watermark
+
+        Returns:
+            Number of bytes freed
+        """
+        started = time.perf_counter()
+        self._remove_empty_files()
+        freed = 0
+
+        if self.total_usage() > self.quota_bytes:
+            target = int(self.quota_bytes * self.low_watermark)
+            for category in EVICTION_ORDER:
+                freed += self._evict_category(category, target)
+                if self.total_usage() <= target:
+                    break
+            if self.total_usage() > self.quota_bytes:
+                logger.warning(
+                    f"Storage usage {self.total_usage()} bytes is still over the quota "
+                    f"of {self.quota_bytes} bytes after eviction"
+                )
+
+        with self._lock:
+            self._sweeps += 1
+            self._last_sweep_seconds = time.perf_counter() - started
+        return freed
+
+    def start(self) -> None:
+        """
+        Start the background sweeper thread (the index is built on that thread)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.journal_path is not None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background sweeper thread
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return usage and eviction metrics
+        """
+        with self._lock:
+            return {
+                "quota_bytes": self.quota_bytes,
+                "usage_bytes": sum(self._usage.values()),
+                "usage_by_category": dict(self._usage),
+                "files_by_category": {category: len(entries) for category, entries in self._entries.items()},
+                "evicted_files": dict(self._evicted_files),
+                "evicted_bytes": dict(self._evicted_bytes),
+                "empty_files_removed": self._empty_files_removed,
+                "sweeps": self._sweeps,
+                "last_sweep_seconds": round(self._last_sweep_seconds, 6),
+                "index_ready": self._scanned,
+                "sweeper_leader": self.is_leader()
+            }
+
+    def is_leader(self) -> bool:
+        """
+        Whether this process runs the sweeper (always true with one worker)
+        """
+        return self.journal_path is None or self._leader_lock is not None
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set() and not self.is_leader():
+            # Another worker runs the sweeper; take over if it exits
+            self._leader_lock = try_acquire_lock("storage-sweeper")
+            if self._leader_lock is None:
+                self._stop_event.wait(self.sweep_interval_seconds)
+            else:
+                logger.info(f"Process {os.getpid()} is now the storage sweeper")
+
+        try:
+            self.scan()
+        except Exception as e:
+            logger.error(f"Storage scan failed: {str(e)}")
+
+        while not self._stop_event.is_set():
+            try:
+                self._replay_journal()
+                freed = self.sweep()
+                if freed:
+                    logger.info(f"Storage sweep freed {freed} bytes")
+            except Exception as e:
+                logger.error(f"Storage sweep failed: {str(e)}")
+            self._stop_event.wait(self.sweep_interval_seconds)
+
+    def _journal(self, op: str, path: PathLike, size: int, timestamp: float) -> None:
+        if self.journal_path is None or self._leader_lock is not None:
+            return
+        line = f"{op}\t{size}\t{timestamp:.3f}\t{os.getpid()}\t{os.path.abspath(path)}\n"
+        try:
+            # A single O_APPEND write is atomic with respect to other appenders
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.warning(f"Could not append to storage journal: {str(e)}")
+
+    def _replay_journal(self) -> int:
+        """
+        Apply hook events recorded by the other workers since the last sweep
+
+        Returns:
+            Number of events applied
+        """
+        if self.journal_path is None:
+            return 0
+        # Writers reopen the journal for every event, so after the rename new
+        # events go to a fresh file
+        consumed = self.journal_path.with_name(f"{self.journal_path.name}.{os.getpid()}")
+        try:
+            os.replace(self.journal_path, consumed)
+        except FileNotFoundError:
+            return 0
+
+        applied = 0
+        try:
+            with open(consumed, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t", 4)
+                    if len(parts) != 5:
+                        continue
+                    op, size, timestamp, _, path = parts
+                    if op == "w":
+                        self._track(path, int(size), float(timestamp), overwrite=True)
+                    elif op == "a":
+                        self._touch(path, float(timestamp))
+                    elif op == "d":
+                        self._forget(path)
+                    else:
+                        continue
+                    applied += 1
+        finally:
+            os.remove(consumed)
+        return applied
+
+    def _touch(self, key: str, last_access: float) -> bool:
+        category = classify_path(key)
+        if category is None:
+            return False
+        with self._lock:
+            entries = self._entries[category]
+            if key not in entries:
+                return False
+            size, _ = entries[key]
+            entries[key] = (size, last_access)
+            entries.move_to_end(key)
+            return True
+
+    def _forget(self, key: str) -> None:
+        category = classify_path(key)
+        if category is None:
+            return
+        with self._lock:
+            self._empty_files.pop(key, None)
+            previous = self._entries[category].pop(key, None)
+            if previous is not None:
+                self._usage[category] -= previous[0]
+
+    def _track(self, path: str, size: int, last_access: float, overwrite: bool) -> None:
+        key = os.path.abspath(path)
+        category = classify_path(key)
+        if category is None:
+            return
+
+        with self._lock:
+            entries = self._entries[category]
+            if key in entries:
+                if not overwrite:
+                    return
+                self._usage[category] -= entries[key][0]
+                del entries[key]
+
+            # Keep each category ordered by last access, oldest first
+            out_of_order = bool(entries) and last_access < next(reversed(entries.values()))[1]
+            entries[key] = (size, last_access)
+            if out_of_order:
+                self._reorder(category)
+            self._usage[category] += size
+
+            if size == 0:
+                self._empty_files[key] = last_access
+            else:
+                self._empty_files.pop(key, None)
+
+    def _reorder(self, category: str) -> None:
+        entries = self._entries[category]
+        self._entries[category] = OrderedDict(sorted(entries.items(), key=lambda item: item[1][1]))
+
+    def _remove_empty_files(self) -> None:
+        cutoff = time.time() - EMPTY_FILE_GRACE_SECONDS
+        with self._lock:
+            candidates = [path for path, seen in self._empty_files.items() if seen < cutoff]
+
+        for path in candidates:
+            try:
+                if os.path.getsize(path) == 0:
+                    os.remove(path)
+                    with self._lock:
+                        self._empty_files_removed += 1
+            except OSError:
+                pass
+            self.record_delete(path)
+
+    def _evict_category(self, category: str, target: int) -> int:
+        freed = 0
+        now = time.time()
+
+        while self.total_usage() > target:
+            with self._lock:
+                entries = self._entries[category]
+                victim = None
+                for path, (size, last_access) in entries.items():
+                    if os.path.basename(path) in PROTECTED_FILENAMES:
+                        continue
+                    if category == "upload" and now - last_access < self.upload_ttl_seconds:
+                        # Remaining uploads are newer still
+                        break
+                    victim = (path, size)
+                    break
+
+            if victim is None:
+                break
+
+            path, size = victim
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict {path}: {str(e)}")
+                # Move it to the back so the sweep can make progress
+                with self._lock:
+                    if path in self._entries[category]:
+                        self._entries[category].move_to_end(path)
+                break
+
+            self.record_delete(path)
+            with self._lock:
+                self._evicted_files[category] += 1
+                self._evicted_bytes[category] += size
+            freed += size
+            logger.info(f"Evicted {category} {os.path.basename(path)} ({size} bytes)")
+
+        return freed
+
+
+# Shared instance used by the API and the services
+storage_manager = StorageManager(journal_path=STORAGE_JOURNAL_PATH if MULTIPROCESS_MODE else None)
+
+gauge(
+    "dental_storage_usage_bytes",
+    "Disk usage of managed files by category",
+    ["category"],
+    callback=lambda: {(category,): usage for category, usage in storage_manager.get_stats()["usage_by_category"].items()},
+    multiprocess_mode="max"
+)
+gauge(
+    "dental_storage_evicted_bytes",
+    "Bytes evicted by the storage quota manager by category",
+    ["category"],
+    callback=lambda: {(category,): evicted for category, evicted in storage_manager.get_stats()["evicted_bytes"].items()},
+    multiprocess_mode="max"
+)
@@ -0,0 +1,136 @@
+"""
+Warm-up and readiness.
+
+After startup a background thread primes everything the first real request
+would otherwise pay for: the DICOM decoder plugins, pooled connections to the
+detection and report upstreams, and one synthetic DICOM-to-PNG conversion.
+``/ready`` reports ready only once this has finished, so load balancers send
+traffic to warm instances. ``/health`` keeps reporting liveness immediately.
+
+A failed step is logged and reported but does not keep the instance out of
+rotation: an unreachable upstream is no reason to refuse image uploads.
+"""
+
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import WARMUP_ENABLED, WARMUP_UPSTREAMS, TEST_MODE
+from app.services import dicom_service, openai_service, roboflow_service
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    Warm-up progress of this process
+    """
+
+    def __init__(self):
+        self.state = "starting"
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.duration_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def record_step(self, name: str, status: str, duration: float, error: Optional[str] = None) -> None:
+        step = {"status": status, "duration_ms": round(duration * 1000, 3)}
+        if error is not None:
+            step["error"] = error
+        with self._lock:
+            self.steps[name] = step
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.state,
+                "warmup_ms": round(self.duration_seconds * 1000, 3) if self.duration_seconds is not None else None,
+                "steps": dict(self.steps)
+            }
+
+
+# Shared instance reported by /ready
+readiness = Readiness()
+
+
+def prime_decoders() -> None:
+    """
+    Load pydicom's pixel data handlers and the pylibjpeg decoder plugins
+    """
+    import pydicom.config
+    from pydicom.pixel_data_handlers import pylibjpeg_handler
+
+    available = [handler.__name__.rsplit(".", 1)[-1] for handler in pydicom.config.pixel_data_handlers if handler.is_available()]
+    logger.info(f"Available pixel data handlers: {', '.join(available)}")
+    if pylibjpeg_handler.is_available():
+        # Plugin discovery scans package metadata; do it once, now
+        from pylibjpeg.utils import get_pixel_data_decoders
+        get_pixel_data_decoders()
+
+
+def synthetic_conversion() -> None:
+    """
+    Convert a small generated DICOM image, exercising the whole pipeline
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        dicom_path = Path(directory) / "warmup.dcm"
+        dicom_service.create_synthetic_dicom(dicom_path)
+        dicom_service.convert_using_pydicom_direct(str(dicom_path), Path(directory) / "warmup.png")
+
+
+def warmup_steps(include_upstreams: bool) -> List[Tuple[str, Callable[[], None]]]:
+    steps = [
+        ("decoders", prime_decoders),
+        ("synthetic_conversion", synthetic_conversion)
+    ]
+    if include_upstreams:
+        if roboflow_service.is_configured():
+            steps.append(("roboflow_connection", roboflow_service.warm_up))
+        if openai_service.is_configured():
+            steps.append(("openai_connection", openai_service.warm_up))
+    return steps
+
+
+def run_warmup(include_upstreams: bool = WARMUP_UPSTREAMS and not TEST_MODE) -> Dict[str, Any]:
+    """
+    Run all warm-up steps and mark the process as ready
+
+    Args:
+        include_upstreams: Open connections to the configured upstream APIs
+
+    Returns:
+        Readiness status
+    """
+    readiness.state = "warming_up"
+    readiness.started_at = time.perf_counter()
+
+    for name, step in warmup_steps(include_upstreams):
+        started = time.perf_counter()
+        try:
+            step()
+            readiness.record_step(name, "ok", time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+            readiness.record_step(name, "failed", time.perf_counter() - started, str(e))
+
+    readiness.duration_seconds = time.perf_counter() - readiness.started_at
+    readiness.state = "ready"
+    logger.info(f"Warm-up finished in {readiness.duration_seconds * 1000:.1f}ms")
+    return readiness.get_status()
+
+
+def start_warmup() -> None:
+    """
+    Run the warm-up in a background thread so that startup is not delayed
+    """
+    if not WARMUP_ENABLED:
+        readiness.state = "ready"
+        return
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
@@ -0,0 +1,332 @@
+"""
+Admission control and per-client rate limiting.
+
+Requests are sorted into route classes by the kind of resource they hold:
+
+- ``read``: cheap lookups (images, results, stats)
+- ``conversion``: uploads, which parse and convert DICOM files on the CPU
+- ``upstream``: detection and reports, which wait on Roboflow and OpenAI
+
+Each class has its own in-flight cap. Requests over the cap wait in a FIFO
+queue, and a request whose expected wait (queue position times the recent
+service time of the class) exceeds the latency target of its class is
+rejected right away with 503 and ``Retry-After`` instead of joining a queue
+it would time out in. Rejecting early keeps the queue short enough that the
+requests that are admitted still finish within their target.
+
+On top of that, every client has a token bucket. Uploads, detection and
+reports cost more tokens than reads, so a client looping over
+``/upload-multiple/`` runs out long before one browsing images does, and
+gets 429 with ``Retry-After`` when its bucket is empty.
+
+State is per worker process: the per-client rate is divided by the worker
+count, and the in-flight caps apply to each worker.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import (
+    API_PREFIX, WORKER_COUNT, ADMISSION_CONTROL_ENABLED, RATE_LIMIT_PER_CLIENT, RATE_LIMIT_BURST,
+    RATE_LIMIT_TRUST_FORWARDED, ADMISSION_READ_CONCURRENCY, ADMISSION_CONVERSION_CONCURRENCY,
+    ADMISSION_UPSTREAM_CONCURRENCY, ADMISSION_READ_MAX_WAIT_SECONDS, ADMISSION_CONVERSION_MAX_WAIT_SECONDS,
+    ADMISSION_UPSTREAM_MAX_WAIT_SECONDS
+)
+from app.utils.metrics import counter, gauge
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+READ = "read"
+CONVERSION = "conversion"
+UPSTREAM = "upstream"
+
+# (methods, path pattern below API_PREFIX, class, tokens charged); the first
+# match wins. Resumable upload chunks hold a conversion slot (the last one
+# converts) but cost no more than a read, since a file arrives in many chunks.
+ROUTE_CLASSES = [
+    ({"POST"}, re.compile(r"^/(upload|upload-multiple|upload-archive)/?$"), CONVERSION, 5),
+    ({"POST", "PATCH"}, re.compile(r"^/uploads(/.*)?$"), CONVERSION, 1),
+    ({"POST"}, re.compile(r"^/(detect|report)/[^/]+$"), UPSTREAM, 5),
+    ({"POST"}, re.compile(r"^/detect-batch/?$"), UPSTREAM, 5)
+]
+READ_COST = 1
+
+# Health checks and metrics scrapes are never limited
+EXEMPT_PATHS = {"/", "/metrics", f"{API_PREFIX}/health", f"{API_PREFIX}/ready"}
+
+# Number of client buckets kept per worker (least recently seen are dropped)
+MAX_TRACKED_CLIENTS = 10000
+
+ADMISSION_REJECTED_TOTAL = counter(
+    "dental_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["route_class", "reason"]
+)
+
+
+def classify_request(method: str, path: str) -> Optional[Tuple[str, int]]:
+    """
+    Route class and token cost of a request, or None when it is exempt from admission control
+    """
+    if path in EXEMPT_PATHS:
+        return None
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX):]
+    for methods, pattern, route_class, cost in ROUTE_CLASSES:
+        if method in methods and pattern.match(path):
+            return route_class, cost
+    return READ, READ_COST
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at ``rate`` tokens per second up to ``burst``
+    """
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, cost: float, now: Optional[float] = None) -> float:
+        """
+        Take tokens if available
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (cost - self.tokens) / self.rate
+
+
+class ConcurrencyLimit:
+    """
+    In-flight cap with a FIFO wait queue and a latency target for one route class
+    """
+
+    # Weight of the latest request in the service time average
+    SMOOTHING = 0.2
+
+    def __init__(self, name: str, limit: int, max_wait: float, initial_service_time: float = 0.1):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.service_time = initial_service_time
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def expected_wait(self) -> float:
+        """
+        Seconds a request arriving now is expected to wait for a slot
+        """
+        if self.in_flight < self.limit and not self.queued:
+            return 0.0
+        return (self.queued + 1) / self.limit * self.service_time
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a slot, at most max_wait seconds
+
+        Returns:
+            Whether a slot was acquired
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot over by resolving the future
+            await asyncio.wait_for(waiter, self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # The client went away just after being handed a slot
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, duration: float) -> None:
+        self.service_time += self.SMOOTHING * (duration - self.service_time)
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "service_time_seconds": round(self.service_time, 4),
+            "max_wait_seconds": self.max_wait
+        }
+
+
+class AdmissionController:
+    """
+    Per-client token buckets and per-class concurrency limits of one worker
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_PER_CLIENT / max(1, WORKER_COUNT),
+        burst: float = RATE_LIMIT_BURST,
+        limits: Optional[Dict[str, Tuple[int, float]]] = None
+    ):
+        self.rate = rate
+        self.burst = burst
+        if limits is None:
+            limits = {
+                READ: (ADMISSION_READ_CONCURRENCY, ADMISSION_READ_MAX_WAIT_SECONDS),
+                CONVERSION: (ADMISSION_CONVERSION_CONCURRENCY, ADMISSION_CONVERSION_MAX_WAIT_SECONDS),
+                UPSTREAM: (ADMISSION_UPSTREAM_CONCURRENCY, ADMISSION_UPSTREAM_MAX_WAIT_SECONDS)
+            }
+        self.limits = {name: ConcurrencyLimit(name, limit, max_wait) for name, (limit, max_wait) in limits.items()}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check_rate(self, client: str, cost: float) -> float:
+        """
+        Charge a request to its client's bucket
+
+        Returns:
+            0 if admitted, otherwise the seconds until the client may retry
+        """
+        if self.rate <= 0 and self.burst <= 0:
+            return 0.0
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(cost)
+
+    def reset(self) -> None:
+        """
+        Forget all client buckets
+        """
+        self._buckets.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_client": self.rate,
+            "burst": self.burst,
+            "tracked_clients": len(self._buckets),
+            "route_classes": {name: limit.get_stats() for name, limit in self.limits.items()}
+        }
+
+
+# Shared instance of this worker
+admission_controller = AdmissionController()
+
+ADMISSION_QUEUE_DEPTH = gauge(
+    "dental_admission_queued_requests",
+    "Requests waiting for an admission slot",
+    ["route_class"],
+    callback=lambda: {(name,): limit.queued for name, limit in admission_controller.limits.items()}
+)
+ADMISSION_IN_FLIGHT = gauge(
+    "dental_admission_in_flight_requests",
+    "Admitted requests being processed",
+    ["route_class"],
+    callback=lambda: {(name,): limit.in_flight for name, limit in admission_controller.limits.items()}
+)
+
+
+def client_key(scope: Scope, trust_forwarded: bool = RATE_LIMIT_TRUST_FORWARDED) -> str:
+    """
+    Address the rate limit applies to. Behind a proxy the last X-Forwarded-For
+    entry is the address the proxy saw; earlier entries are client-supplied.
+    """
+    if trust_forwarded:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    seconds = max(1, math.ceil(min(retry_after, 3600)))
+    return JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": str(seconds)})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the rate limits and concurrency caps of an AdmissionController
+    """
+
+    def __init__(self, app: ASGIApp, controller: Optional[AdmissionController] = None, enabled: bool = ADMISSION_CONTROL_ENABLED):
+        self.app = app
+        self.controller = controller or admission_controller
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        classified = classify_request(scope.get("method", ""), scope.get("path", ""))
+        if classified is None:
+            await self.app(scope, receive, send)
+            return
+        route_class, cost = classified
+
+        retry_after = self.controller.check_rate(client_key(scope), cost)
+        if retry_after > 0:
+            ADMISSION_REJECTED_TOTAL.inc(route_class=route_class, reason="rate_limit")
+            await _reject(429, "Too many requests", retry_after)(scope, receive, send)
+            return
+
+        # Shed now rather than queue a request that would miss its target anyway
+        limit = self.controller.limits[route_class]
+        expected_wait = limit.expected_wait()
+        if expected_wait > limit.max_wait:
+            ADMISSION_REJECTED_TOTAL.inc(route_class=route_class, reason="overloaded")
+            await _reject(503, "Server overloaded", expected_wait)(scope, receive, send)
+            return
+
+        if not await limit.acquire():
+            ADMISSION_REJECTED_TOTAL.inc(route_class=route_class, reason="queue_timeout")
+            await _reject(503, "Server overloaded", limit.max_wait)(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release(time.perf_counter() - started)
@@ -0,0 +1,66 @@
+"""
+Lazy module imports.
+
+Heavy dependencies (pydicom, numpy, Pillow, openai, requests) are only needed
+once a request touches them, so the service modules bind them through
+``lazy_import``: the real import happens on first attribute access, off the
+cold-start path.
+"""
+
+import importlib
+import threading
+import time
+import types
+from typing import Any
+
+from app.utils.startup_timing import record_lazy_import
+
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy that imports the real module on first attribute access
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_module"]
+                if module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    record_lazy_import(self.__name__, time.perf_counter() - started)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Return a proxy for a module that is imported when first used
+
+    Args:
+        name: Absolute module name, e.g. "numpy" or "PIL.Image"
+    """
+    return LazyModule(name)
+
+
+def is_loaded(module: Any) -> bool:
+    """
+    Whether a module returned by lazy_import has been imported yet
+    """
+    return not isinstance(module, LazyModule) or module.__dict__["_module"] is not None
@@ -0,0 +1,131 @@
+"""
+Cross-process coordination helpers.
+
+File locks (``fcntl.flock``) on files under ``RUNTIME_DIR/locks`` serialize
+work across gunicorn workers as well as across threads of one worker, since
+every acquisition opens its own file description. A lock file is removed by
+its holder on release, so per-file names (``convert-<id>``, ``detect-<id>``)
+do not accumulate; a waiter that wakes up on a removed file retries on the
+current one. Writes that other workers
+may read concurrently go through ``atomic_write`` so readers never see a
+partially written file.
+"""
+
+import errno
+import fcntl
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+from app.core.config import RUNTIME_DIR
+
+LOCKS_DIR = RUNTIME_DIR / "locks"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class LockTimeout(Exception):
+    """
+    Raised when a lock cannot be acquired in time
+    """
+
+
+def _lock_path(name: str) -> Path:
+    safe_name = _UNSAFE_CHARS.sub("_", name)
+    if len(safe_name) > 100:
+        safe_name = hashlib.sha1(name.encode("utf-8")).hexdigest()
+    LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+    return LOCKS_DIR / f"{safe_name}.lock"
+
+
+def _is_current(handle: IO, path: Path) -> bool:
+    # False if the previous holder removed (or replaced) the file we locked
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(handle.fileno())
+    return (st.st_dev, st.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+@contextmanager
+def file_lock(name: str, timeout: Optional[float] = None, poll_interval: float = 0.05) -> Iterator[None]:
+    """
+    Hold an exclusive lock shared by all processes on this machine
+
+    Args:
+        name: Lock name (any string)
+        timeout: Seconds to wait before raising LockTimeout (None waits forever)
+        poll_interval: Seconds between attempts while waiting with a timeout
+    """
+    path = _lock_path(name)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        handle = open(path, "a")
+        try:
+            if deadline is None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except OSError as e:
+                        if e.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                        if time.monotonic() >= deadline:
+                            raise LockTimeout(f"Timed out waiting for lock {name}")
+                        time.sleep(poll_interval)
+        except BaseException:
+            handle.close()
+            raise
+        if _is_current(handle, path):
+            break
+        handle.close()
+    try:
+        yield
+    finally:
+        # Remove the file while still holding the lock, then release it
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        handle.close()
+
+
+def try_acquire_lock(name: str) -> Optional[IO]:
+    """
+    Try to take a long-lived lock without blocking (e.g. to elect one worker
+    for a background job). The lock is held until the returned handle is closed
+    or the process exits.
+
+    Returns:
+        An open handle holding the lock, or None if another process holds it
+    """
+    handle = open(_lock_path(name), "a")
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def atomic_write(path: Union[str, Path], data: bytes) -> None:
+    """
+    Write a file so that readers see either the old or the new content
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
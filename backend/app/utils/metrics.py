@@ -0,0 +1,453 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock, so
+recording a value costs a dictionary lookup and a few additions. Gauges can be
+backed by a callback that is evaluated only when /metrics is scraped (or when
+a worker writes its snapshot in multi-worker mode).
+"""
+
+import atexit
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import MULTIPROCESS_MODE, RUNTIME_DIR, METRICS_FLUSH_INTERVAL_SECONDS
+from app.utils.locks import atomic_write
+from app.utils.serialization import dumps, loads
+from app.utils.tracing import record_span
+
+METRICS_MULTIPROC_DIR = RUNTIME_DIR / "metrics"
+
+# Latency buckets in seconds, from cache lookups to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _render_samples(metric: "_Metric", samples: Dict[LabelValues, object], labelnames: Sequence[str]) -> List[str]:
+    lines = []
+    for key, value in sorted(samples.items()):
+        if metric.kind != "histogram":
+            lines.append(f"{metric.name}{_format_labels(labelnames, key)} {_format_value(value)}")
+            continue
+        cumulative = 0.0
+        for bound, count in zip(metric.buckets, value):
+            cumulative += count
+            labels = _format_labels(labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{metric.name}_bucket{labels} {_format_value(cumulative)}")
+        labels = _format_labels(labelnames, key, ("le", "+Inf"))
+        lines.append(f"{metric.name}_bucket{labels} {_format_value(value[-1])}")
+        lines.append(f"{metric.name}_sum{_format_labels(labelnames, key)} {_format_value(value[-2])}")
+        lines.append(f"{metric.name}_count{_format_labels(labelnames, key)} {_format_value(value[-1])}")
+    return lines
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def collect(self) -> Dict[LabelValues, object]:
+        """
+        Return the current value of every label combination
+        """
+        raise NotImplementedError
+
+    def render(self, samples: Optional[Dict[LabelValues, object]] = None, labelnames: Optional[Sequence[str]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        samples = self.collect() if samples is None else samples
+        lines.extend(_render_samples(self, samples, self.labelnames if labelnames is None else labelnames))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> Dict[LabelValues, object]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down, optionally computed at scrape time.
+
+    ``multiprocess_mode`` controls how values from several worker processes
+    are combined: "sum" (e.g. in-flight requests), "max" (values every worker
+    sees the same way) or "pid" (one series per worker, with a pid label).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+        multiprocess_mode: str = "sum"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> Dict[LabelValues, object]:
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception:
+                pass
+        return values
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> float:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[-1] if state else 0.0
+
+    def collect(self) -> Dict[LabelValues, object]:
+        with self._lock:
+            return {key: list(state) for key, state in self._values.items()}
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+
+    In multi-worker mode every worker periodically writes a snapshot of its
+    metrics to ``RUNTIME_DIR/metrics/<pid>.json``; rendering merges the
+    snapshots of all workers so that any worker can answer a scrape.
+    """
+
+    def __init__(self, multiprocess_dir: Optional[Path] = None):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        if self.multiprocess_dir is not None:
+            return self._render_multiprocess()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self) -> None:
+        """
+        Write this process's metrics to the shared metrics directory
+        """
+        if self.multiprocess_dir is None:
+            return
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {
+            "pid": os.getpid(),
+            "metrics": {metric.name: [[list(key), value] for key, value in metric.collect().items()] for metric in metrics}
+        }
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.multiprocess_dir / f"{os.getpid()}.json", dumps(snapshot))
+
+    def _render_multiprocess(self) -> str:
+        self.write_snapshot()
+        snapshots = []
+        for path in self.multiprocess_dir.glob("*.json"):
+            try:
+                snapshots.append(loads(path.read_bytes()))
+            except (OSError, ValueError):
+                continue
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            merged: Dict[LabelValues, object] = {}
+            labelnames = metric.labelnames
+            if isinstance(metric, Gauge) and metric.multiprocess_mode == "pid":
+                labelnames = labelnames + ("pid",)
+
+            for snapshot in snapshots:
+                pid = snapshot["pid"]
+                if isinstance(metric, Gauge) and not _pid_alive(pid):
+                    # Gauges of workers that have exited are meaningless
+                    continue
+                for key, value in snapshot["metrics"].get(metric.name, []):
+                    key = tuple(key)
+                    if isinstance(metric, Histogram):
+                        if len(value) != len(metric.buckets) + 2:
+                            continue
+                        current = merged.get(key)
+                        merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                    elif isinstance(metric, Gauge) and metric.multiprocess_mode == "pid":
+                        merged[key + (str(pid),)] = value
+                    elif isinstance(metric, Gauge) and metric.multiprocess_mode == "max":
+                        merged[key] = max(merged.get(key, value), value)
+                    else:
+                        merged[key] = merged.get(key, 0.0) + value
+            lines.extend(metric.render(merged, labelnames))
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+registry = Registry(METRICS_MULTIPROC_DIR if MULTIPROCESS_MODE else None)
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    multiprocess_mode: str = "sum"
+) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, callback, multiprocess_mode))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render_metrics() -> str:
+    """
+    Render all registered metrics in the Prometheus text format
+    """
+    return registry.render()
+
+
+def start_metrics_flusher(interval: float = METRICS_FLUSH_INTERVAL_SECONDS) -> None:
+    """
+    Periodically write this worker's metrics snapshot (multi-worker mode only)
+    """
+    if registry.multiprocess_dir is None:
+        return
+
+    def run() -> None:
+        while True:
+            try:
+                registry.write_snapshot()
+            except Exception:
+                pass
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="metrics-flusher", daemon=True).start()
+    atexit.register(registry.write_snapshot)
+
+
+# Pipeline metrics shared by the API and the services
+STAGE_DURATION = histogram(
+    "dental_stage_duration_seconds",
+    "Duration of pipeline stages",
+    ["stage"]
+)
+FALLBACK_TOTAL = counter(
+    "dental_conversion_fallback_total",
+    "DICOM conversions that fell back to the synthetic sample image"
+)
+CONVERSIONS_TOTAL = counter(
+    "dental_conversions_total",
+    "DICOM conversions by the method that succeeded",
+    ["method"]
+)
+UPSTREAM_ERRORS_TOTAL = counter(
+    "dental_upstream_errors_total",
+    "Failed calls to upstream services",
+    ["upstream"]
+)
+REQUESTS_IN_FLIGHT = gauge(
+    "dental_http_requests_in_flight",
+    "HTTP requests currently being processed"
+)
+REQUEST_DURATION = histogram(
+    "dental_http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"]
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """
+    Record the duration of a pipeline stage, both in the stage histogram and
+    as a span of the current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_DURATION.observe(duration, stage=stage)
+        record_span(stage, started, duration)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording in-flight requests and latency per route
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; use its template
+            # rather than the raw path to keep label cardinality bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=scope.get("method", ""),
+                route=route_path,
+                status=str(status["code"])
+            )
@@ -0,0 +1,90 @@
+"""
+Vectorized non-maximum suppression for detection boxes.
+"""
+
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+def box_iou(box, boxes):
+    """
+    Intersection over union of one box with many boxes
+
+    Args:
+        box: Array of shape (4,) as (x1, y1, x2, y2)
+        boxes: Array of shape (n, 4)
+
+    Returns:
+        Array of shape (n,) with IoU values
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area + areas - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def non_max_suppression(boxes, scores, classes, iou_threshold: float):
+    """
+    Greedy per-class NMS: keep the highest-scoring box and drop boxes of the
+    same class that overlap it by more than the threshold
+
+    Args:
+        boxes: Array of shape (n, 4) as (x1, y1, x2, y2)
+        scores: Array of shape (n,)
+        classes: Array of shape (n,) with integer class indices
+        iou_threshold: Boxes with a higher IoU are suppressed (0-1)
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Shift each class into its own region so boxes of different classes never overlap
+    offsets = np.asarray(classes, dtype=np.float64)[:, None] * (boxes.max() - boxes.min() + 1)
+    shifted = boxes + offsets
+
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        order = rest[box_iou(shifted[best], shifted[rest]) <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def suppress_predictions(predictions, iou_threshold: float):
+    """
+    Per-class NMS over detection predictions (centre x/y, width, height)
+
+    Args:
+        predictions: Prediction dictionaries with class, confidence and box
+        iou_threshold: Boxes with a higher IoU are suppressed (0-1)
+
+    Returns:
+        The kept predictions, in their original order
+    """
+    if len(predictions) < 2:
+        return list(predictions)
+
+    class_names = [prediction.get("class", "") for prediction in predictions]
+    class_index = {name: index for index, name in enumerate(dict.fromkeys(class_names))}
+    centres = np.array([[p["x"], p["y"], p["width"], p["height"]] for p in predictions], dtype=np.float64)
+    boxes = np.column_stack([
+        centres[:, 0] - centres[:, 2] / 2,
+        centres[:, 1] - centres[:, 3] / 2,
+        centres[:, 0] + centres[:, 2] / 2,
+        centres[:, 1] + centres[:, 3] / 2
+    ])
+    scores = [prediction["confidence"] for prediction in predictions]
+    classes = [class_index[name] for name in class_names]
+    keep = non_max_suppression(boxes, scores, classes, iou_threshold)
+    return [predictions[index] for index in sorted(keep)]
@@ -0,0 +1,87 @@
+"""
+Perceptual hashes of normalized images.
+
+Both hashes are 64-bit integers computed with vectorized NumPy on a small
+downscaled copy of the image, so they survive re-export with different
+headers, re-compression and moderate changes in windowing:
+
+- ``dhash`` compares every pixel with its right-hand neighbour. Gradient
+  directions do not change under monotonic windowing, which makes it the
+  default for radiographs.
+- ``phash`` thresholds the low-frequency 8x8 block of a 32x32 DCT at its
+  median, which is more robust to blur and noise.
+"""
+
+from typing import Callable, Dict
+
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+HASH_BITS = 64
+
+
+def _downscale(pixels: "np.ndarray", width: int, height: int) -> "np.ndarray":
+    if pixels.ndim == 3:
+        pixels = pixels.mean(axis=2)
+    if pixels.dtype != np.uint8:
+        span = float(pixels.max() - pixels.min()) or 1.0
+        pixels = (pixels - pixels.min()) / span * 255
+    image = Image.fromarray(pixels.astype(np.uint8))
+    return np.asarray(image.resize((width, height), Image.BOX), dtype=np.float64)
+
+
+def _bits_to_int(bits: "np.ndarray") -> int:
+    return int.from_bytes(np.packbits(bits.ravel().astype(np.uint8)).tobytes(), "big")
+
+
+def dhash(pixels: "np.ndarray", hash_size: int = 8) -> int:
+    """
+    Difference hash: sign of the horizontal gradient on a (hash_size+1) x hash_size thumbnail
+    """
+    small = _downscale(pixels, hash_size + 1, hash_size)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def _dct_matrix(size: int) -> "np.ndarray":
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(pixels: "np.ndarray", hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    DCT hash: low-frequency coefficients compared with their median
+    """
+    size = hash_size * highfreq_factor
+    small = _downscale(pixels, size, size)
+    dct = _dct_matrix(size)
+    coefficients = (dct @ small @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(coefficients > np.median(coefficients))
+
+
+HASH_FUNCTIONS: Dict[str, Callable[["np.ndarray"], int]] = {
+    "dhash": dhash,
+    "phash": phash
+}
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def similarity(distance: int) -> float:
+    """
+    Fraction of matching bits
+    """
+    return 1 - distance / HASH_BITS
+
+
+def max_distance(threshold: float) -> int:
+    """
+    Largest Hamming distance that still meets a similarity threshold
+    """
+    return int((1 - threshold) * HASH_BITS + 1e-9)
@@ -0,0 +1,211 @@
+"""
+On-demand sampling profiler.
+
+A background thread samples the stacks of all other threads at a fixed
+interval and aggregates them in the "folded" format understood by
+flamegraph.pl, speedscope and similar tools (one line per unique stack,
+frames separated by semicolons, followed by the sample count).
+
+Only one profiling session runs at a time. Sessions are started either for a
+single request (``X-Profile: 1`` with a valid admin token) or for a time
+window through the admin API.
+"""
+
+import os
+import re
+import sys
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import PROFILER_INTERVAL_SECONDS, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_MAX_AGE_SECONDS
+from app.core.security import is_admin_token
+from app.utils.tracing import current_trace
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Profile IDs are request IDs; keep them safe to use as file names
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+# Only one profiler may run at a time
+_session_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Samples thread stacks into folded stack counts
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self.started
+
+    def folded(self) -> str:
+        """
+        Return the samples in folded stack format
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+
+def try_start_session(interval: float = PROFILER_INTERVAL_SECONDS) -> Optional[SamplingProfiler]:
+    """
+    Start a profiling session unless one is already running
+
+    Returns:
+        The running profiler, or None if another session is active
+    """
+    if not _session_lock.acquire(blocking=False):
+        return None
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    return profiler
+
+
+def finish_session(profiler: SamplingProfiler) -> None:
+    """
+    Stop a session started with try_start_session
+    """
+    try:
+        profiler.stop()
+    finally:
+        _session_lock.release()
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """
+    Return the file path for a profile ID, or None if the ID is invalid
+    """
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    return PROFILE_DIR / f"{profile_id}.folded"
+
+
+def prune_profiles(max_files: int = PROFILE_MAX_FILES, max_age_seconds: float = PROFILE_MAX_AGE_SECONDS) -> int:
+    """
+    Delete profiles older than max_age_seconds and all but the newest max_files
+
+    Returns:
+        Number of profiles deleted
+    """
+    profiles = []
+    for path in PROFILE_DIR.glob("*.folded"):
+        try:
+            profiles.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    profiles.sort(reverse=True)
+
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for index, (mtime, path) in enumerate(profiles):
+        if index >= max_files or mtime < cutoff:
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
+
+
+def save_profile(profile_id: str, profiler: SamplingProfiler) -> str:
+    """
+    Write folded stacks to the profile directory, pruning old profiles
+
+    Returns:
+        Path to the written file
+    """
+    path = profile_path(profile_id)
+    if path is None:
+        raise ValueError(f"Invalid profile ID: {profile_id}")
+    PROFILE_DIR.mkdir(exist_ok=True)
+    with open(path, "w") as f:
+        f.write(profiler.folded())
+    prune_profiles()
+    return str(path)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a single request when it carries
+    ``X-Profile: 1`` and a valid admin token. The folded stacks are saved
+    under the request ID, returned in the ``X-Profile-Id`` header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") != "1" or not is_admin_token(headers.get("x-admin-token")):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = try_start_session()
+        if profiler is None:
+            # Another session is running; serve the request unprofiled
+            await self.app(scope, receive, send)
+            return
+
+        # Reuse the request ID so the profile can be matched with the trace
+        trace = current_trace()
+        profile_id = trace.trace_id if trace is not None else ""
+        if profile_path(profile_id) is None:
+            profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_session(profiler)
+            path = save_profile(profile_id, profiler)
+            logger.info(f"Saved request profile {path} ({profiler.sample_count} samples)")
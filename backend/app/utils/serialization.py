@@ -0,0 +1,58 @@
+"""
+Fast JSON serialization helpers.
+
+orjson is used when it is installed and the standard library otherwise.
+JSON artifacts above a size threshold are stored gzip-compressed under the
+same name; readers detect the gzip magic bytes, so small and large artifacts
+are read the same way.
+"""
+
+import gzip
+import json
+from typing import Any, Union
+
+from app.core.config import JSON_ARTIFACT_COMPRESS_MIN_BYTES
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize an object to UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Deserialize JSON from bytes or str
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_json_artifact(obj: Any) -> bytes:
+    """
+    Serialize an artifact for storage, compressing it when it is large
+    """
+    data = dumps(obj)
+    if len(data) >= JSON_ARTIFACT_COMPRESS_MIN_BYTES:
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def decode_json_artifact(data: bytes) -> Any:
+    """
+    Deserialize a stored artifact, whether or not it was compressed
+    """
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    return loads(data)
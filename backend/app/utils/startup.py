@@ -4,35 +4,66 @@ These functions are called when the application starts to ensure proper initiali
 """
 
 import os
-import numpy as np
-from PIL import Image
+import shutil
 from pathlib import Path
 import logging
 
 from app.core.config import UPLOADS_DIR, PROCESSED_DIR
+from app.services.findings_index import start_findings_catch_up
+from app.services.storage_manager import storage_manager
+from app.services.warmup import start_warmup
+from app.utils.metrics import start_metrics_flusher
+from app.utils.startup_timing import timed_step
 
 logger = logging.getLogger(__name__)
 
+# Pre-rendered copy of the placeholder image (see render_placeholder_image)
+PLACEHOLDER_ASSET = Path(__file__).resolve().parent.parent / "assets" / "placeholder.png"
+
 def initialize_app():
     """
     Initialize the application.
     - Create necessary directories
     - Create placeholder files for testing
+    - Start the storage quota sweeper
+    - Start the metrics flusher in multi-worker mode
+    - Start the warm-up that gates readiness
+    - Index detection results saved before the findings index existed
     """
     logger.info("Initializing application...")
     
     # Ensure directories exist
-    UPLOADS_DIR.mkdir(exist_ok=True)
-    PROCESSED_DIR.mkdir(exist_ok=True)
+    with timed_step("directories"):
+        UPLOADS_DIR.mkdir(exist_ok=True)
+        PROCESSED_DIR.mkdir(exist_ok=True)
     
     # Create a placeholder image for testing
-    create_placeholder_image()
+    with timed_step("placeholder_image"):
+        create_placeholder_image()
+    
+    # Track disk usage and evict old artifacts in the background
+    with timed_step("storage_manager"):
+        storage_manager.start()
+    
+    # Share this worker's metrics with the others (multi-worker mode only)
+    with timed_step("metrics_flusher"):
+        start_metrics_flusher()
+    
+    # Prime decoders and upstream connections; /ready reports when done
+    with timed_step("warmup_start"):
+        start_warmup()
+    
+    # Catch the findings index up with results saved before it existed
+    with timed_step("findings_index"):
+        start_findings_catch_up()
     
     logger.info("Application initialized successfully")
 
 def create_placeholder_image():
     """
-    Create a placeholder image to use as a fallback
+    Create a placeholder image to use as a fallback.
+    Copies the pre-rendered asset when available, so startup does not need
+    numpy or Pillow.
     """
     placeholder_path = PROCESSED_DIR / "placeholder.png"
     
@@ -41,23 +72,29 @@ def create_placeholder_image():
         return
     
     try:
-        # Create a simple gradient test image
-        width, height = 400, 300
-        image = np.zeros((height, width, 3), dtype=np.uint8)
-        
-        # Create a gradient background
-        for y in range(height):
-            for x in range(width):
-                image[y, x] = [
-                    int(255 * (1 - y/height)),
-                    int(255 * (x/width * 0.7)),
-                    int(255 * (y/height * 0.5 + 0.2))
-                ]
-        
-        # Convert to PIL Image and save
-        img = Image.fromarray(image)
-        img.save(placeholder_path)
+        if PLACEHOLDER_ASSET.exists():
+            shutil.copyfile(PLACEHOLDER_ASSET, placeholder_path)
+        else:
+            render_placeholder_image(placeholder_path)
         
         logger.info(f"Created placeholder image at {placeholder_path}")
     except Exception as e:
-        logger.error(f"Failed to create placeholder image: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Failed to create placeholder image: {str(e)}")
+
+def render_placeholder_image(output_path: Path, width: int = 400, height: int = 300):
+    """
+    Render the gradient placeholder image (also used to build the bundled asset)
+    """
+    import numpy as np
+    from PIL import Image
+    
+    # Create a simple gradient test image
+    y = np.arange(height, dtype=np.float64)[:, None] / height
+    x = np.arange(width, dtype=np.float64)[None, :] / width
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (255 * (1 - y)).astype(np.uint8)
+    image[..., 1] = (255 * (x * 0.7)).astype(np.uint8)
+    image[..., 2] = (255 * (y * 0.5 + 0.2)).astype(np.uint8)
+    
+    # Convert to PIL Image and save
+    Image.fromarray(image).save(output_path)
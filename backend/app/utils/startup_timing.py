@@ -0,0 +1,103 @@
+"""
+Startup timing report.
+
+Records how long the application spends importing modules and running each
+initialization step, so cold starts can be tracked. Modules loaded lazily on
+first use (see ``app.utils.lazy``) are recorded as well, with the time they
+were first needed.
+"""
+
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Any, Dict, Iterator
+
+# Setup logger
+logger = logging.getLogger(__name__)
+
+# Process-relative reference point: the first import of this module
+BOOT_STARTED = time.perf_counter()
+
+_imports: Dict[str, float] = {}
+_lazy_imports: Dict[str, Dict[str, float]] = {}
+_steps: Dict[str, float] = {}
+_ready_seconds = None
+
+
+@contextmanager
+def timed_import(name: str) -> Iterator[None]:
+    """
+    Time an eager import made while the application boots
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _imports[name] = time.perf_counter() - started
+
+
+def import_timed(name: str) -> ModuleType:
+    """
+    Import a module and record how long it took, for modules the
+    application does not use directly but whose import cost should be
+    reported on its own
+    """
+    with timed_import(name):
+        return importlib.import_module(name)
+
+
+@contextmanager
+def timed_step(name: str) -> Iterator[None]:
+    """
+    Time one initialization step
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = time.perf_counter() - started
+
+
+def record_lazy_import(name: str, seconds: float) -> None:
+    """
+    Record a module that was imported on first use
+    """
+    _lazy_imports[name] = {
+        "seconds": seconds,
+        "after_boot_seconds": time.perf_counter() - BOOT_STARTED
+    }
+
+
+def mark_started() -> None:
+    """
+    Record the time at which startup finished
+    """
+    global _ready_seconds
+    _ready_seconds = time.perf_counter() - BOOT_STARTED
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """
+    Return import and initialization timings in milliseconds
+    """
+    def ms(seconds: float) -> float:
+        return round(seconds * 1000, 3)
+
+    return {
+        "startup_ms": ms(_ready_seconds) if _ready_seconds is not None else None,
+        "imports_ms": {name: ms(seconds) for name, seconds in _imports.items()},
+        "steps_ms": {name: ms(seconds) for name, seconds in _steps.items()},
+        "lazy_imports_ms": {
+            name: {"import": ms(entry["seconds"]), "first_use_after": ms(entry["after_boot_seconds"])}
+            for name, entry in _lazy_imports.items()
+        }
+    }
+
+
+def log_startup_report() -> None:
+    report = get_startup_report()
+    imports = ", ".join(f"{name}={duration:.1f}ms" for name, duration in report["imports_ms"].items())
+    steps = ", ".join(f"{name}={duration:.1f}ms" for name, duration in report["steps_ms"].items())
+    logger.info(f"Started in {report['startup_ms']:.1f}ms (imports: {imports}; init: {steps})")
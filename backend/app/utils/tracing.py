@@ -0,0 +1,146 @@
+"""
+Request-scoped timing spans.
+
+Each HTTP request gets a trace stored in a context variable. Pipeline stages
+recorded with ``span`` (or ``observe_stage`` from the metrics module) are
+appended to it, reported back in a ``Server-Timing`` header and, when
+``TRACE_LOG_SPANS`` is enabled, logged as one structured JSON line per request.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import TRACE_LOG_SPANS
+from app.utils.serialization import dumps
+
+# Setup logger
+logger = logging.getLogger("app.trace")
+
+REQUEST_ID_HEADER = "x-request-id"
+
+
+class Trace:
+    """
+    Spans recorded while handling one request
+    """
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, duration: float, **attributes: Any) -> None:
+        span = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name
+        }
+        if attributes:
+            span["attributes"] = attributes
+        # Spans may be recorded from worker threads
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Total duration in milliseconds per span name
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+        return totals
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [f"{name};dur={duration:.3f}" for name, duration in self.summary().items()]
+        entries.append(f"total;dur={total_seconds * 1000:.3f}")
+        return ", ".join(entries)
+
+    def to_dict(self, total_seconds: float, status: int) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.started_at,
+            "status": status,
+            "duration_ms": round(total_seconds * 1000, 3),
+            "spans": spans
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_span(name: str, started: float, duration: float, **attributes: Any) -> None:
+    """
+    Add a finished span to the current trace, if there is one
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, started, duration, **attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    Time a block of code as a span of the current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, started, time.perf_counter() - started, **attributes)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that creates a trace per request, adds a Server-Timing
+    header and optionally logs the spans as JSON
+    """
+
+    def __init__(self, app: ASGIApp, log_spans: bool = TRACE_LOG_SPANS):
+        self.app = app
+        self.log_spans = log_spans
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        trace = Trace(request_id, f"{scope.get('method', '')} {scope.get('path', '')}")
+        token = _current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["Server-Timing"] = trace.server_timing(time.perf_counter() - trace.started)
+                headers["X-Request-ID"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if self.log_spans:
+                total = time.perf_counter() - trace.started
+                logger.info(dumps(trace.to_dict(total, status["code"])).decode("utf-8"))
@@ -0,0 +1,293 @@
+"""
+Offline backfill: reconvert (and optionally re-detect and re-report) stored
+DICOM files on all cores, without going through the HTTP API.
+
+Progress is appended to a checkpoint file, one JSON line per file with the
+SHA-256 of the source and the conversion version (and model id) it was
+processed with. A rerun skips files whose checkpoint entry is still current,
+so an interrupted backfill resumes where it stopped and bumping
+CONVERSION_VERSION or changing the model reprocesses everything.
+
+Usage:
+    python backfill.py [--source uploads/] [--workers 8] [--detect] [--report] [--force]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import UPLOADS_DIR, RUNTIME_DIR, ROBOFLOW_MODEL_ID, BACKFILL_NICE
+from app.services.scheduler import priority, set_priority, BULK
+from app.utils.logger import get_logger
+
+# Create logger
+logger = get_logger("backfill")
+
+DICOM_EXTENSIONS = (".dcm", ".rvg")
+DEFAULT_CHECKPOINT = RUNTIME_DIR / "backfill_checkpoint.jsonl"
+PROGRESS_INTERVAL_SECONDS = 5.0
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_dicom_files(source: Path) -> Iterator[Path]:
+    """
+    Walk a directory tree for DICOM files, in a stable order
+    """
+    for directory, subdirectories, filenames in os.walk(source):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(DICOM_EXTENSIONS) and not filename.startswith("."):
+                yield Path(directory) / filename
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Read the checkpoint file; the last line for a file id wins
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            records[record["file_id"]] = record
+    return records
+
+
+def wanted_versions(detect: bool, report: bool) -> Dict[str, Any]:
+    from app.services.dicom_service import CONVERSION_VERSION
+
+    versions: Dict[str, Any] = {"conversion_version": CONVERSION_VERSION}
+    if detect:
+        versions["model_id"] = ROBOFLOW_MODEL_ID
+    if report:
+        versions["report"] = True
+    return versions
+
+
+def is_current(record: Optional[Dict[str, Any]], sha256: str, versions: Dict[str, Any]) -> bool:
+    if record is None or record.get("status") != "ok" or record.get("sha256") != sha256:
+        return False
+    return all(record.get(key) == value for key, value in versions.items())
+
+
+def _init_worker() -> None:
+    # Keep per-file conversion logs out of the progress output
+    logging.getLogger().setLevel(logging.WARNING)
+    # Leave the CPU to API workers serving interactive requests on the same host
+    if BACKFILL_NICE > 0:
+        try:
+            os.nice(BACKFILL_NICE)
+        except OSError:
+            pass
+    set_priority(BULK)
+
+
+def process_file(
+    path: str,
+    file_id: str,
+    previous: Optional[Dict[str, Any]],
+    versions: Dict[str, Any],
+    force: bool
+) -> Dict[str, Any]:
+    """
+    Process one file in a worker process
+
+    Returns:
+        Checkpoint record, with status "ok", "skipped" or "failed"
+    """
+    from app.services.dicom_service import convert_dicom_to_png
+    from app.services.storage_backend import get_storage, processed_key
+
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"file_id": file_id, "path": path, "bytes": os.path.getsize(path)}
+    try:
+        record["sha256"] = file_sha256(Path(path))
+        png_exists = get_storage().exists(processed_key(f"{file_id}.png"))
+        if not force and png_exists and is_current(previous, record["sha256"], versions):
+            record["status"] = "skipped"
+            return record
+
+        png_path = convert_dicom_to_png(path, file_id)
+        if versions.get("model_id") is not None:
+            from app.services.detection_service import detect, apply_thresholds
+
+            # A changed source or model invalidates stored detections
+            detection_results, _ = detect(file_id, Path(png_path), force=True)
+            if versions.get("report"):
+                from app.services.report_service import get_or_generate_report
+                get_or_generate_report(file_id, apply_thresholds(detection_results))
+
+        record.update(versions)
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = str(e)
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+class Progress:
+    """
+    Throughput counters printed while the backfill runs
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.counts = {"ok": 0, "skipped": 0, "failed": 0}
+        self.bytes_processed = 0
+        self.durations: List[float] = []
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.counts[record["status"]] += 1
+        if record["status"] == "ok":
+            self.bytes_processed += record["bytes"]
+            self.durations.append(record["seconds"])
+
+    @property
+    def done(self) -> int:
+        return sum(self.counts.values())
+
+    def line(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        rate = self.done / elapsed
+        remaining = (self.total - self.done) / rate if rate > 0 else float("inf")
+        return (
+            f"{self.done}/{self.total} files  {rate:.1f} files/s  "
+            f"{self.bytes_processed / elapsed / 1e6:.1f} MB/s  "
+            f"ok={self.counts['ok']} skipped={self.counts['skipped']} failed={self.counts['failed']}  "
+            f"eta={remaining:.0f}s"
+        )
+
+    def maybe_print(self) -> None:
+        now = time.perf_counter()
+        if now - self._last_report >= PROGRESS_INTERVAL_SECONDS:
+            self._last_report = now
+            print(self.line(), flush=True)
+
+    def summary(self) -> Dict[str, Any]:
+        durations = sorted(self.durations)
+
+        def percentile(fraction: float) -> Optional[float]:
+            return durations[min(len(durations) - 1, int(fraction * len(durations)))] if durations else None
+
+        elapsed = time.perf_counter() - self.started
+        return {
+            "files": self.done,
+            "elapsed_seconds": round(elapsed, 2),
+            "files_per_second": round(self.done / elapsed, 2) if elapsed > 0 else None,
+            "mb_per_second": round(self.bytes_processed / elapsed / 1e6, 2) if elapsed > 0 else None,
+            "per_file_p50_seconds": percentile(0.5),
+            "per_file_p95_seconds": percentile(0.95),
+            **self.counts
+        }
+
+
+def run_backfill(
+    source: Path,
+    checkpoint_path: Path = DEFAULT_CHECKPOINT,
+    workers: int = os.cpu_count() or 1,
+    detect: bool = False,
+    report: bool = False,
+    force: bool = False,
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Process every DICOM file under a directory
+
+    Args:
+        source: Directory to walk
+        checkpoint_path: JSON lines file recording processed files
+        workers: Worker processes (1 runs everything in this process)
+        detect: Run detection again for every processed file
+        report: Also regenerate the reports (implies detect)
+        force: Ignore the checkpoint and process every file
+        limit: Stop after this many files
+
+    Returns:
+        Throughput summary
+    """
+    detect = detect or report
+    versions = wanted_versions(detect, report)
+    checkpoint = load_checkpoint(checkpoint_path)
+    paths = list(iter_dicom_files(source))[:limit]
+    jobs: List[Tuple[str, str, Optional[Dict[str, Any]]]] = [
+        (str(path), path.stem, checkpoint.get(path.stem)) for path in paths
+    ]
+    progress = Progress(len(jobs))
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(checkpoint_path, "a") as checkpoint_file:
+        def record_result(record: Dict[str, Any]) -> None:
+            progress.add(record)
+            if record["status"] != "skipped":
+                checkpoint_file.write(json.dumps(record) + "\n")
+                checkpoint_file.flush()
+            if record["status"] == "failed":
+                logger.warning(f"{record['path']}: {record['error']}")
+            progress.maybe_print()
+
+        if workers <= 1:
+            with priority(BULK):
+                for path, file_id, previous in jobs:
+                    record_result(process_file(path, file_id, previous, versions, force))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                # Bounded submission keeps memory flat for huge directories
+                pending = set()
+                for path, file_id, previous in jobs:
+                    if len(pending) >= workers * 4:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record_result(future.result())
+                    pending.add(executor.submit(process_file, path, file_id, previous, versions, force))
+                for future in wait(pending).done:
+                    record_result(future.result())
+
+    summary = progress.summary()
+    print(progress.line(), flush=True)
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reprocess stored DICOM files")
+    parser.add_argument("--source", type=Path, default=UPLOADS_DIR, help="Directory to walk (default: uploads/)")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="Checkpoint file (JSON lines)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--detect", action="store_true", help="Run detection again (calls Roboflow)")
+    parser.add_argument("--report", action="store_true", help="Regenerate reports too (implies --detect)")
+    parser.add_argument("--force", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--limit", type=int, help="Process at most this many files")
+    args = parser.parse_args(argv)
+
+    summary = run_backfill(
+        args.source, args.checkpoint, args.workers, args.detect, args.report, args.force, args.limit
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
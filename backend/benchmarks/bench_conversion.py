@@ -0,0 +1,294 @@
+"""
+Benchmark the DICOM conversion hot path stage by stage.
+
+Builds synthetic radiographs that vary bit depth (8/12/16), size (periapical
+to panoramic), photometric interpretation and transfer syntax, then times
+each stage of ``convert_using_pydicom_direct`` on them:
+
+- ``parse``: ``pydicom.dcmread`` of the encoded file
+- ``decode``: ``decode_first_frame``
+- ``normalize``: ``normalize_to_max`` to 8 bits
+- ``encode``: ``encode_png``
+
+Every stage runs ``--repeat`` times on fresh inputs and the median is
+reported, together with the peak memory that stage allocated (tracemalloc,
+measured in a separate run so it does not skew the timings; allocations
+inside Pillow's C code are not seen).
+
+Results are compared with a stored baseline: a stage slower than the
+baseline by more than ``--tolerance`` or using more memory than
+``--memory-tolerance`` is flagged and the exit status is 1. Timings only
+compare on the same machine, so save a baseline on the machine you
+benchmark on before changing ``dicom_service.py``.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_conversion [--quick] [--filter panoramic] [--repeat 5]
+        [--baseline benchmarks/baselines/conversion.json] [--save-baseline] [--json results.json]
+"""
+
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import decoders  # noqa: E402
+from app.services.dicom_service import encode_png, normalize_to_max, render_sample_image  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "conversion.json"
+STAGES = ("parse", "decode", "normalize", "encode")
+
+# (rows, columns) of typical intraoral and extraoral detectors
+SIZES = {
+    "periapical": (1500, 1000),
+    "bitewing": (1000, 1500),
+    "panoramic": (1400, 2900)
+}
+
+# (bits stored, photometric interpretation, transfer syntax) per size
+VARIANTS = [
+    (8, "MONOCHROME2", ExplicitVRLittleEndian),
+    (12, "MONOCHROME2", ExplicitVRLittleEndian),
+    (16, "MONOCHROME2", ExplicitVRLittleEndian),
+    (12, "MONOCHROME1", ExplicitVRLittleEndian),
+    (8, "RGB", ExplicitVRLittleEndian),
+    (12, "MONOCHROME2", decoders.RLE_LOSSLESS),
+    (8, "MONOCHROME2", decoders.JPEG_BASELINE),
+    (16, "MONOCHROME2", decoders.JPEG_2000_LOSSLESS)
+]
+
+SYNTAX_NAMES = {
+    ExplicitVRLittleEndian: "explicit",
+    decoders.RLE_LOSSLESS: "rle",
+    decoders.JPEG_BASELINE: "jpeg",
+    decoders.JPEG_2000_LOSSLESS: "j2k"
+}
+
+
+def make_pixels(rows: int, columns: int, bits: int, photometric: str) -> np.ndarray:
+    """
+    Radiograph-like pixels at the given bit depth, built from the fallback sample image
+    """
+    base = render_sample_image(columns, rows).astype(np.float64) / 255
+    noise = np.random.default_rng(bits).normal(0, 0.01, base.shape)
+    scaled = np.clip(base + noise, 0, 1) * (2 ** bits - 1)
+    pixels = scaled.astype(np.uint8 if bits == 8 else np.uint16)
+    if photometric == "MONOCHROME1":
+        pixels = (2 ** bits - 1) - pixels
+    if photometric == "RGB":
+        pixels = np.repeat(pixels[:, :, None], 3, axis=2)
+    return pixels
+
+
+def make_dicom(pixels: np.ndarray, bits: int, photometric: str, transfer_syntax: str) -> bytes:
+    """
+    Encode pixels as a DICOM file in the given transfer syntax
+    """
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.3"  # Intraoral X-ray
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = "IO"
+    ds.Rows, ds.Columns = pixels.shape[:2]
+    ds.SamplesPerPixel = 3 if photometric == "RGB" else 1
+    if photometric == "RGB":
+        ds.PlanarConfiguration = 0
+    ds.PhotometricInterpretation = photometric
+    ds.BitsAllocated = 8 if bits == 8 else 16
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    ds.PixelData = pixels.tobytes()
+
+    if transfer_syntax == decoders.RLE_LOSSLESS:
+        ds.compress(decoders.RLE_LOSSLESS, encoding_plugin="pydicom")
+    elif transfer_syntax in (decoders.JPEG_BASELINE, decoders.JPEG_2000_LOSSLESS):
+        buffer = io.BytesIO()
+        if transfer_syntax == decoders.JPEG_BASELINE:
+            Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+        else:
+            Image.fromarray(pixels.astype(np.int32), "I").convert("I;16").save(
+                buffer, format="JPEG2000", irreversible=False
+            )
+        ds.PixelData = encapsulate([buffer.getvalue()])
+        ds["PixelData"].is_undefined_length = True
+        ds.file_meta.TransferSyntaxUID = transfer_syntax
+
+    output = io.BytesIO()
+    ds.save_as(output, write_like_original=False)
+    return output.getvalue()
+
+
+def build_cases(quick: bool = False, name_filter: Optional[str] = None) -> Dict[str, bytes]:
+    """
+    Encoded DICOM files by case name, e.g. "panoramic-12bit-MONOCHROME2-rle".
+    Quick mode shrinks every image 4x per side.
+    """
+    cases = {}
+    for size_name, (rows, columns) in SIZES.items():
+        if quick:
+            rows, columns = rows // 4, columns // 4
+        for bits, photometric, transfer_syntax in VARIANTS:
+            name = f"{size_name}-{bits}bit-{photometric}-{SYNTAX_NAMES[transfer_syntax]}"
+            if name_filter and name_filter not in name:
+                continue
+            if not decoders.is_transfer_syntax_supported(transfer_syntax):
+                continue
+            pixels = make_pixels(rows, columns, bits, photometric)
+            cases[name] = make_dicom(pixels, bits, photometric, transfer_syntax)
+    return cases
+
+
+def stage_functions(data: bytes) -> Dict[str, Tuple[Callable[[], Any], Callable[[Any], Any]]]:
+    """
+    Per stage: (prepare a fresh input, run the stage on it)
+    """
+    def parse_input():
+        return io.BytesIO(data)
+
+    def decode_input():
+        return pydicom.dcmread(io.BytesIO(data))
+
+    decoded = decoders.decode_first_frame(decode_input())
+    normalized = normalize_to_max(decoded)
+
+    return {
+        "parse": (parse_input, pydicom.dcmread),
+        "decode": (decode_input, decoders.decode_first_frame),
+        "normalize": (lambda: decoded, normalize_to_max),
+        "encode": (lambda: normalized, lambda pixels: encode_png(pixels, io.BytesIO()))
+    }
+
+
+def measure_stage(prepare: Callable[[], Any], run: Callable[[Any], Any], repeat: int) -> Dict[str, float]:
+    """
+    Median time and peak traced memory of one stage
+    """
+    run(prepare())  # Warm caches and lazy imports
+    timings = []
+    for _ in range(repeat):
+        value = prepare()
+        started = time.perf_counter()
+        run(value)
+        timings.append(time.perf_counter() - started)
+
+    value = prepare()
+    tracemalloc.start()
+    try:
+        run(value)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_ms": round(statistics.median(timings) * 1000, 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def run_benchmarks(cases: Dict[str, bytes], repeat: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    results = {}
+    for name, data in cases.items():
+        stages = {stage: measure_stage(*functions, repeat) for stage, functions in stage_functions(data).items()}
+        stages["total"] = {
+            "time_ms": round(sum(stage["time_ms"] for stage in stages.values()), 3),
+            "peak_kib": max(stage["peak_kib"] for stage in stages.values())
+        }
+        results[name] = stages
+        print(f"{name:<40}" + "".join(f"{stages[stage]['time_ms']:>13.2f}" for stage in (*STAGES, "total")))
+    return results
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Dict[str, Dict[str, float]]],
+    tolerance: float,
+    memory_tolerance: float,
+    min_time_ms: float = 0.5
+) -> List[Dict[str, Any]]:
+    """
+    Stages that got slower or use more memory than the baseline allows.
+    Stages faster than min_time_ms are too noisy to compare on time.
+
+    Returns:
+        One entry per regression
+    """
+    regressions = []
+    for name, stages in results.items():
+        for stage, measured in stages.items():
+            reference = baseline.get(name, {}).get(stage)
+            if reference is None:
+                continue
+            checks = [
+                ("time_ms", tolerance, reference["time_ms"] >= min_time_ms),
+                ("peak_kib", memory_tolerance, True)
+            ]
+            for metric, allowed, comparable in checks:
+                if comparable and measured[metric] > reference[metric] * (1 + allowed):
+                    regressions.append({
+                        "case": name,
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": reference[metric],
+                        "measured": measured[metric],
+                        "change": round(measured[metric] / reference[metric] - 1, 3) if reference[metric] else None
+                    })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Images 4x smaller per side")
+    parser.add_argument("--filter", help="Only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10, help="Allowed peak memory growth")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.quick, args.filter)
+    print(f"{'case':<40}" + "".join(f"{stage + ' ms':>13}" for stage in (*STAGES, "total")))
+    results = run_benchmarks(cases, args.repeat)
+
+    # Quick runs have their own baseline entries
+    mode = "quick" if args.quick else "full"
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.save_baseline:
+        stored[mode] = {**stored.get(mode, {}), **results}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"\nSaved baseline for {len(results)} cases to {args.baseline}")
+        regressions = []
+    else:
+        regressions = compare_to_baseline(results, stored.get(mode, {}), args.tolerance, args.memory_tolerance)
+        if not stored.get(mode):
+            print(f"\nNo {mode} baseline in {args.baseline}; run with --save-baseline to create one")
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['case']} {regression['stage']} {regression['metric']}: "
+                f"{regression['baseline']} -> {regression['measured']}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps({"mode": mode, "results": results, "regressions": regressions}, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
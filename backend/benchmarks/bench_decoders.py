@@ -0,0 +1,216 @@
+"""
+Benchmark pixel data handlers per transfer syntax.
+
+Builds a multi-frame test image in every transfer syntax that can be encoded
+here, then times each available handler on it, both frame by frame on one
+thread and frame-parallel on a pool of ``--threads`` threads. The fastest
+handler per syntax should come first in
+``app.services.decoders.HANDLER_PREFERENCE``.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_decoders [--frames 8] [--size 1024] [--repeat 3] [--threads 4] [--json results.json]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pydicom
+from PIL import Image
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate, generate_pixel_data_frame
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import UPLOADS_DIR  # noqa: E402
+from app.services import decoders  # noqa: E402
+from app.utils.serialization import dumps  # noqa: E402
+
+
+def make_frames(frames: int, size: int, bits: int) -> np.ndarray:
+    """
+    Smooth, noisy frames that compress like radiographs rather than like noise
+    """
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:size, 0:size]
+    base = (np.sin(x / 37.0) + np.cos(y / 53.0) + 2) / 4
+    stack = []
+    for index in range(frames):
+        noise = rng.normal(0, 0.02, (size, size))
+        stack.append(np.clip(base * (1 + index / frames) / 2 + noise, 0, 1))
+    dtype = np.uint8 if bits == 8 else np.uint16
+    return (np.stack(stack) * (2 ** bits - 1)).astype(dtype)
+
+
+def make_dataset(pixels: np.ndarray, bits: int) -> Dataset:
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.7"
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.NumberOfFrames, ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 8 if bits == 8 else 16
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    ds.PixelData = pixels.tobytes()
+    return ds
+
+
+def encode_with_pillow(ds: Dataset, pixels: np.ndarray, transfer_syntax: str, **options) -> Dataset:
+    fragments = []
+    for frame in pixels:
+        buffer = io.BytesIO()
+        image = Image.fromarray(frame) if frame.dtype == np.uint8 else Image.fromarray(frame.astype(np.int32), "I").convert("I;16")
+        image.save(buffer, **options)
+        fragments.append(buffer.getvalue())
+    ds.PixelData = encapsulate(fragments)
+    ds["PixelData"].is_undefined_length = True
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    return ds
+
+
+def build_cases(frames: int, size: int) -> Dict[str, Dataset]:
+    cases: Dict[str, Dataset] = {}
+    pixels_8 = make_frames(frames, size, 8)
+    pixels_12 = make_frames(frames, size, 12)
+
+    cases["Explicit VR Little Endian"] = make_dataset(pixels_12, 12)
+
+    rle = make_dataset(pixels_12, 12)
+    rle.compress(decoders.RLE_LOSSLESS, encoding_plugin="pydicom")
+    cases["RLE Lossless"] = rle
+
+    cases["JPEG Baseline"] = encode_with_pillow(
+        make_dataset(pixels_8, 8), pixels_8, decoders.JPEG_BASELINE, format="JPEG", quality=90
+    )
+    cases["JPEG 2000 Lossless"] = encode_with_pillow(
+        make_dataset(pixels_12, 12), pixels_12, decoders.JPEG_2000_LOSSLESS, format="JPEG2000", irreversible=False
+    )
+
+    sample = find_sample(decoders.JPEG_LOSSLESS_SV1)
+    if sample is not None:
+        cases["JPEG Lossless SV1 (upload sample)"] = sample
+    return cases
+
+
+def find_sample(transfer_syntax: str) -> Optional[Dataset]:
+    """
+    Use a stored upload for syntaxes that cannot be encoded here
+    """
+    for path in sorted(Path(UPLOADS_DIR).glob("*.dcm")):
+        try:
+            ds = pydicom.dcmread(path)
+        except Exception:
+            continue
+        if str(getattr(ds.file_meta, "TransferSyntaxUID", "")) == transfer_syntax and "PixelData" in ds:
+            return ds
+    return None
+
+
+def reload(ds: Dataset) -> Dataset:
+    # Decoding caches the array on the dataset; time every run on a fresh copy
+    buffer = io.BytesIO()
+    ds.save_as(buffer, write_like_original=False)
+    buffer.seek(0)
+    return pydicom.dcmread(buffer)
+
+
+def best_of(repeat: int, run: Callable[[], None]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def decode_frames_parallel(ds: Dataset, handler: str, executor: Executor) -> np.ndarray:
+    """
+    Decode every frame of encapsulated pixel data as its own fragment on a pool
+    """
+    frames = int(getattr(ds, "NumberOfFrames", 1) or 1)
+    datasets = [decoders._frame_dataset(ds, fragment) for fragment in generate_pixel_data_frame(ds.PixelData, frames)]
+    return np.stack(list(executor.map(lambda frame: decoders._decode_with(frame, [handler]), datasets)))
+
+
+def bench_case(ds: Dataset, repeat: int, executor: Executor) -> List[Dict]:
+    transfer_syntax = str(ds.file_meta.TransferSyntaxUID)
+    frames = int(getattr(ds, "NumberOfFrames", 1) or 1)
+    compressed = transfer_syntax not in decoders.UNCOMPRESSED_TRANSFER_SYNTAXES
+    results = []
+    for handler in decoders.HANDLER_PREFERENCE.get(transfer_syntax, []):
+        if not decoders.handler_can_decode(handler, transfer_syntax):
+            results.append({"handler": handler, "available": False})
+            continue
+
+        copies = [reload(ds) for _ in range(repeat * 2)]
+
+        def single():
+            decoders._decode_with(copies.pop(), [handler])
+
+        def parallel():
+            decode_frames_parallel(copies.pop(), handler, executor)
+
+        try:
+            single_seconds = best_of(repeat, single)
+            parallel_seconds = best_of(repeat, parallel) if compressed and frames > 1 else None
+        except Exception as e:
+            results.append({"handler": handler, "available": True, "error": str(e)})
+            continue
+        results.append({
+            "handler": handler,
+            "available": True,
+            "single_thread_ms": round(single_seconds * 1000, 2),
+            "frame_parallel_ms": round(parallel_seconds * 1000, 2) if parallel_seconds is not None else None
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=max(2, min(4, os.cpu_count() or 1)), help="Frame-parallel pool size")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    report = {"frames": args.frames, "size": args.size, "threads": args.threads, "cases": {}}
+    executor = ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="bench-decoder")
+    for name, ds in build_cases(args.frames, args.size).items():
+        results = bench_case(ds, args.repeat, executor)
+        report["cases"][name] = {"transfer_syntax": str(ds.file_meta.TransferSyntaxUID), "handlers": results}
+
+        print(f"\n{name} ({ds.file_meta.TransferSyntaxUID}, {int(getattr(ds, 'NumberOfFrames', 1))} frames)")
+        for result in results:
+            if not result["available"]:
+                print(f"  {result['handler']:<10} not available")
+            elif "error" in result:
+                print(f"  {result['handler']:<10} failed: {result['error']}")
+            else:
+                parallel = result["frame_parallel_ms"]
+                parallel_text = f"{parallel:>9.1f} ms parallel" if parallel is not None else ""
+                print(f"  {result['handler']:<10} {result['single_thread_ms']:>9.1f} ms single  {parallel_text}")
+
+    executor.shutdown()
+
+    if args.json:
+        args.json.write_bytes(dumps(report))
+
+
+if __name__ == "__main__":
+    main()
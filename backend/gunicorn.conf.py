@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for production.
+
+Runs one uvicorn worker per CPU core by default (override with
+WEB_CONCURRENCY). Workers coordinate through files under RUNTIME_DIR:
+advisory locks for single-flight work, a SQLite cache tier and per-worker
+metrics snapshots that /metrics merges.
+"""
+
+import os
+import shutil
+
+workers = int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+# The application reads WEB_CONCURRENCY to switch to multi-worker mode;
+# set it before the app is preloaded
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+preload_app = True
+
+
+def on_starting(server):
+    # Drop metrics snapshots left behind by a previous run
+    from app.core.config import RUNTIME_DIR
+    shutil.rmtree(RUNTIME_DIR / "metrics", ignore_errors=True)
@@ -0,0 +1,373 @@
+"""
+Load test: replay a realistic request mix and check latency SLOs.
+
+Starts stub Roboflow and OpenAI servers (see ``loadtest.stubs``) and the API
+under gunicorn in a scratch directory, pointed at the stubs, so a run never
+touches real uploads or upstream quota. Virtual users then loop over a
+weighted mix of uploads (sample DICOMs from ``uploads/``), image fetches,
+detections, reports and batch detections for a fixed duration. Each virtual
+user has its own client address, so per-client rate limits apply as they
+would in production.
+
+The report lists throughput, error rate and p50/p95/p99 latency per endpoint
+and checks them against the SLOs in ``loadtest/slo.json``; the exit status
+is 1 when an SLO is missed, so the run can gate a deploy.
+
+Usage (from the backend directory):
+    python -m loadtest.run [--users 8] [--duration 60] [--workers 2]
+        [--mix upload=1,image=6,detect=3,report=2,batch=1]
+        [--roboflow-latency-ms 400] [--roboflow-error-rate 0.01] [--roboflow-rate-limit 20]
+        [--slo loadtest/slo.json] [--json results.json] [--target http://host:port]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.core.config import API_PREFIX, UPLOADS_DIR  # noqa: E402
+from loadtest.stubs import StubConfig, start_stubs  # noqa: E402
+
+DEFAULT_MIX = "upload=1,image=6,detect=3,report=2,batch=1"
+DEFAULT_SLO_PATH = Path(__file__).resolve().parent / "slo.json"
+ENDPOINTS = ("upload", "image", "detect", "report", "batch")
+PERCENTILES = (50, 95, 99)
+
+# One sample per request: (endpoint, HTTP status or 0 on connection error, latency in seconds)
+Sample = Tuple[str, int, float]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse "upload=1,image=6,..." into endpoint weights
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name} (expected one of {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """
+    Nearest-rank percentile of unsorted values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples: Sequence[Sample], duration: float) -> Dict[str, Any]:
+    """
+    Throughput, error rate and latency percentiles per endpoint and overall
+    """
+    groups: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    groups["overall"] = list(samples)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = [latency for _, _, latency in group]
+        statuses: Dict[str, int] = {}
+        for _, status, _ in group:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(1 for _, status, _ in group if status == 0 or status >= 500)
+        rejected = sum(1 for _, status, _ in group if status in (429, 503))
+        summary[name] = {
+            "requests": len(group),
+            "throughput_rps": round(len(group) / duration, 2) if duration > 0 else 0.0,
+            "error_rate": round(errors / len(group), 4) if group else 0.0,
+            "rejected": rejected,
+            "rejected_rate": round(rejected / len(group), 4) if group else 0.0,
+            "statuses": statuses,
+            **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 1) for p in PERCENTILES},
+            "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0
+        }
+    return summary
+
+
+def evaluate_slos(summary: Dict[str, Any], slos: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
+    """
+    Compare a summary with SLOs such as {"image": {"p99_ms": 250, "max_error_rate": 0.01}}.
+    Errors are 5xx responses and connection failures; rejections (429/503
+    from admission control) are checked separately with max_rejected_rate.
+    Endpoints without traffic are skipped.
+
+    Returns:
+        One check per SLO with the observed value and whether it passed
+    """
+    checks = []
+    for endpoint, targets in slos.items():
+        observed = summary.get(endpoint)
+        if observed is None or not observed["requests"]:
+            continue
+        for key, target in targets.items():
+            if key in ("max_error_rate", "max_rejected_rate"):
+                value = observed[key[len("max_"):]]
+                passed = value <= target
+            elif key == "min_throughput_rps":
+                value, passed = observed["throughput_rps"], observed["throughput_rps"] >= target
+            else:
+                value, passed = observed[key], observed[key] <= target
+            checks.append({"endpoint": endpoint, "metric": key, "target": target, "value": value, "passed": passed})
+    return checks
+
+
+def _is_dicom(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(132)[128:] == b"DICM"
+
+
+class LoadRunner:
+    """
+    Closed-loop virtual users replaying a weighted request mix
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        mix: Dict[str, float],
+        samples_dir: Path = UPLOADS_DIR,
+        think_time: float = 1.0,
+        seed: int = 1
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        # Skip placeholders and truncated files, which would only measure rejections
+        self.dicoms = sorted(path for path in Path(samples_dir).glob("*.dcm") if _is_dicom(path))
+        if not self.dicoms:
+            raise ValueError(f"No sample DICOM files in {samples_dir}")
+        self.uploaded: List[str] = []
+        self.detected: List[str] = []
+        self.samples: List[Sample] = []
+
+    def _choose(self) -> str:
+        names = list(self.mix)
+        endpoint = self.random.choices(names, weights=[self.mix[name] for name in names])[0]
+        # Work that needs an earlier step falls back to that step
+        if endpoint == "report" and not self.detected:
+            endpoint = "detect"
+        if endpoint in ("image", "detect", "batch") and not self.uploaded:
+            endpoint = "upload"
+        return endpoint
+
+    async def _request(self, client: httpx.AsyncClient, endpoint: str, record: bool = True) -> Optional[httpx.Response]:
+        api = f"{self.base_url}{API_PREFIX}"
+        started = time.perf_counter()
+        response = None
+        try:
+            if endpoint == "upload":
+                path = self.random.choice(self.dicoms)
+                response = await client.post(f"{api}/upload/", files={"file": (path.name, path.read_bytes())})
+                if response.status_code == 200:
+                    self.uploaded.append(response.json()["file_id"])
+            elif endpoint == "image":
+                response = await client.get(f"{api}/image/{self.random.choice(self.uploaded)}")
+            elif endpoint == "detect":
+                file_id = self.random.choice(self.uploaded)
+                response = await client.post(f"{api}/detect/{file_id}")
+                if response.status_code == 200:
+                    self.detected.append(file_id)
+            elif endpoint == "report":
+                response = await client.post(f"{api}/report/{self.random.choice(self.detected)}")
+            elif endpoint == "batch":
+                file_ids = self.random.sample(self.uploaded, min(3, len(self.uploaded)))
+                response = await client.post(f"{api}/detect-batch/", json=file_ids)
+        except httpx.HTTPError:
+            response = None
+        if record:
+            status = response.status_code if response is not None else 0
+            self.samples.append((endpoint, status, time.perf_counter() - started))
+        return response
+
+    async def _user(self, index: int, deadline: float) -> None:
+        # Each virtual user is a separate client for the rate limiter
+        headers = {"X-Forwarded-For": f"10.77.{index // 250}.{index % 250 + 1}"}
+        async with httpx.AsyncClient(headers=headers, timeout=120) as client:
+            while time.monotonic() < deadline:
+                await self._request(client, self._choose())
+                if self.think_time:
+                    await asyncio.sleep(self.random.expovariate(1 / self.think_time))
+
+    async def seed(self, uploads: int) -> None:
+        """
+        Upload a few files before measuring, so reads have something to read
+        """
+        async with httpx.AsyncClient(headers={"X-Forwarded-For": "10.77.255.1"}, timeout=120) as client:
+            for _ in range(uploads):
+                await self._request(client, "upload", record=False)
+
+    async def run(self, users: int, duration: float) -> float:
+        """
+        Run the mix for duration seconds
+
+        Returns:
+            Measured wall-clock duration
+        """
+        started = time.monotonic()
+        await asyncio.gather(*(self._user(index, started + duration) for index in range(users)))
+        return time.monotonic() - started
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(workspace: Path, roboflow_url: str, openai_url: str, workers: int, extra_env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """
+    Start the API under gunicorn with its data in workspace, talking to the stubs
+
+    Returns:
+        (process, base URL)
+    """
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "WEB_CONCURRENCY": str(workers),
+        # Dummy keys enable the real upstream code paths; the URLs point at the stubs
+        "ROBOFLOW_API_KEY": "loadtest",
+        "ROBOFLOW_API_URL": roboflow_url,
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "UPLOADS_DIR": str(workspace / "uploads"),
+        "PROCESSED_DIR": str(workspace / "processed"),
+        "RUNTIME_DIR": str(workspace / "run"),
+        "RESUMABLE_UPLOAD_DIR": str(workspace / "partial_uploads"),
+        "RATE_LIMIT_TRUST_FORWARDED": "true",
+        "PYTHONUNBUFFERED": "1"
+    })
+    env.update(extra_env)
+    log = open(workspace / "server.log", "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app", "--bind", f"127.0.0.1:{port}"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.close()
+            tail = (workspace / "server.log").read_text(errors="replace")[-2000:]
+            raise RuntimeError(f"Server exited during startup:\n{tail}")
+        try:
+            if httpx.get(f"{base_url}{API_PREFIX}/ready", timeout=2).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError("Server did not become ready within 60 seconds")
+
+
+def print_report(summary: Dict[str, Any], checks: List[Dict[str, Any]]) -> None:
+    header = f"{'endpoint':<10}{'requests':>10}{'rps':>9}{'errors':>9}{'429/503':>9}" + "".join(
+        f"{f'p{p} ms':>10}" for p in PERCENTILES
+    )
+    print(header)
+    print("-" * len(header))
+    for name in [*ENDPOINTS, "overall"]:
+        row = summary.get(name)
+        if row is None:
+            continue
+        print(
+            f"{name:<10}{row['requests']:>10}{row['throughput_rps']:>9}{row['error_rate']:>9.2%}{row['rejected']:>9}"
+            + "".join(f"{row[f'p{p}_ms']:>10}" for p in PERCENTILES)
+        )
+    if checks:
+        print()
+        for check in checks:
+            status = "PASS" if check["passed"] else "FAIL"
+            print(f"{status}  {check['endpoint']} {check['metric']}: {check['value']} (target {check['target']})")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the API against stub upstreams")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Measured seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between a user's requests (s)")
+    parser.add_argument("--seed-uploads", type=int, default=5, help="Unmeasured uploads before the run")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers")
+    parser.add_argument("--samples", type=Path, default=UPLOADS_DIR, help="Directory of sample DICOMs")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    for upstream, latency in (("roboflow", 400), ("openai", 1500)):
+        parser.add_argument(f"--{upstream}-latency-ms", type=float, default=latency, help="Median latency")
+        parser.add_argument(f"--{upstream}-error-rate", type=float, default=0.0, help="Fraction failing with 500")
+        parser.add_argument(f"--{upstream}-rate-limit", type=float, default=0.0, help="Requests/s before 429")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Extra server setting")
+    parser.add_argument("--target", help="Test an already running server instead (stubs are not started)")
+    parser.add_argument("--slo", type=Path, default=DEFAULT_SLO_PATH, help="SLO file (JSON)")
+    parser.add_argument("--json", type=Path, help="Write the summary and SLO checks here")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    runner = LoadRunner(args.target or "", mix, args.samples, args.think_time, args.seed)
+    workspace = Path(tempfile.mkdtemp(prefix="dental-loadtest-"))
+    stubs = []
+    process = None
+    try:
+        if args.target is None:
+            stubs = start_stubs(*(
+                StubConfig(
+                    getattr(args, f"{upstream}_latency_ms"),
+                    error_rate=getattr(args, f"{upstream}_error_rate"),
+                    rate_limit=getattr(args, f"{upstream}_rate_limit"),
+                    seed=args.seed
+                )
+                for upstream in ("roboflow", "openai")
+            ))
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            process, runner.base_url = start_app(workspace, stubs[0].url, stubs[1].url, args.workers, extra_env)
+
+        asyncio.run(runner.seed(args.seed_uploads))
+        duration = asyncio.run(runner.run(args.users, args.duration))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        for stub in stubs:
+            stub.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    summary = summarize(runner.samples, duration)
+    slos = json.loads(args.slo.read_text()) if args.slo and args.slo.exists() else {}
+    checks = evaluate_slos(summary, slos)
+    print_report(summary, checks)
+    if args.json:
+        args.json.write_text(json.dumps({
+            "config": {"users": args.users, "duration": duration, "mix": mix, "workers": args.workers},
+            "summary": summary,
+            "slo_checks": checks,
+            "upstream_calls": {
+                name: stub.config.counts for name, stub in zip(("roboflow", "openai"), stubs)
+            }
+        }, indent=2))
+    return 0 if all(check["passed"] for check in checks) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
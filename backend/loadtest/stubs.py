@@ -0,0 +1,244 @@
+"""
+Local stand-ins for the Roboflow and OpenAI APIs.
+
+Each stub is a threaded HTTP server that answers the few calls the API
+makes (Roboflow detection, OpenAI chat completions and model lookup) after
+a configurable delay, fails a configurable fraction of requests with 500 and
+answers 429 with ``Retry-After`` above a configurable request rate, so load
+tests exercise slow, flaky and throttled upstreams without touching the real
+services or spending quota.
+
+Usage (from the backend directory), to point a manually started server at them:
+    python -m loadtest.stubs [--roboflow-port 9001] [--openai-port 9002] [--latency-ms 300]
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+PATHOLOGY_CLASSES = ["caries", "periapical_lesion", "bone_loss", "calculus", "impacted_tooth"]
+
+
+class StubConfig:
+    """
+    Behaviour of a stub upstream
+
+    Args:
+        latency_ms: Median response time
+        latency_sigma: Spread of the log-normal response time distribution (0 = constant)
+        error_rate: Fraction of requests answered with 500
+        rate_limit: Requests per second above which requests get 429 (0 = unlimited)
+        seed: Random seed, for reproducible runs
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        latency_sigma: float = 0.4,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        seed: Optional[int] = 1
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self._tokens = max(rate_limit, 1.0)
+        self._updated = time.monotonic()
+        self.counts: Dict[str, int] = {"ok": 0, "error": 0, "throttled": 0}
+
+    def delay(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_sigma <= 0:
+                return self.latency_ms / 1000
+            return self.random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+    def admit(self) -> str:
+        """
+        Decide the outcome of a request: "ok", "error" or "throttled"
+        """
+        with self.lock:
+            outcome = "ok"
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                self._tokens = min(max(self.rate_limit, 1.0), self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    outcome = "throttled"
+                else:
+                    self._tokens -= 1
+            if outcome == "ok" and self.random.random() < self.error_rate:
+                outcome = "error"
+            self.counts[outcome] += 1
+            return outcome
+
+
+def roboflow_response(rng: random.Random) -> Dict[str, Any]:
+    """
+    Detection response shaped like Roboflow's, with a few random boxes
+    """
+    predictions = [
+        {
+            "class": rng.choice(PATHOLOGY_CLASSES),
+            "confidence": round(rng.uniform(0.05, 0.99), 3),
+            "x": rng.randint(50, 750),
+            "y": rng.randint(50, 550),
+            "width": rng.randint(20, 120),
+            "height": rng.randint(20, 120)
+        }
+        for _ in range(rng.randint(0, 6))
+    ]
+    return {"predictions": predictions, "image": {"width": 800, "height": 600}, "time": 0.05}
+
+
+def openai_completion(model: str) -> Dict[str, Any]:
+    """
+    Chat completion shaped like OpenAI's
+    """
+    return {
+        "id": "chatcmpl-loadtest",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "Findings consistent with the annotations. Clinical correlation advised."},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 20, "total_tokens": 140}
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _respond(self, payload_factory) -> None:
+        config = self.server.config
+        outcome = config.admit()
+        if outcome == "throttled":
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": "1"})
+            return
+        time.sleep(config.delay())
+        if outcome == "error":
+            self._send_json(500, {"error": {"message": "Stub upstream error"}})
+            return
+        self._send_json(200, payload_factory())
+
+    def do_HEAD(self) -> None:
+        self._send_json(200, {})
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/v1/models/"):
+            model = self.path.rsplit("/", 1)[-1]
+            self._send_json(200, {"id": model, "object": "model", "created": 0, "owned_by": "loadtest"})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        if self.path.startswith("/v1/chat/completions"):
+            model = json.loads(body or b"{}").get("model", "stub")
+            self._respond(lambda: openai_completion(model))
+        else:
+            # Roboflow: POST /{project}/{version}?api_key=...
+            with self.server.config.lock:
+                seed = self.server.config.random.random()
+            self._respond(lambda: roboflow_response(random.Random(seed)))
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Stub upstream running on a background thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig, port: int = 0, host: str = "127.0.0.1"):
+        super().__init__((host, port), _StubHandler)
+        self.config = config
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def start_stubs(
+    roboflow: StubConfig,
+    openai: StubConfig,
+    roboflow_port: int = 0,
+    openai_port: int = 0
+) -> Tuple[StubServer, StubServer]:
+    """
+    Start both stubs
+
+    Returns:
+        (roboflow stub, openai stub)
+    """
+    return StubServer(roboflow, roboflow_port).start(), StubServer(openai, openai_port).start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run stub Roboflow and OpenAI servers")
+    parser.add_argument("--roboflow-port", type=int, default=9001)
+    parser.add_argument("--openai-port", type=int, default=9002)
+    parser.add_argument("--latency-ms", type=float, default=300, help="Median upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests/s before 429 (0 = unlimited)")
+    args = parser.parse_args()
+
+    roboflow, openai = start_stubs(
+        StubConfig(args.latency_ms, error_rate=args.error_rate, rate_limit=args.rate_limit),
+        StubConfig(args.latency_ms, error_rate=args.error_rate, rate_limit=args.rate_limit),
+        args.roboflow_port,
+        args.openai_port
+    )
+    print(f"ROBOFLOW_API_URL={roboflow.url}")
+    print(f"OPENAI_BASE_URL={openai.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
-import uvicorn
-from app.core.app_factory import create_app
+from app.utils.startup_timing import import_timed, timed_import, timed_step, mark_started, log_startup_report
+
+# Time the framework separately from the application modules
+with timed_import("uvicorn"):
+    import uvicorn
+import_timed("fastapi")
+with timed_import("app.core.app_factory"):
+    from app.core.app_factory import create_app
 from app.utils.logger import get_logger
 from app.utils.startup import initialize_app
 
@@ -7,13 +13,16 @@ from app.utils.startup import initialize_app
 logger = get_logger(__name__)
 
 # Create the FastAPI application
-app = create_app()
+with timed_step("create_app"):
+    app = create_app()
 
 # Initialize app on startup
 @app.on_event("startup")
 async def startup_event():
     logger.info("Running startup tasks...")
     initialize_app()
+    mark_started()
+    log_startup_report()
     logger.info("Startup tasks completed")
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+import threading
+
+import pytest
+
+from app.services import storage_backend
+from app.services.findings_index import findings_index
+from app.services.similarity_index import BKTree, similarity_index
+from app.utils.admission import admission_controller
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    # Every test client shares one address; start each test with full buckets
+    admission_controller.reset()
+    yield
+
+
+@pytest.fixture
+def isolated_storage(tmp_path, monkeypatch):
+    """
+    Keep uploads, converted files, perceptual hashes and indexed findings out
+    of the real uploads/, processed/ and runtime directories
+    """
+    roots = {"uploads": tmp_path / "uploads", "processed": tmp_path / "processed"}
+    for directory in roots.values():
+        directory.mkdir()
+    monkeypatch.setattr(storage_backend, "LOCAL_ROOTS", roots)
+    monkeypatch.setattr(findings_index, "path", tmp_path / "findings.sqlite3")
+    monkeypatch.setattr(findings_index, "_local", threading.local())
+    monkeypatch.setattr(similarity_index, "path", tmp_path / "phash_index.log")
+    monkeypatch.setattr(similarity_index, "_tree", BKTree())
+    monkeypatch.setattr(similarity_index, "_hashes", {})
+    monkeypatch.setattr(similarity_index, "_offset", 0)
+    return roots
@@ -0,0 +1,114 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.admission import (
+    AdmissionController, AdmissionMiddleware, ConcurrencyLimit, TokenBucket, classify_request, client_key,
+    CONVERSION, READ, UPSTREAM
+)
+
+
+def _app(controller):
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller, enabled=True)
+
+    @app.get("/api/v1/image/{file_id}")
+    async def image(file_id: str):
+        return {"file_id": file_id}
+
+    @app.get("/api/v1/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/api/v1/detect/{file_id}")
+    async def detect(file_id: str):
+        await asyncio.sleep(0.2)
+        return {"file_id": file_id}
+
+    return app
+
+
+def test_classify_request():
+    assert classify_request("POST", "/api/v1/upload-multiple/") == (CONVERSION, 5)
+    assert classify_request("PATCH", "/api/v1/uploads/abc") == (CONVERSION, 1)
+    assert classify_request("POST", "/api/v1/report/abc") == (UPSTREAM, 5)
+    assert classify_request("GET", "/api/v1/image/abc") == (READ, 1)
+    assert classify_request("GET", "/api/v1/ready") is None
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=2, burst=4, now=0)
+    assert bucket.take(4, now=0) == 0
+    assert bucket.take(1, now=0) == 0.5
+    assert bucket.take(1, now=0.5) == 0
+
+
+def test_client_over_its_rate_gets_429():
+    controller = AdmissionController(rate=1, burst=5)
+    client = TestClient(_app(controller))
+
+    assert client.post("/api/v1/detect/a").status_code == 200
+    response = client.post("/api/v1/detect/a")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Health checks are never limited, and other clients have their own buckets
+    assert client.get("/api/v1/health").status_code == 200
+    assert controller.check_rate("10.0.0.1", 1) == 0
+    # X-Forwarded-For is client-supplied unless trusted
+    assert client.get("/api/v1/image/a", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 429
+
+
+def test_client_key_uses_last_forwarded_address():
+    scope = {"type": "http", "client": ("10.0.0.9", 1234), "headers": [(b"x-forwarded-for", b"1.1.1.1, 203.0.113.7")]}
+    assert client_key(scope, trust_forwarded=True) == "203.0.113.7"
+    assert client_key(scope, trust_forwarded=False) == "10.0.0.9"
+
+
+def test_concurrency_limit_sheds_when_expected_wait_exceeds_target():
+    limit = ConcurrencyLimit("upstream", limit=1, max_wait=0.5, initial_service_time=0.2)
+
+    async def run():
+        assert await limit.acquire()
+        # One slot busy, nobody queued: the next request waits about one service time
+        assert limit.expected_wait() == 0.2
+        waiter = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        assert limit.queued == 1
+        assert limit.expected_wait() == 0.4
+        limit.release(0.2)
+        assert await waiter
+        assert limit.in_flight == 1
+
+        # A queued request that does not get a slot in time gives up
+        limit.max_wait = 0.05
+        assert not await limit.acquire()
+        assert limit.queued == 0
+        limit.release(0.2)
+        assert limit.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_overloaded_class_returns_503():
+    controller = AdmissionController(rate=100, burst=100, limits={
+        READ: (8, 1.0), CONVERSION: (1, 1.0), UPSTREAM: (1, 0.1)
+    })
+    app = _app(controller)
+
+    async def run():
+        import httpx
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(client.post(f"/api/v1/detect/{i}") for i in range(4)))
+            # Reads are not blocked by the saturated upstream class
+            read = await client.get("/api/v1/image/a")
+        return [response.status_code for response in responses], read.status_code, responses
+
+    statuses, read_status, responses = asyncio.run(run())
+    assert statuses.count(200) == 1
+    assert statuses.count(503) == 3
+    assert all("Retry-After" in r.headers for r in responses if r.status_code == 503)
+    assert read_status == 200
@@ -5,6 +5,7 @@ from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 from app.core.app_factory import create_app
 from app.core.config import UPLOADS_DIR, PROCESSED_DIR
+from app.services.dicom_service import create_synthetic_dicom
 
 # Create test client
 app = create_app()
@@ -100,8 +101,7 @@ def test_upload_endpoint(mock_convert, tmp_path):
     
     # Create a test file
     test_file_path = tmp_path / "test.dcm"
-    with open(test_file_path, "w") as f:
-        f.write("mock dicom content")
+    create_synthetic_dicom(test_file_path)
     
     # Upload the test file
     with open(test_file_path, "rb") as f:
@@ -129,10 +129,8 @@ def test_upload_multiple_endpoint(mock_convert, tmp_path):
     test_file_path1 = tmp_path / "test1.dcm"
     test_file_path2 = tmp_path / "test2.dcm"
     
-    with open(test_file_path1, "w") as f:
-        f.write("mock dicom content 1")
-    with open(test_file_path2, "w") as f:
-        f.write("mock dicom content 2")
+    create_synthetic_dicom(test_file_path1)
+    create_synthetic_dicom(test_file_path2)
     
     # Upload the test files
     with open(test_file_path1, "rb") as f1, open(test_file_path2, "rb") as f2:
@@ -279,3 +277,23 @@ def test_error_handling():
     response = client.get("/api/v1/image/nonexistent-image")
     assert response.status_code == 404
     assert "not found" in response.json()["detail"]
+
+
+def test_upload_rejects_invalid_dicom(tmp_path):
+    """
+    Files without a DICOM preamble are rejected before being stored
+    """
+    test_file_path = tmp_path / "test.dcm"
+    with open(test_file_path, "w") as f:
+        f.write("mock dicom content")
+    
+    uploads_before = set(os.listdir(UPLOADS_DIR))
+    with open(test_file_path, "rb") as f:
+        response = client.post(
+            "/api/v1/upload/",
+            files={"file": ("test.dcm", f, "application/dicom")}
+        )
+    
+    assert response.status_code == 400
+    assert "Invalid DICOM file" in response.json()["detail"]
+    assert set(os.listdir(UPLOADS_DIR)) == uploads_before
@@ -0,0 +1,150 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.core.app_factory import create_app
+from app.services import archive_ingest
+from app.services.archive_ingest import ingest_archive, iter_zip_entries, StreamBridge, ArchiveError
+from app.services.dicom_service import create_synthetic_dicom
+
+client = TestClient(create_app())
+
+# Every test here converts entries; keep them out of the real storage
+pytestmark = pytest.mark.usefixtures("isolated_storage")
+
+
+class _Unseekable(io.RawIOBase):
+    """
+    Write-only sink without tell/seek, so zipfile writes data descriptors
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def _dicom_bytes(tmp_path, name, rows=40):
+    path = tmp_path / name
+    create_synthetic_dicom(path, rows=rows, columns=rows)
+    return path.read_bytes()
+
+
+def _study(tmp_path):
+    return {
+        "study/IM0001": _dicom_bytes(tmp_path, "a.dcm"),
+        "study/IM0002.dcm": _dicom_bytes(tmp_path, "b.dcm", rows=56),
+        "DICOMDIR": b"\0" * 128 + b"DICM" + b"\0" * 64,
+        "study/report.txt": b"not an image",
+        "__MACOSX/study/._IM0001": b"resource fork"
+    }
+
+
+def _zip(entries, compression=zipfile.ZIP_DEFLATED, streamed=True):
+    sink = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+        archive.writestr("study/", b"")
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return (sink.buffer if streamed else sink).getvalue()
+
+
+def _tar_gz(entries):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _check(result):
+    assert sorted(entry["entry"] for entry in result["files"]) == ["study/IM0001", "study/IM0002.dcm"]
+    reasons = {entry["entry"]: entry["reason"] for entry in result["skipped"]}
+    assert reasons["DICOMDIR"] == "dicomdir"
+    assert reasons["study/report.txt"] == "not_dicom"
+    assert reasons["__MACOSX/study/._IM0001"] == "metadata"
+    assert result["errors"] == []
+
+
+@pytest.mark.parametrize("archive", [
+    lambda entries: _zip(entries),
+    lambda entries: _zip(entries, compression=zipfile.ZIP_STORED, streamed=False),
+    lambda entries: _tar_gz(entries)
+], ids=["zip-deflate-descriptor", "zip-stored", "tar-gz"])
+def test_archives_are_extracted_and_converted(tmp_path, archive):
+    _check(ingest_archive(io.BytesIO(archive(_study(tmp_path)))))
+
+
+def test_zip_entries_stream_without_central_directory(tmp_path):
+    entries = {"one.dcm": b"a" * 100000, "two.dcm": b"b" * 10}
+    data = _zip(entries)
+    # Cut the archive before its central directory: local headers suffice
+    truncated = data[:data.rindex(b"PK\x01\x02")]
+
+    seen = {}
+    for name, entry in iter_zip_entries(io.BytesIO(truncated)):
+        seen[name] = b"".join(iter(lambda: entry.read(4096), b""))
+    assert seen == dict(entries, **{"study/": b""})
+
+
+def test_corrupt_entry_stops_with_error(tmp_path):
+    data = bytearray(_zip({"a.dcm": _dicom_bytes(tmp_path, "a.dcm")}, compression=zipfile.ZIP_STORED, streamed=False))
+    # Flip a pixel byte: the CRC no longer matches
+    data[data.index(b"PK\x01\x02") - 10] ^= 0xFF
+    result = ingest_archive(io.BytesIO(bytes(data)))
+    assert result["files"] == []
+    assert "CRC" in result["errors"][0]
+
+    with pytest.raises(ArchiveError):
+        ingest_archive(io.BytesIO(b"plain text, not an archive" * 40))
+
+
+def test_entry_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_ingest, "ARCHIVE_MAX_ENTRY_BYTES", 1000)
+    result = ingest_archive(io.BytesIO(_zip(_study(tmp_path))))
+    assert result["files"] == []
+    assert {entry["reason"] for entry in result["skipped"]} >= {"too_large"}
+
+
+def test_stream_bridge_is_bounded():
+    bridge = StreamBridge(max_chunks=2)
+    bridge.feed(b"ab")
+    bridge.feed(b"cd")
+    assert bridge._queue.full()
+    assert bridge.read(3) == b"abc"
+    bridge.finish()
+    assert bridge.read() == b"d"
+
+    # A closed bridge discards data instead of blocking the producer
+    bridge.close()
+    for _ in range(5):
+        bridge.feed(b"x")
+
+
+def test_upload_archive_endpoint(tmp_path, monkeypatch):
+    prerendered = []
+    monkeypatch.setattr(endpoints, "prerender_presets", prerendered.append)
+    response = client.post(
+        "/api/v1/upload-archive/",
+        content=_zip(_study(tmp_path)),
+        headers={"Content-Type": "application/zip"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 2
+    assert sorted(prerendered) == sorted(uploaded["file_id"] for uploaded in body["files"])
+    for uploaded in body["files"]:
+        assert client.get(f"/api/v1/image/{uploaded['file_id']}").status_code == 200
+
+    response = client.post("/api/v1/upload-archive/", content=b"x" * 1000)
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+from app.services.artifact_cache import ArtifactCache, PNG, DETECTION
+
+
+def test_evicts_least_recently_used_by_size():
+    """
+    Entries are evicted oldest first once the byte budget is exceeded
+    """
+    cache = ArtifactCache(max_bytes=100, max_item_bytes=100)
+    cache.put("a", PNG, b"a", 40)
+    cache.put("b", PNG, b"b", 40)
+    assert cache.get("a", PNG) == b"a"
+
+    cache.put("c", PNG, b"c", 40)
+
+    assert cache.get("b", PNG) is None
+    assert cache.get("a", PNG) == b"a"
+    assert cache.get("c", PNG) == b"c"
+    stats = cache.get_stats()
+    assert stats["bytes"] == 80
+    assert stats["evictions"] == 1
+
+
+def test_oversized_items_are_not_cached():
+    cache = ArtifactCache(max_bytes=100, max_item_bytes=10)
+    cache.put("a", PNG, b"a", 11)
+    assert cache.get("a", PNG) is None
+    assert cache.get_stats()["bytes"] == 0
+
+
+def test_get_or_load_and_invalidate():
+    """
+    The loader runs once per miss and invalidation forces a reload
+    """
+    cache = ArtifactCache(max_bytes=1000, max_item_bytes=1000)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"predictions": []}, 20
+
+    assert cache.get_or_load("a", DETECTION, loader) == {"predictions": []}
+    assert cache.get_or_load("a", DETECTION, loader) == {"predictions": []}
+    assert len(calls) == 1
+
+    cache.invalidate("a")
+    cache.get_or_load("a", DETECTION, loader)
+    assert len(calls) == 2
+    assert cache.get_or_load("missing", DETECTION, lambda: None) is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
@@ -0,0 +1,82 @@
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import backfill
+from app.services import dicom_service
+from app.services import storage_backend as backend_module
+from app.services.dicom_service import create_synthetic_dicom
+from app.services.detection_service import load_detection_results
+from app.services.findings_index import findings_index
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """
+    Keep converted files, detection results and the checkpoint out of the
+    real processed/ and runtime directories
+    """
+    roots = {"uploads": tmp_path / "uploads", "processed": tmp_path / "processed"}
+    for directory in roots.values():
+        directory.mkdir()
+    monkeypatch.setattr(backend_module, "LOCAL_ROOTS", roots)
+    monkeypatch.setattr(backfill, "DEFAULT_CHECKPOINT", tmp_path / "run" / "backfill_checkpoint.jsonl")
+    monkeypatch.setattr(findings_index, "path", tmp_path / "findings.sqlite3")
+    monkeypatch.setattr(findings_index, "_local", threading.local())
+    return roots
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "source"
+    (directory / "nested").mkdir(parents=True)
+    create_synthetic_dicom(directory / "backfill-test-a.dcm")
+    create_synthetic_dicom(directory / "nested" / "backfill-test-b.dcm", rows=80, columns=80)
+    (directory / "notes.txt").write_text("ignored")
+    return directory
+
+
+def test_backfill_resumes_from_checkpoint(source, tmp_path, isolated_storage):
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    summary = backfill.run_backfill(source, checkpoint, workers=2)
+    assert (summary["ok"], summary["skipped"], summary["failed"]) == (2, 0, 0)
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert sorted(record["file_id"] for record in records) == ["backfill-test-a", "backfill-test-b"]
+    assert all(record["conversion_version"] == dicom_service.CONVERSION_VERSION for record in records)
+    assert sorted(path.name for path in isolated_storage["processed"].glob("*.png")) == [
+        "backfill-test-a.png", "backfill-test-b.png"
+    ]
+
+    # Unchanged files are skipped
+    summary = backfill.run_backfill(source, checkpoint, workers=2)
+    assert (summary["ok"], summary["skipped"]) == (0, 2)
+
+    # A changed source file is processed again
+    create_synthetic_dicom(source / "backfill-test-a.dcm", rows=72, columns=72)
+    summary = backfill.run_backfill(source, checkpoint, workers=1)
+    assert (summary["ok"], summary["skipped"]) == (1, 1)
+
+    # So is everything after a conversion version bump
+    with patch.object(dicom_service, "CONVERSION_VERSION", dicom_service.CONVERSION_VERSION + 1):
+        summary = backfill.run_backfill(source, checkpoint, workers=1)
+    assert summary["ok"] == 2
+
+
+def test_backfill_redetects_with_force(source, tmp_path):
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    response = {"predictions": [{"class": "caries", "confidence": 0.9, "x": 5, "y": 5, "width": 4, "height": 4}]}
+
+    with patch("app.services.roboflow_service.call_roboflow_api", return_value=response) as mock_api:
+        summary = backfill.run_backfill(source, checkpoint, workers=1, detect=True, limit=1)
+        assert summary["ok"] == 1
+        assert mock_api.call_count == 1
+
+        # Detection is fetched again even though results are stored
+        assert backfill.main(["--source", str(source), "--checkpoint", str(checkpoint),
+                              "--workers", "1", "--detect", "--force", "--limit", "1"]) == 0
+        assert mock_api.call_count == 2
+
+    assert load_detection_results("backfill-test-a")["predictions"][0]["class"] == "caries"
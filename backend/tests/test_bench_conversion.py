@@ -0,0 +1,20 @@
+from benchmarks.bench_conversion import build_cases, compare_to_baseline, run_benchmarks
+
+
+def test_baseline_comparison_flags_regressions():
+    baseline = {"case": {"decode": {"time_ms": 10.0, "peak_kib": 100.0}, "parse": {"time_ms": 0.1, "peak_kib": 5.0}}}
+    results = {
+        "case": {"decode": {"time_ms": 12.0, "peak_kib": 130.0}, "parse": {"time_ms": 0.3, "peak_kib": 5.0}},
+        "new-case": {"decode": {"time_ms": 99.0, "peak_kib": 999.0}}
+    }
+    regressions = compare_to_baseline(results, baseline, tolerance=0.25, memory_tolerance=0.10)
+    # Time within tolerance, sub-millisecond parse too noisy, unknown case skipped
+    assert [(r["case"], r["stage"], r["metric"]) for r in regressions] == [("case", "decode", "peak_kib")]
+    assert regressions[0]["change"] == 0.3
+
+
+def test_benchmark_runs_every_stage():
+    cases = build_cases(quick=True, name_filter="periapical-12bit-MONOCHROME2-rle")
+    assert list(cases) == ["periapical-12bit-MONOCHROME2-rle"]
+    results = run_benchmarks(cases, repeat=1)
+    assert set(results["periapical-12bit-MONOCHROME2-rle"]) == {"parse", "decode", "normalize", "encode", "total"}
@@ -0,0 +1,98 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pydicom
+from PIL import Image
+from pydicom.encaps import encapsulate
+
+from app.services import decoders
+from benchmarks.bench_decoders import bench_case, decode_frames_parallel
+from app.services.dicom_service import create_synthetic_dicom, convert_using_pydicom_direct
+
+
+def _multiframe_jpeg(tmp_path, frames=3, rows=32, columns=40):
+    path = tmp_path / "multiframe.dcm"
+    create_synthetic_dicom(path, rows=rows, columns=columns)
+    ds = pydicom.dcmread(path)
+
+    fragments = []
+    for index in range(frames):
+        buffer = io.BytesIO()
+        pixels = np.full((rows, columns), 40 + index * 80, dtype=np.uint8)
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=95)
+        fragments.append(buffer.getvalue())
+
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.NumberOfFrames = frames
+    ds.PixelData = encapsulate(fragments)
+    ds["PixelData"].is_undefined_length = True
+    ds.file_meta.TransferSyntaxUID = decoders.JPEG_BASELINE
+    ds.save_as(path)
+    return path
+
+
+def test_handlers_are_ordered_and_filtered():
+    assert decoders.available_handlers(decoders.EXPLICIT_VR_LITTLE_ENDIAN) == ["numpy"]
+    assert decoders.available_handlers(decoders.JPEG_BASELINE)[0] == "pillow"
+    # Only handlers that are actually installed are offered
+    for transfer_syntax in decoders.HANDLER_PREFERENCE:
+        for name in decoders.available_handlers(transfer_syntax):
+            assert decoders.handler_can_decode(name, transfer_syntax)
+    assert not decoders.is_transfer_syntax_supported("1.2.840.10008.1.2.4.100")
+
+
+def test_benchmark_frame_parallel_matches_serial(tmp_path):
+    path = _multiframe_jpeg(tmp_path)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        parallel = decode_frames_parallel(pydicom.dcmread(path), "pillow", executor)
+        results = bench_case(pydicom.dcmread(path), 1, executor)
+    serial = decoders.decode_pixel_array(pydicom.dcmread(path))
+
+    assert parallel.shape == (3, 32, 40)
+    np.testing.assert_array_equal(parallel, serial)
+    assert parallel[0].mean() < parallel[1].mean() < parallel[2].mean()
+    assert results[0]["handler"] == "pillow" and results[0]["frame_parallel_ms"] is not None
+
+
+def test_failing_handler_falls_back_to_next(tmp_path, monkeypatch):
+    path = _multiframe_jpeg(tmp_path, frames=1)
+    # jpeg_ls is not installed here, so convert_pixel_data raises for it
+    monkeypatch.setattr(decoders, "available_handlers", lambda transfer_syntax: ["jpeg_ls", "pillow"])
+
+    pixels = decoders.decode_pixel_array(pydicom.dcmread(path))
+    assert pixels.shape == (32, 40)
+
+
+def test_first_frame_decodes_one_frame(tmp_path, monkeypatch):
+    path = _multiframe_jpeg(tmp_path)
+    expected = decoders.decode_pixel_array(pydicom.dcmread(path))[0]
+
+    decoded = []
+    decode_with = decoders._decode_with
+    monkeypatch.setattr(decoders, "_decode_with", lambda dataset, handlers: decoded.append(1) or decode_with(dataset, handlers))
+    np.testing.assert_array_equal(decoders.decode_first_frame(pydicom.dcmread(path)), expected)
+    assert len(decoded) == 1
+
+    # Uncompressed: only the first frame's bytes are read
+    uncompressed = tmp_path / "uncompressed.dcm"
+    create_synthetic_dicom(uncompressed, rows=8, columns=6)
+    ds = pydicom.dcmread(uncompressed)
+    frames = np.stack([np.full((8, 6), value, dtype=np.uint16) for value in (100, 2000, 4000)])
+    ds.NumberOfFrames = 3
+    ds.PixelData = frames.tobytes()
+    ds.save_as(uncompressed)
+    np.testing.assert_array_equal(decoders.decode_first_frame(pydicom.dcmread(uncompressed)), frames[0])
+
+
+def test_multiframe_conversion_uses_first_frame(tmp_path):
+    path = _multiframe_jpeg(tmp_path)
+    output = tmp_path / "out.png"
+
+    convert_using_pydicom_direct(str(path), output)
+
+    with Image.open(output) as image:
+        assert image.size == (40, 32)
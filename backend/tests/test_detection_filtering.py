@@ -0,0 +1,88 @@
+import numpy as np
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.core.app_factory import create_app
+from app.core.config import PROCESSED_DIR, ROBOFLOW_CONFIDENCE_FLOOR
+from app.services.artifact_cache import artifact_cache
+from app.services.detection_service import apply_thresholds, FETCH_THRESHOLDS_KEY
+from app.utils.nms import non_max_suppression
+
+client = TestClient(create_app())
+
+RAW_RESULTS = {
+    "predictions": [
+        {"class": "caries", "confidence": 0.92, "x": 100, "y": 100, "width": 50, "height": 50},
+        # Overlaps the first caries box (IoU ~0.68)
+        {"class": "caries", "confidence": 0.60, "x": 110, "y": 100, "width": 50, "height": 50},
+        # Same place, different class: never suppressed by a caries box
+        {"class": "periapical_lesion", "confidence": 0.55, "x": 100, "y": 100, "width": 50, "height": 50},
+        {"class": "caries", "confidence": 0.12, "x": 300, "y": 300, "width": 20, "height": 20}
+    ]
+}
+
+
+def test_nms_is_per_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 0, 11, 10], [0, 0, 10, 10]])
+    keep = non_max_suppression(boxes, [0.9, 0.8, 0.7], [0, 0, 1], iou_threshold=0.5)
+    assert keep.tolist() == [0, 2]
+
+
+def test_apply_thresholds_filters_confidence_and_overlap():
+    strict = apply_thresholds(RAW_RESULTS, confidence=30, overlap=50)
+    assert [p["confidence"] for p in strict["predictions"]] == [0.92, 0.55]
+    assert strict["thresholds"] == {"confidence": 30, "overlap": 50}
+
+    loose = apply_thresholds(RAW_RESULTS, confidence=10, overlap=90)
+    assert len(loose["predictions"]) == 4
+
+
+def test_threshold_changes_do_not_call_upstream_again():
+    file_id = "test-threshold-file"
+    png_path = PROCESSED_DIR / f"{file_id}.png"
+    detection_path = PROCESSED_DIR / f"{file_id}_detection.json"
+    png_path.write_bytes(b"mock png content")
+    artifact_cache.invalidate(file_id)
+
+    try:
+        with patch("app.services.roboflow_service.call_roboflow_api", return_value=RAW_RESULTS) as upstream:
+            first = client.post(f"/api/v1/detect/{file_id}?confidence=50&overlap=50")
+            second = client.post(f"/api/v1/detect/{file_id}?confidence=10&overlap=90")
+
+        assert upstream.call_count == 1
+        assert len(first.json()["detection_results"]["predictions"]) == 2
+        assert len(second.json()["detection_results"]["predictions"]) == 4
+        assert "(cached)" in second.json()["message"]
+        assert FETCH_THRESHOLDS_KEY not in second.json()["detection_results"]
+    finally:
+        artifact_cache.invalidate(file_id)
+        for path in (png_path, detection_path):
+            if path.exists():
+                path.unlink()
+
+
+def test_results_fetched_at_higher_threshold_are_refreshed():
+    """
+    Results saved at the old fixed threshold are fetched again when a lower
+    threshold is requested
+    """
+    file_id = "test-legacy-threshold-file"
+    png_path = PROCESSED_DIR / f"{file_id}.png"
+    detection_path = PROCESSED_DIR / f"{file_id}_detection.json"
+    png_path.write_bytes(b"mock png content")
+    detection_path.write_text('{"predictions": []}')
+    artifact_cache.invalidate(file_id)
+
+    try:
+        with patch("app.services.roboflow_service.call_roboflow_api", return_value=RAW_RESULTS) as upstream:
+            client.post(f"/api/v1/detect/{file_id}?confidence=40")
+            assert upstream.call_count == 0
+            response = client.post(f"/api/v1/detect/{file_id}?confidence={ROBOFLOW_CONFIDENCE_FLOOR}")
+            assert upstream.call_count == 1
+
+        assert len(response.json()["detection_results"]["predictions"]) == 3
+    finally:
+        artifact_cache.invalidate(file_id)
+        for path in (png_path, detection_path):
+            if path.exists():
+                path.unlink()
@@ -0,0 +1,77 @@
+import io
+import glob
+
+import pytest
+import pydicom
+from pydicom.encaps import encapsulate
+
+from app.core.config import UPLOADS_DIR
+from app.services.dicom_service import create_synthetic_dicom
+from app.services.dicom_validation import validate_dicom, check_preamble, DicomValidationError
+
+
+def _synthetic(tmp_path, **kwargs):
+    path = tmp_path / "image.dcm"
+    create_synthetic_dicom(path, **kwargs)
+    return path
+
+
+def test_valid_file_is_summarised_from_header(tmp_path):
+    path = _synthetic(tmp_path, rows=32, columns=48)
+    with open(path, "rb") as f:
+        info = validate_dicom(f)
+        assert f.tell() == 0
+
+    assert info["rows"] == 32
+    assert info["columns"] == 48
+    assert info["transfer_syntax"] == "1.2.840.10008.1.2.1"
+    assert not info["compressed"]
+
+
+def test_garbage_is_rejected_by_magic():
+    with pytest.raises(DicomValidationError) as error:
+        validate_dicom(io.BytesIO(b"mock dicom content"))
+    assert error.value.reason == "magic"
+
+    with pytest.raises(DicomValidationError):
+        check_preamble(b"\0" * 128 + b"NOPE")
+
+
+def test_file_without_pixel_data_is_rejected(tmp_path):
+    path = _synthetic(tmp_path)
+    dataset = pydicom.dcmread(path)
+    del dataset.PixelData
+    dataset.save_as(path)
+
+    with open(path, "rb") as f, pytest.raises(DicomValidationError) as error:
+        validate_dicom(f)
+    assert error.value.reason == "pixel_data"
+
+
+def test_unsupported_transfer_syntax_is_rejected(tmp_path):
+    path = _synthetic(tmp_path)
+    dataset = pydicom.dcmread(path)
+    # MPEG-2 video: no pixel data handler decodes it
+    dataset.file_meta.TransferSyntaxUID = "1.2.840.10008.1.2.4.100"
+    dataset.PixelData = encapsulate([dataset.PixelData])
+    dataset.save_as(path)
+
+    with open(path, "rb") as f, pytest.raises(DicomValidationError) as error:
+        validate_dicom(f)
+    assert error.value.reason == "transfer_syntax"
+
+
+@pytest.mark.skipif(not glob.glob(str(UPLOADS_DIR / "*.dcm")), reason="No sample uploads")
+def test_sample_uploads_pass_or_fail_fast():
+    """
+    Real JPEG Lossless uploads validate; truncated leftovers are rejected
+    """
+    valid = 0
+    for path in glob.glob(str(UPLOADS_DIR / "*.dcm"))[:20]:
+        with open(path, "rb") as f:
+            try:
+                validate_dicom(f)
+                valid += 1
+            except DicomValidationError:
+                assert f.tell() == 0
+    assert valid > 0
@@ -0,0 +1,111 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.app_factory import create_app
+from app.services.detection_service import detect, save_detection_results
+from app.services.dicom_service import create_synthetic_dicom, convert_dicom_to_png
+from app.services.findings_index import FindingsIndex
+
+client = TestClient(create_app())
+
+
+def _results(*findings):
+    return {
+        "predictions": [
+            {"class": name, "confidence": confidence, "x": 10 + 20 * index, "y": 20, "width": 5, "height": 6}
+            for index, (name, confidence) in enumerate(findings)
+        ],
+        "image": {"width": 100, "height": 80}
+    }
+
+
+def test_query_filters_sorts_and_pages(tmp_path):
+    index = FindingsIndex(tmp_path / "findings.sqlite3")
+    index.index_results("study-a", _results(("caries", 0.9), ("caries", 0.4), ("filling", 0.7)), detected_at=100)
+    index.index_results("study-b", _results(("caries", 0.8)), detected_at=200)
+
+    page = index.query(classes=["caries"], min_confidence=0.5)
+    assert page["total"] == 2
+    assert [(f["file_id"], f["confidence"]) for f in page["findings"]] == [("study-a", 0.9), ("study-b", 0.8)]
+
+    page = index.query(sort="detected_at", descending=False, limit=2, offset=2)
+    assert page["total"] == 4
+    assert [f["file_id"] for f in page["findings"]] == ["study-a", "study-b"]
+
+    assert index.query(since=150)["total"] == 1
+    assert index.query(file_id="study-a", max_confidence=0.5)["findings"][0]["confidence"] == 0.4
+
+    # Re-detection replaces the findings of a study
+    index.index_results("study-a", _results(("filling", 0.6)))
+    summary = index.summary()
+    assert summary["indexed_studies"] == 2
+    assert [(c["class"], c["findings"], c["studies"]) for c in summary["classes"]] == [("caries", 1, 1), ("filling", 1, 1)]
+
+
+def test_overlapping_duplicates_are_counted_once(tmp_path):
+    index = FindingsIndex(tmp_path / "findings.sqlite3")
+    results = _results(("caries", 0.9), ("caries", 0.5))
+    # Same box as the first caries, as fetched without upstream NMS
+    results["predictions"].append(dict(results["predictions"][0], confidence=0.85))
+    results["predictions"].append(dict(results["predictions"][0], **{"class": "filling", "confidence": 0.7}))
+
+    assert index.index_results("study-a", results) == 3
+    summary = index.summary(min_confidence=0.3)
+    assert {c["class"]: c["findings"] for c in summary["classes"]} == {"caries": 2, "filling": 1}
+    assert [f["confidence"] for f in index.query(classes=["caries"])["findings"]] == [0.9, 0.5]
+
+
+def test_older_index_is_cleared_for_rebuild(tmp_path):
+    index = FindingsIndex(tmp_path / "findings.sqlite3")
+    index.index_results("study-a", _results(("caries", 0.9)))
+    index._connection().execute("PRAGMA user_version = 1")
+
+    reopened = FindingsIndex(tmp_path / "findings.sqlite3")
+    assert not reopened.is_indexed("study-a")
+    assert reopened.query()["total"] == 0
+
+
+def test_rebuild_indexes_only_missing_studies(tmp_path):
+    from app.utils.serialization import encode_json_artifact
+
+    directory = tmp_path / "processed"
+    directory.mkdir()
+    (directory / "old-study_detection.json").write_bytes(encode_json_artifact(_results(("caries", 0.9))))
+    (directory / "old-study.png").write_bytes(b"")
+    index = FindingsIndex(tmp_path / "findings.sqlite3")
+
+    assert index.rebuild_from_storage(directory) == 1
+    assert index.rebuild_from_storage(directory) == 0
+    assert index.query()["findings"][0]["file_id"] == "old-study"
+
+
+def test_detect_updates_index_and_endpoints(tmp_path, isolated_storage):
+    create_synthetic_dicom(tmp_path / "study.dcm", rows=64, columns=64)
+    png_path = convert_dicom_to_png(str(tmp_path / "study.dcm"), "findings-test-study")
+    upstream = _results(("caries", 0.92), ("periapical lesion", 0.55))
+
+    with patch("app.services.roboflow_service.call_roboflow_api", return_value=upstream):
+        detect("findings-test-study", png_path, force=True)
+
+    response = client.get("/api/v1/findings", params={"class": "caries", "min_confidence": 90})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 1
+    assert body["findings"][0]["file_id"] == "findings-test-study"
+
+    response = client.get("/api/v1/findings/summary")
+    assert {c["class"]: c["findings"] for c in response.json()["classes"]} == {"caries": 1, "periapical lesion": 1}
+
+    # Like /detect, findings below ROBOFLOW_CONFIDENCE are left out unless asked for
+    upstream = _results(("caries", 0.92), ("periapical lesion", 0.1))
+    save_detection_results("findings-test-study", upstream)
+    assert client.get("/api/v1/findings").json()["total"] == 1
+    assert client.get("/api/v1/findings", params={"min_confidence": 5}).json()["total"] == 2
+
+    # Saving results again replaces the old findings
+    save_detection_results("findings-test-study", _results())
+    assert client.get("/api/v1/findings").json()["total"] == 0
+
+    assert client.get("/api/v1/findings", params={"sort": "x"}).status_code == 422
+    assert client.get("/api/v1/findings", params={"min_confidence": 150}).status_code == 422
@@ -0,0 +1,63 @@
+import json
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from app.services import roboflow_service
+from loadtest.run import evaluate_slos, parse_mix, percentile, summarize
+from loadtest.stubs import StubConfig, StubServer
+
+
+@pytest.fixture
+def stub():
+    server = StubServer(StubConfig(latency_ms=0)).start()
+    yield server
+    server.stop()
+
+
+def test_percentiles_and_slo_checks():
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(list(range(1, 101)), 99) == 99
+
+    samples = [("image", 200, 0.01)] * 98 + [("image", 503, 0.002), ("detect", 500, 2.0)]
+    summary = summarize(samples, duration=10)
+    assert summary["overall"]["throughput_rps"] == 10
+    assert summary["image"]["rejected_rate"] == 0.0101
+    assert summary["detect"]["error_rate"] == 1.0
+
+    checks = evaluate_slos(summary, {
+        "image": {"p99_ms": 50, "max_rejected_rate": 0.05},
+        "detect": {"max_error_rate": 0.01},
+        "report": {"p99_ms": 1}
+    })
+    assert [(c["endpoint"], c["metric"], c["passed"]) for c in checks] == [
+        ("image", "p99_ms", True), ("image", "max_rejected_rate", True), ("detect", "max_error_rate", False)
+    ]
+
+    with pytest.raises(ValueError):
+        parse_mix("upload=1,download=2")
+
+
+def test_roboflow_client_talks_to_stub(stub, tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"not really a png")
+    with patch.object(roboflow_service, "ROBOFLOW_API_URL", stub.url), \
+            patch.object(roboflow_service, "ROBOFLOW_API_KEY", "loadtest"):
+        result = roboflow_service.call_roboflow_api(str(image))
+    assert "predictions" in result
+    assert stub.config.counts["ok"] == 1
+
+
+def test_stub_throttles_and_fails_on_request():
+    server = StubServer(StubConfig(latency_ms=0, rate_limit=1, error_rate=0)).start()
+    try:
+        statuses = [requests.post(f"{server.url}/v1/chat/completions", data=json.dumps({"model": "m"})).status_code
+                    for _ in range(3)]
+        assert statuses[0] == 200
+        assert 429 in statuses[1:]
+
+        server.config = StubConfig(latency_ms=0, error_rate=1.0)
+        assert requests.post(f"{server.url}/adr/6").status_code == 500
+    finally:
+        server.stop()
@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+
+from app.core.app_factory import create_app
+from app.utils.metrics import Counter, Histogram, observe_stage, STAGE_DURATION
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_duration_seconds", "Test", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+
+    lines = histogram.render()
+
+    assert 'test_duration_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_duration_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_duration_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_duration_seconds_count{stage="a"} 3' in lines
+
+
+def test_counter_labels():
+    counter = Counter("test_total", "Test", ["upstream"])
+    counter.inc(upstream="roboflow")
+    counter.inc(2, upstream="roboflow")
+    assert counter.value(upstream="roboflow") == 3
+    assert 'test_total{upstream="roboflow"} 3' in counter.render()
+
+
+def test_metrics_endpoint_reports_stages_and_requests():
+    """
+    /metrics exposes stage histograms and per-route request latency
+    """
+    with observe_stage("dicom_parse"):
+        pass
+    assert STAGE_DURATION.count(stage="dicom_parse") >= 1
+
+    client = TestClient(create_app())
+    client.get("/api/v1/health")
+    body = client.get("/metrics").text
+
+    assert 'dental_stage_duration_seconds_count{stage="dicom_parse"}' in body
+    assert 'route="/api/v1/health"' in body
+    assert "dental_http_requests_in_flight" in body
+    assert "dental_artifact_cache_hit_ratio" in body
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+from app.services import detection_service
+from app.services import storage_manager as storage_module
+from app.services.artifact_cache import ArtifactCache, DETECTION
+from app.services.shared_cache import SharedCache
+from app.services.storage_manager import StorageManager
+from app.utils import locks as locks_module
+from app.utils.locks import file_lock
+from app.utils.metrics import Counter, Gauge, Registry
+
+
+def test_shared_cache_is_visible_across_instances_and_bounded(tmp_path):
+    """
+    Entries written by one worker are served to another, within the size limit
+    """
+    path = tmp_path / "shared.sqlite3"
+    writer = SharedCache(path, max_bytes=250)
+    reader = SharedCache(path, max_bytes=250)
+
+    writer.put("a:png", b"a" * 100)
+    writer.put("b:png", b"b" * 100)
+    assert reader.get("a:png") == b"a" * 100
+
+    writer.put("c:png", b"c" * 100)
+    assert writer.get_stats()["bytes"] <= 250
+    assert reader.get("c:png") == b"c" * 100
+
+
+def test_artifact_cache_falls_back_to_shared_tier(tmp_path):
+    shared = SharedCache(tmp_path / "shared.sqlite3")
+    first = ArtifactCache(shared=shared)
+    second = ArtifactCache(shared=shared)
+    first.put("file", DETECTION, {"predictions": []}, 20)
+
+    loaded = second.get_or_load("file", DETECTION, lambda: None)
+
+    assert loaded == {"predictions": []}
+
+
+def test_registry_merges_worker_snapshots(tmp_path):
+    registry = Registry(tmp_path)
+    counter = registry.register(Counter("test_jobs_total", "Test"))
+    registry.register(Gauge("test_in_flight", "Test"))
+    counter.inc(2)
+    # Snapshot of another (live) worker
+    (tmp_path / "1.json").write_text(
+        '{"pid": 1, "metrics": {"test_jobs_total": [[[], 3.0]], "test_in_flight": [[[], 4.0]]}}'
+    )
+
+    body = registry.render()
+
+    assert "test_jobs_total 5" in body
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_sweeper_leader_replays_journal_from_other_workers(tmp_path, monkeypatch):
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    monkeypatch.setattr(storage_module, "PROCESSED_DIR", processed)
+    monkeypatch.setattr(storage_module, "_PROCESSED_ROOT", processed.resolve())
+    journal = tmp_path / "journal.log"
+
+    follower = StorageManager(journal_path=journal)
+    leader = StorageManager(journal_path=journal)
+    leader._leader_lock = object()
+
+    png = processed / "a.png"
+    png.write_bytes(b"x" * 100)
+    follower.record_write(png)
+    assert leader._replay_journal() == 1
+    assert leader.get_stats()["usage_by_category"]["png"] == 100
+
+    follower.record_delete(png)
+    leader._replay_journal()
+    assert leader.get_stats()["usage_by_category"]["png"] == 0
+
+
+def test_concurrent_detections_call_upstream_once(tmp_path, monkeypatch):
+    """
+    Requests racing on the same image share one upstream call
+    """
+    saved = {}
+    calls = []
+
+    def call_roboflow_api(image_path):
+        calls.append(image_path)
+        time.sleep(0.1)
+        return {"predictions": []}
+
+    def save(file_id, results):
+        saved[file_id] = results
+
+    monkeypatch.setattr(detection_service.roboflow_service, "call_roboflow_api", call_roboflow_api)
+    monkeypatch.setattr(detection_service, "load_detection_results", lambda file_id: saved.get(file_id))
+    monkeypatch.setattr(detection_service, "save_detection_results", save)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(detection_service.detect("race", tmp_path / "race.png")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False, True, True, True]
+
+
+def test_file_lock_is_exclusive_and_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(locks_module, "LOCKS_DIR", tmp_path / "locks")
+    holders = []
+    overlaps = []
+
+    def work(index):
+        for _ in range(20):
+            with file_lock(f"convert-{index % 2}"):
+                holders.append(index % 2)
+                if holders.count(index % 2) > 1:
+                    overlaps.append(index)
+                time.sleep(0.001)
+                holders.remove(index % 2)
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+    assert list((tmp_path / "locks").iterdir()) == []
@@ -0,0 +1,108 @@
+import io
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.core.app_factory import create_app
+from app.services.artifact_cache import artifact_cache
+from app.services.dicom_service import convert_dicom_to_png, create_synthetic_dicom, source_keys
+from app.services.render_service import build_lut, window_values
+from app.services.storage_backend import get_storage, upload_key, processed_key
+
+client = TestClient(create_app())
+
+
+@pytest.fixture
+def converted():
+    """
+    A converted 12-bit synthetic image (pixel values 0..4095, row-major ramp)
+    """
+    file_id = str(uuid.uuid4())
+    storage = get_storage()
+    dicom_key = upload_key(f"{file_id}.dcm")
+    create_synthetic_dicom(storage.local_path(dicom_key), rows=64, columns=64)
+    convert_dicom_to_png(str(storage.local_path(dicom_key)), file_id)
+    yield file_id
+    artifact_cache.invalidate(file_id)
+    for key in (dicom_key, processed_key(f"{file_id}.png"), *source_keys(file_id)):
+        storage.delete(key)
+
+
+def _pixels(response):
+    return np.asarray(Image.open(io.BytesIO(response.content)))
+
+
+def test_lut_matches_direct_windowing():
+    values = np.arange(-32768, 32768, 37, dtype=np.int16)
+    lut = build_lut("int16", 1.0, -1024.0, 400.0, 1500.0, False)
+    assert np.array_equal(lut[values.view(np.uint16)], window_values(values * 1.0 - 1024, 400.0, 1500.0))
+
+    inverted = build_lut("uint16", 1.0, 0.0, 2048.0, 4096.0, True)
+    assert inverted[0] == 255 and inverted[4095] == 0
+    assert build_lut("uint16", 1.0, 0.0, 2048.0, 4096.0, True) is inverted
+
+
+def test_render_applies_window_and_size(converted):
+    response = client.get(f"/api/v1/image/{converted}/render", params={"wc": 1000, "ww": 200})
+    assert response.status_code == 200
+    assert response.headers["x-window-center"] == "1000"
+    pixels = _pixels(response).ravel()
+    source = np.arange(64 * 64) % 4096
+    assert (pixels[source < 900] == 0).all() and (pixels[source > 1100] == 255).all()
+
+    response = client.get(f"/api/v1/image/{converted}/render", params={"preset": "full", "size": 32})
+    assert _pixels(response).shape == (32, 32)
+    assert float(response.headers["x-window-width"]) == 4095
+
+    assert client.get(f"/api/v1/image/{converted}/render", params={"wc": 1000}).status_code == 400
+    assert client.get(f"/api/v1/image/{uuid.uuid4()}/render").status_code == 404
+
+
+def test_renders_are_cached_and_survive_eviction(converted):
+    url = f"/api/v1/image/{converted}/render"
+    first = client.get(url, params={"preset": "contrast"})
+    hits = artifact_cache.get_stats()["hits"]
+    assert client.get(url, params={"preset": "contrast"}).content == first.content
+    assert artifact_cache.get_stats()["hits"] == hits + 1
+
+    # Evicted pixels are regenerated from the DICOM
+    artifact_cache.invalidate(converted)
+    for key in source_keys(converted):
+        get_storage().delete(key)
+    assert client.get(url, params={"preset": "contrast"}).content == first.content
+    assert get_storage().exists(source_keys(converted)[0])
+
+
+def test_crop_cuts_findings_from_full_resolution_pixels(converted):
+    # The model saw the image at twice its size
+    results = {
+        "image": {"width": 128, "height": 128},
+        "predictions": [
+            {"class": "caries", "confidence": 0.9, "x": 64, "y": 64, "width": 32, "height": 16},
+            {"class": "calculus", "confidence": 0.1, "x": 10, "y": 10, "width": 8, "height": 8}
+        ]
+    }
+    url = f"/api/v1/image/{converted}/crop/0"
+    with patch("app.api.endpoints.load_detection_results", return_value=results):
+        exact = client.get(url, params={"padding": 0, "size": 16, "wc": 2048, "ww": 4096})
+        padded = client.get(url, params={"padding": 0.25, "size": 48})
+        hits = artifact_cache.get_stats()["hits"]
+        assert client.get(url, params={"padding": 0.25, "size": 48}).content == padded.content
+        assert artifact_cache.get_stats()["hits"] == hits + 1
+        # The low-confidence finding is filtered out, as in /detect
+        assert client.get(f"/api/v1/image/{converted}/crop/1").status_code == 404
+
+    assert exact.headers["x-crop-box"] == "24,28,40,36"
+    source = (np.arange(64 * 64) % 4096).reshape(64, 64)[28:36, 24:40]
+    assert np.array_equal(_pixels(exact), window_values(source.astype(np.float64), 2048, 4096))
+
+    assert padded.headers["x-crop-box"] == "20,26,44,38"
+    assert _pixels(padded).shape == (24, 48)
+
+
+def test_crop_needs_detection_results(converted):
+    assert client.get(f"/api/v1/image/{converted}/crop/0").status_code == 404
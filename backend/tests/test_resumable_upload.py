@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.app_factory import create_app
+from app.api import uploads
+from app.services import resumable_upload
+from app.services.dicom_service import create_synthetic_dicom
+
+client = TestClient(create_app())
+
+BASE = "/api/v1/uploads/"
+PATCH_HEADERS = {"Tus-Resumable": "1.0.0", "Content-Type": "application/offset+octet-stream"}
+
+
+@pytest.fixture(autouse=True)
+def session_dir(tmp_path, monkeypatch, isolated_storage):
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_DIR", tmp_path / "partial")
+    return tmp_path / "partial"
+
+
+def _metadata(filename):
+    return f"filename {base64.b64encode(filename.encode()).decode()}"
+
+
+def _create(length, filename="scan.dcm"):
+    response = client.post(BASE, headers={"Upload-Length": str(length), "Upload-Metadata": _metadata(filename)})
+    return response
+
+
+def _patch(location, offset, data, checksum=None):
+    headers = dict(PATCH_HEADERS, **{"Upload-Offset": str(offset)})
+    if checksum is not None:
+        headers["Upload-Checksum"] = checksum
+    return client.patch(location, content=data, headers=headers)
+
+
+def _sha256(data):
+    return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def _dicom_bytes(tmp_path):
+    path = tmp_path / "source.dcm"
+    create_synthetic_dicom(path, rows=48, columns=48)
+    return path.read_bytes()
+
+
+def test_out_of_order_chunks_resume_and_convert(tmp_path):
+    data = _dicom_bytes(tmp_path)
+    response = _create(len(data))
+    assert response.status_code == 201
+    location = response.headers["Location"]
+
+    third = len(data) // 3
+    chunks = [(0, data[:third]), (2 * third, data[2 * third:]), (third, data[third:2 * third])]
+
+    # Last chunk first: acknowledged, but the contiguous offset stays at 0
+    offset, chunk = chunks[1]
+    assert _patch(location, offset, chunk, _sha256(chunk)).status_code == 204
+    status = client.head(location)
+    assert status.headers["Upload-Offset"] == "0"
+    assert status.headers["Upload-Ranges"] == f"{2 * third}-{len(data) - 1}"
+
+    offset, chunk = chunks[0]
+    assert _patch(location, offset, chunk, _sha256(chunk)).status_code == 204
+    assert client.head(location).headers["Upload-Offset"] == str(third)
+
+    offset, chunk = chunks[2]
+    response = _patch(location, offset, chunk, _sha256(chunk))
+    assert response.status_code == 200
+    file_id = response.json()["file_id"]
+    assert location.endswith(file_id)
+    assert client.get(f"/api/v1/image/{file_id}").status_code == 200
+
+    # A retried final chunk is rejected rather than re-converted
+    assert _patch(location, offset, chunk).status_code == 409
+
+
+def test_completed_upload_prerenders_presets(tmp_path, monkeypatch):
+    prerendered = []
+    monkeypatch.setattr(uploads, "prerender_presets", prerendered.append)
+    data = _dicom_bytes(tmp_path)
+    location = _create(len(data)).headers["Location"]
+
+    response = _patch(location, 0, data)
+    assert response.status_code == 200
+    assert prerendered == [response.json()["file_id"]]
+
+
+def test_checksum_mismatch_is_not_acknowledged(tmp_path):
+    data = _dicom_bytes(tmp_path)
+    location = _create(len(data)).headers["Location"]
+
+    response = _patch(location, 0, data[:1000], _sha256(b"something else"))
+    assert response.status_code == 460
+    assert client.head(location).headers["Upload-Offset"] == "0"
+
+    assert _patch(location, 0, data[:1000], "crc32 AAAA").status_code == 400
+
+
+def test_non_dicom_is_rejected_after_first_chunk():
+    location = _create(4096).headers["Location"]
+
+    response = _patch(location, 0, b"x" * 1024)
+    assert response.status_code == 400
+    assert "Invalid DICOM" in response.json()["detail"]
+    assert client.head(location).status_code == 404
+
+
+def test_creation_limits_and_termination(monkeypatch):
+    assert _create(100, "notes.txt").status_code == 400
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_MAX_BYTES", 1000)
+    assert _create(1001).status_code == 413
+
+    location = _create(500).headers["Location"]
+    assert _patch(location, 400, b"y" * 200).status_code == 413
+    assert client.delete(location).status_code == 204
+    assert client.head(location).status_code == 404
+    assert client.head(BASE + "not-a-uuid").status_code == 404
+
+
+def test_unfinished_sessions_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_MAX_RESERVED_BYTES", 1500)
+    first = _create(1000).headers["Location"]
+    response = _create(1000)
+    assert response.status_code == 507
+    assert _create(500).status_code == 201
+
+    # Finished and terminated sessions no longer count
+    assert client.delete(first).status_code == 204
+    data = _dicom_bytes(tmp_path)
+    monkeypatch.setattr(resumable_upload, "RESUMABLE_UPLOAD_MAX_RESERVED_BYTES", len(data) + 500)
+    location = _create(len(data)).headers["Location"]
+    assert _patch(location, 0, data).status_code == 200
+    assert _create(len(data)).status_code == 201
+
+
+def test_expired_sessions_are_removed(session_dir):
+    state = resumable_upload.create_upload(100, "scan.dcm")
+    assert (session_dir / f"{state['id']}.part").exists()
+
+    assert resumable_upload.expire_uploads(now=time.time()) == 0
+    assert resumable_upload.expire_uploads(now=state["expires"] + 1) == 1
+    assert list(session_dir.iterdir()) == []
+
+
+def test_merge_range():
+    ranges = resumable_upload.merge_range([], 10, 20)
+    ranges = resumable_upload.merge_range(ranges, 0, 5)
+    assert ranges == [[0, 5], [10, 20]]
+    assert resumable_upload.merge_range(ranges, 5, 10) == [[0, 20]]
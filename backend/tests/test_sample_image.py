@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.services import dicom_service
+from app.services.dicom_service import create_sample_image, render_sample_image
+
+# The loop-based generator took seconds; the vectorized one must stay in milliseconds
+RENDER_BUDGET_SECONDS = 0.05
+CACHED_BUDGET_SECONDS = 0.01
+
+
+def test_render_is_deterministic_and_parameterizable():
+    image = render_sample_image(seed=7)
+    assert image.shape == (600, 800)
+    assert image.dtype == np.uint8
+    assert np.array_equal(image, render_sample_image(seed=7))
+
+    small = render_sample_image(width=200, height=100, teeth=4)
+    assert small.shape == (100, 200)
+    # Brightest at the centre of the radial gradient, dark in the corners
+    assert small[0, 0] < small[50, 100]
+
+
+def test_render_runs_in_milliseconds():
+    render_sample_image()
+    timings = []
+    for seed in range(5):
+        started = time.perf_counter()
+        render_sample_image(seed=seed)
+        timings.append(time.perf_counter() - started)
+    assert min(timings) < RENDER_BUDGET_SECONDS
+
+
+def test_fallback_output_is_memoized(tmp_path):
+    dicom_service._encode_sample_image.cache_clear()
+    create_sample_image("unused.dcm", tmp_path / "first.png")
+
+    started = time.perf_counter()
+    create_sample_image("unused.dcm", tmp_path / "second.png")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < CACHED_BUDGET_SECONDS
+    assert (tmp_path / "first.png").read_bytes() == (tmp_path / "second.png").read_bytes()
+    assert Image.open(tmp_path / "second.png").size == (800, 600)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.scheduler import (
+    PrioritySemaphore, current_priority, priority, set_priority, BATCH, BULK, INTERACTIVE
+)
+from app.utils.metrics import render_metrics
+
+
+def _queue_in_order(semaphore, priorities, order):
+    """
+    Start one waiter per priority, in order, while the only slot is taken;
+    each appends its name to order once it gets the slot
+    """
+    def work(name, level):
+        with semaphore.slot(level):
+            order.append(name)
+
+    threads = []
+    for name, level in priorities:
+        queued = sum(semaphore.queue_depths().values())
+        thread = threading.Thread(target=work, args=(name, level))
+        thread.start()
+        threads.append(thread)
+        # Wait until the waiter is queued, so arrival order is deterministic
+        deadline = time.monotonic() + 5
+        while sum(semaphore.queue_depths().values()) <= queued and time.monotonic() < deadline:
+            time.sleep(0.005)
+    return threads
+
+
+def test_interactive_work_goes_first():
+    semaphore = PrioritySemaphore("test", slots=1, aging_seconds=0)
+    semaphore.acquire(BULK)
+    order = []
+    threads = _queue_in_order(
+        semaphore, [("bulk-1", BULK), ("batch", BATCH), ("bulk-2", BULK), ("chair", INTERACTIVE)], order
+    )
+    assert semaphore.queue_depths() == {INTERACTIVE: 1, BATCH: 1, BULK: 2}
+    assert "dental_scheduler_queue_depth" in render_metrics()
+
+    semaphore.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["chair", "batch", "bulk-1", "bulk-2"]
+
+
+def test_aging_prevents_starvation():
+    semaphore = PrioritySemaphore("test", slots=1, aging_seconds=0.1)
+    semaphore.acquire(INTERACTIVE)
+    order = []
+    threads = _queue_in_order(semaphore, [("bulk", BULK)], order)
+    # Waited more than two aging periods: now ahead of fresh interactive work
+    time.sleep(0.25)
+    threads += _queue_in_order(semaphore, [("chair", INTERACTIVE)], order)
+
+    semaphore.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["bulk", "chair"]
+
+
+def test_priority_is_carried_into_threadpool():
+    async def request():
+        set_priority(BATCH)
+        return await run_in_threadpool(current_priority)
+
+    assert asyncio.run(request()) == BATCH
+    assert current_priority() == INTERACTIVE
+    with priority(BULK):
+        assert current_priority() == BULK
+    assert current_priority() == INTERACTIVE
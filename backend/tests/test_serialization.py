@@ -0,0 +1,62 @@
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+from app.services import report_service
+from app.services import storage_backend as backend_module
+from app.utils import serialization
+from app.utils.compression import CompressionMiddleware, negotiate_encoding
+
+
+def test_large_artifacts_are_stored_compressed(tmp_path, monkeypatch):
+    """
+    Artifacts above the threshold are gzip-compressed on disk and read back transparently
+    """
+    monkeypatch.setattr(serialization, "JSON_ARTIFACT_COMPRESS_MIN_BYTES", 100)
+    monkeypatch.setattr(backend_module, "LOCAL_ROOTS", {"uploads": tmp_path, "processed": tmp_path})
+
+    report_service.save_report("small", "No findings.", "digest")
+    report_service.save_report("large", "Caries on 36. " * 50, "digest")
+
+    assert (tmp_path / "small_report.json").read_bytes()[:1] == b"{"
+    assert (tmp_path / "large_report.json").read_bytes()[:2] == serialization.GZIP_MAGIC
+    assert report_service.load_report("small")["report"] == "No findings."
+    assert report_service.load_report("large") == {"report": "Caries on 36. " * 50, "findings_digest": "digest"}
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+def test_compresses_large_json_responses_only():
+    """
+    JSON bodies above the minimum size are compressed, images are not
+    """
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/large")
+    async def large():
+        return {"items": ["finding"] * 200}
+
+    @app.get("/small")
+    async def small():
+        return {"items": []}
+
+    @app.get("/image")
+    async def image():
+        return Response(content=b"\x89PNG" + b"0" * 2000, media_type="image/png")
+
+    client = TestClient(app)
+    headers = {"Accept-Encoding": "gzip"}
+
+    response = client.get("/large", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()["items"]) == 200
+
+    assert "content-encoding" not in client.get("/small", headers=headers).headers
+    assert "content-encoding" not in client.get("/image", headers=headers).headers
@@ -0,0 +1,97 @@
+import io
+import random
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.core.app_factory import create_app
+from app.services import detection_service
+from app.services.detection_service import detect, find_near_duplicates
+from app.services.dicom_service import convert_dicom_to_png, create_synthetic_dicom, render_sample_image
+from app.services.similarity_index import BKTree, SimilarityIndex
+from app.utils.perceptual_hash import dhash, phash, hamming_distance, max_distance
+
+client = TestClient(create_app())
+
+
+def _recompressed(pixels):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=60)
+    return np.asarray(Image.open(io.BytesIO(buffer.getvalue())))
+
+
+@pytest.mark.parametrize("hash_function", [dhash, phash])
+def test_hashes_survive_windowing_and_recompression(hash_function):
+    original = render_sample_image(400, 300, seed=1)
+    # Contrast/brightness change (different windowing), then lossy re-export
+    rewindowed = np.clip(original.astype(np.float64) * 0.8 + 20, 0, 255).astype(np.uint8)
+    variants = [rewindowed, _recompressed(original), original[:, :, None].repeat(3, axis=2)]
+    # An unrelated image: brightness falling off to the right and bottom
+    ramp = np.linspace(255, 0, 400)[None, :] * np.linspace(1, 0.2, 300)[:, None]
+    other = (ramp + np.random.default_rng(0).normal(0, 10, ramp.shape)).clip(0, 255).astype(np.uint8)
+
+    reference = hash_function(original)
+    for variant in variants:
+        assert hamming_distance(reference, hash_function(variant)) <= max_distance(0.9)
+    assert hamming_distance(reference, hash_function(other)) > max_distance(0.9)
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(3)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, str(index))
+
+    probe = values[17] ^ 0b1011
+    expected = sorted(
+        (hamming_distance(probe, value), value, str(index))
+        for index, value in enumerate(values) if hamming_distance(probe, value) <= 12
+    )
+    assert tree.query(probe, 12) == expected
+
+
+def test_index_log_is_shared_between_workers(tmp_path):
+    path = tmp_path / "index.log"
+    first, second = SimilarityIndex(path), SimilarityIndex(path)
+
+    first.add("a", 0xFF)
+    second.add("b", 0xFE)
+    assert [match["file_id"] for match in first.find_similar(0xFF, 2)] == ["a", "b"]
+
+    # A reconverted image is only found under its latest hash
+    first.add("a", 0xFF << 40)
+    assert [match["file_id"] for match in second.find_similar(0xFF, 2)] == ["b"]
+
+
+def test_near_duplicate_reuses_detection(tmp_path, isolated_storage, monkeypatch):
+    monkeypatch.setattr(detection_service, "DUPLICATE_REUSE_RESULTS", True)
+    # Same pixels, different headers (new SOP instance UIDs)
+    for name in ("original", "reexport"):
+        create_synthetic_dicom(tmp_path / f"{name}.dcm", rows=96, columns=96)
+    ids = ["phash-test-original", "phash-test-reexport"]
+    png_paths = [convert_dicom_to_png(str(tmp_path / f"{name}.dcm"), file_id)
+                 for name, file_id in zip(("original", "reexport"), ids)]
+
+    assert find_near_duplicates(ids[1])[0]["file_id"] == ids[0]
+    response = client.get(f"/api/v1/similar/{ids[1]}")
+    assert response.status_code == 200
+    assert response.json()["matches"][0]["similarity"] == 1.0
+
+    upstream = {
+        "predictions": [{"class": "caries", "confidence": 0.9, "x": 48, "y": 48, "width": 10, "height": 10}],
+        "image": {"width": 96, "height": 96}
+    }
+    with patch("app.services.roboflow_service.call_roboflow_api", return_value=upstream) as mock_api:
+        detect(ids[0], png_paths[0], force=True)
+        results, cached = detect(ids[1], png_paths[1], force=False)
+
+    assert mock_api.call_count == 1
+    assert cached
+    assert results["reused_from"]["file_id"] == ids[0]
+    assert results["predictions"][0]["x"] == 48
+
+    assert client.get("/api/v1/similar/unknown-file").status_code == 404
@@ -0,0 +1,136 @@
+import threading
+import time
+import uuid
+
+from app.services import detection_service, speculation
+from app.services.scheduler import PrioritySemaphore, priority, BATCH
+from app.services.speculation import Speculator
+from app.utils.metrics import REQUESTS_IN_FLIGHT
+
+
+def _blocking_detect(monkeypatch):
+    """
+    Replace detection with a call that blocks until released
+    """
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def detect(file_id, png_path):
+        calls.append(file_id)
+        started.set()
+        release.wait(5)
+        return {"predictions": []}, False
+
+    monkeypatch.setattr(speculation, "detect", detect)
+    return release, started, calls
+
+
+def test_detect_call_joins_running_task(monkeypatch):
+    release, started, calls = _blocking_detect(monkeypatch)
+    speculator = Speculator(enabled=True, max_concurrency=1)
+
+    assert speculator.submit("a", "a.png")
+    assert started.wait(5)
+    future = speculator.join("a")
+    assert future is not None
+
+    release.set()
+    future.result(timeout=5)
+    assert calls == ["a"]
+
+
+def test_budget_queues_extra_work_and_join_preempts_it(monkeypatch):
+    release, started, calls = _blocking_detect(monkeypatch)
+    speculator = Speculator(enabled=True, max_concurrency=1)
+
+    speculator.submit("a", "a.png")
+    assert started.wait(5)
+    speculator.submit("b", "b.png")
+    assert speculator.queue_depth() == 1
+
+    # The client asked for "b" before it started: it is dropped from the queue
+    assert speculator.join("b") is None
+    assert speculator.queue_depth() == 0
+
+    release.set()
+    speculator.join("a").result(timeout=5)
+    assert calls == ["a"]
+
+
+def test_speculation_is_shed_under_load(monkeypatch):
+    release, _, calls = _blocking_detect(monkeypatch)
+    release.set()
+    speculator = Speculator(enabled=True, max_in_flight_requests=0)
+
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        assert not speculator.submit("a", "a.png")
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+    assert calls == []
+
+
+def test_cancel_drops_queued_tasks(monkeypatch):
+    release, started, calls = _blocking_detect(monkeypatch)
+    speculator = Speculator(enabled=True, max_concurrency=1)
+
+    speculator.submit("a", "a.png")
+    assert started.wait(5)
+    speculator.submit("b", "b.png")
+    speculator.submit("c", "c.png")
+
+    assert speculator.cancel() == 3
+    release.set()
+    speculator._executor.shutdown(wait=True)
+    assert calls == ["a"]
+    assert speculator.get_stats()["queued"] == 0
+
+
+def test_disabled_by_default():
+    assert not Speculator(enabled=False).submit("a", "a.png")
+
+
+def test_interactive_detect_is_not_stuck_behind_queued_speculation(monkeypatch):
+    slots = PrioritySemaphore("test-upstream", slots=1, aging_seconds=0)
+    saved, calls = {}, []
+    monkeypatch.setattr(detection_service, "upstream_slots", slots)
+    monkeypatch.setattr(detection_service, "load_detection_results", saved.get)
+    monkeypatch.setattr(detection_service, "save_detection_results", saved.__setitem__)
+
+    def call_roboflow_api(png_path):
+        calls.append(threading.current_thread().name)
+        return {"predictions": []}
+
+    monkeypatch.setattr(detection_service.roboflow_service, "call_roboflow_api", call_roboflow_api)
+    file_id = f"inversion-{uuid.uuid4()}"
+
+    def speculative():
+        with priority(BATCH):
+            detection_service.detect(file_id, "a.png")
+
+    def interactive():
+        detection_service.detect(file_id, "a.png")
+
+    def wait_for_queue(depth):
+        deadline = time.monotonic() + 2
+        while sum(slots.queue_depths().values()) < depth and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return sum(slots.queue_depths().values()) >= depth
+
+    # Every upstream slot is busy: the speculative detection queues for one
+    slots.acquire()
+    threads = [threading.Thread(target=speculative, name="speculative", daemon=True)]
+    threads[0].start()
+    assert wait_for_queue(1)
+    threads.append(threading.Thread(target=interactive, name="interactive", daemon=True))
+    threads[1].start()
+    # Queued for the slot too, rather than blocked on a lock the speculative detection holds
+    queued = wait_for_queue(2)
+
+    slots.release()
+    for thread in threads:
+        thread.join(5)
+    assert queued
+    # The interactive request called the model; the speculative one reused its result
+    assert calls == ["interactive"]
@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.utils.lazy import lazy_import, is_loaded
+from app.utils.startup import render_placeholder_image, PLACEHOLDER_ASSET
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Generous bound on importing the app in a fresh interpreter; the heavy
+# dependencies alone used to take about a second
+COLD_IMPORT_BUDGET_SECONDS = 2.5
+
+HEAVY_MODULES = ["pydicom", "numpy", "PIL", "openai", "requests"]
+
+COLD_START_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def test_cold_import_skips_heavy_dependencies():
+    """
+    Importing the app must not load the DICOM/imaging/upstream libraries
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["loaded"] == []
+    assert result["seconds"] < COLD_IMPORT_BUDGET_SECONDS
+
+
+def test_lazy_import_loads_on_first_use():
+    module = lazy_import("colorsys")
+    assert not is_loaded(module)
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0)[0] == 0.0
+    assert is_loaded(module)
+
+
+def test_bundled_placeholder_matches_renderer(tmp_path):
+    rendered = tmp_path / "placeholder.png"
+    render_placeholder_image(rendered)
+
+    assert np.array_equal(np.array(Image.open(rendered)), np.array(Image.open(PLACEHOLDER_ASSET)))
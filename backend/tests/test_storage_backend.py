@@ -0,0 +1,73 @@
+import pytest
+
+from app.services import storage_backend as backend_module
+from app.services.storage_backend import LocalStorageBackend, upload_key, processed_key
+
+
+@pytest.fixture
+def local_roots(tmp_path, monkeypatch):
+    """
+    Point the working copies at temporary directories
+    """
+    roots = {"uploads": tmp_path / "uploads", "processed": tmp_path / "processed"}
+    for directory in roots.values():
+        directory.mkdir()
+    monkeypatch.setattr(backend_module, "LOCAL_ROOTS", roots)
+    return roots
+
+
+def test_local_backend_stores_files_in_place(local_roots):
+    """
+    The local backend's working copy is the stored file
+    """
+    storage = LocalStorageBackend()
+    key = upload_key("study.dcm")
+
+    storage.local_path(key).write_bytes(b"dicom")
+    storage.publish(key)
+
+    assert storage.exists(key)
+    assert storage.fetch(key) == local_roots["uploads"] / "study.dcm"
+
+    storage.delete(key)
+    assert not storage.exists(key)
+    assert storage.fetch(key) is None
+
+
+def test_keys_cannot_escape_the_storage_roots(local_roots):
+    storage = LocalStorageBackend()
+    with pytest.raises(ValueError):
+        storage.local_path("uploads/../secret")
+    with pytest.raises(ValueError):
+        storage.local_path("other/file.png")
+
+
+def test_s3_backend_read_through_cache(local_roots):
+    """
+    The S3 backend publishes working copies and re-fetches evicted ones
+    """
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="artifacts")
+        storage = backend_module.S3StorageBackend(bucket="artifacts", prefix="dental", client=client)
+
+        key = processed_key("study.png")
+        local_copy = storage.local_path(key)
+        local_copy.write_bytes(b"png bytes")
+        storage.publish(key)
+
+        # Simulate eviction of the local copy by the quota manager
+        local_copy.unlink()
+        assert storage.exists(key)
+        assert storage.fetch(key) == local_copy
+        assert local_copy.read_bytes() == b"png bytes"
+
+        body = client.get_object(Bucket="artifacts", Key="dental/processed/study.png")["Body"].read()
+        assert body == b"png bytes"
+
+        storage.delete(key)
+        assert not storage.exists(key)
+        assert storage.fetch(key) is None
@@ -0,0 +1,92 @@
+import os
+import time
+import pytest
+
+from app.services import storage_manager as storage_module
+from app.services.storage_manager import StorageManager
+
+
+@pytest.fixture
+def storage_dirs(tmp_path, monkeypatch):
+    """
+    Point the storage manager at temporary uploads/processed directories
+    """
+    uploads = tmp_path / "uploads"
+    processed = tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    monkeypatch.setattr(storage_module, "UPLOADS_DIR", uploads)
+    monkeypatch.setattr(storage_module, "PROCESSED_DIR", processed)
+    monkeypatch.setattr(storage_module, "_UPLOADS_ROOT", uploads.resolve())
+    monkeypatch.setattr(storage_module, "_PROCESSED_ROOT", processed.resolve())
+    return uploads, processed
+
+
+def _write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_evicts_derived_artifacts_before_uploads(storage_dirs):
+    """
+    Variants and PNGs go before raw uploads, least recently accessed first
+    """
+    uploads, processed = storage_dirs
+    manager = StorageManager(quota_bytes=300, low_watermark=0.7, upload_ttl_seconds=0)
+
+    upload = _write(uploads / "a.dcm", 100)
+    old_png = _write(processed / "a.png", 100)
+    new_png = _write(processed / "b.png", 100)
+    variant = _write(processed / "a_variant_bone.png", 100)
+    for path in (upload, old_png, new_png, variant):
+        manager.record_write(path)
+    manager.record_access(new_png)
+
+    freed = manager.sweep()
+
+    assert freed == 200
+    assert not variant.exists()
+    assert not old_png.exists()
+    assert new_png.exists()
+    assert upload.exists()
+    stats = manager.get_stats()
+    assert stats["usage_bytes"] == 200
+    assert stats["evicted_files"]["variant"] == 1
+    assert stats["evicted_files"]["png"] == 1
+
+
+def test_uploads_are_kept_until_ttl_expires(storage_dirs):
+    """
+    Raw uploads younger than the TTL survive even when over quota
+    """
+    uploads, _ = storage_dirs
+    manager = StorageManager(quota_bytes=100, low_watermark=0.5, upload_ttl_seconds=3600)
+
+    upload = _write(uploads / "a.dcm", 200)
+    manager.record_write(upload)
+    manager.sweep()
+    assert upload.exists()
+
+    manager.upload_ttl_seconds = 0
+    manager.sweep()
+    assert not upload.exists()
+
+
+def test_scan_indexes_existing_files_and_removes_empty_leftovers(storage_dirs, monkeypatch):
+    """
+    The startup scan picks up existing files and zero-byte leftovers are removed
+    """
+    uploads, processed = storage_dirs
+    _write(uploads / "a.dcm", 50)
+    empty = _write(processed / "failed.png", 0)
+    old = time.time() - 3600
+    os.utime(empty, (old, old))
+
+    manager = StorageManager(quota_bytes=10 ** 6)
+    manager.scan()
+    assert manager.total_usage() == 50
+
+    manager.sweep()
+    assert not empty.exists()
+    assert manager.get_stats()["empty_files_removed"] == 1
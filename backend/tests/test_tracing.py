@@ -0,0 +1,81 @@
+import os
+import time
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from app.core import config
+from app.core.app_factory import create_app
+from app.utils.profiler import SamplingProfiler, prune_profiles
+from app.utils.tracing import Trace
+
+
+def test_server_timing_sums_spans_by_name():
+    trace = Trace("abc", "GET /")
+    trace.add("encode", trace.started, 0.002)
+    trace.add("encode", trace.started, 0.003)
+    trace.add("dicom_parse", trace.started, 0.001)
+
+    header = trace.server_timing(0.010)
+
+    assert "encode;dur=5.000" in header
+    assert "dicom_parse;dur=1.000" in header
+    assert header.endswith("total;dur=10.000")
+
+
+def test_responses_carry_server_timing_and_request_id():
+    client = TestClient(create_app())
+    response = client.get("/api/v1/health", headers={"X-Request-ID": "req-1"})
+
+    assert response.headers["x-request-id"] == "req-1"
+    assert "total;dur=" in response.headers["server-timing"]
+
+
+def test_sampling_profiler_collects_folded_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    deadline = time.time() + 0.05
+    while time.time() < deadline:
+        sum(range(1000))
+    profiler.stop()
+
+    folded = profiler.folded()
+    assert profiler.sample_count > 0
+    assert "test_sampling_profiler_collects_folded_stacks" in folded
+    stack, count = folded.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+
+
+def test_profiling_requires_admin_token(tmp_path):
+    """
+    Admin profiling is refused without a token and works with one
+    """
+    client = TestClient(create_app())
+    assert client.post("/api/v1/admin/profile?seconds=0.01").status_code == 403
+
+    with patch.object(config, "ADMIN_TOKEN", "secret"), \
+            patch("app.utils.profiler.PROFILE_DIR", tmp_path):
+        response = client.post(
+            "/api/v1/admin/profile?seconds=0.05&interval=0.005",
+            headers={"X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+        assert (tmp_path / f"{profile_id}.folded").exists()
+
+        response = client.get("/api/v1/health", headers={"X-Admin-Token": "secret", "X-Profile": "1"})
+        assert (tmp_path / f"{response.headers['x-profile-id']}.folded").exists()
+
+
+def test_old_profiles_are_pruned(tmp_path):
+    now = time.time()
+    for index in range(5):
+        path = tmp_path / f"profile-{index}.folded"
+        path.write_text("main 1\n")
+        os.utime(path, (now - index, now - index))
+    stale = tmp_path / "stale.folded"
+    stale.write_text("main 1\n")
+    os.utime(stale, (now - 3600, now - 3600))
+
+    with patch("app.utils.profiler.PROFILE_DIR", tmp_path):
+        assert prune_profiles(max_files=3, max_age_seconds=600) == 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["profile-0.folded", "profile-1.folded", "profile-2.folded"]
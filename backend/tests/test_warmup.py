@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+from app.core.app_factory import create_app
+from app.services import warmup
+from app.services.warmup import Readiness
+
+client = TestClient(create_app())
+
+
+def test_ready_reports_503_until_warmup_finishes(monkeypatch):
+    monkeypatch.setattr(warmup, "readiness", Readiness())
+    monkeypatch.setattr("app.api.endpoints.readiness", warmup.readiness)
+
+    response = client.get("/api/v1/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "starting"
+
+    warmup.run_warmup(include_upstreams=False)
+
+    response = client.get("/api/v1/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "ready"
+    assert body["steps"]["decoders"]["status"] == "ok"
+    assert body["steps"]["synthetic_conversion"]["status"] == "ok"
+
+
+def test_failed_step_does_not_block_readiness(monkeypatch):
+    monkeypatch.setattr(warmup, "readiness", Readiness())
+
+    def unreachable():
+        raise ConnectionError("upstream unreachable")
+
+    monkeypatch.setattr(warmup, "warmup_steps", lambda include_upstreams: [("roboflow_connection", unreachable)])
+
+    status = warmup.run_warmup()
+
+    assert status["status"] == "ready"
+    assert status["steps"]["roboflow_connection"]["status"] == "failed"